@@ -1,5 +1,5 @@
 import streamlit as st
-from supabase import create_client
+from modules.database import get_db, iniciar_execucao
 
 # Importação das Views (Telas)
 import views.dashboard as dashboard
@@ -244,6 +244,9 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# Cada rerun começa com o memo de leituras vazio
+iniciar_execucao()
+
 # --- 3. SISTEMA DE LOGIN ---
 if "password_correct" not in st.session_state: 
     st.session_state["password_correct"] = False
@@ -271,9 +274,7 @@ def check_password():
         
         if st.button("ACESSAR", use_container_width=True, type="primary"):
             try:
-                url = st.secrets["SUPABASE_URL"]
-                key = st.secrets["SUPABASE_KEY"]
-                supabase = create_client(url, key)
+                supabase = get_db()
                 
                 res = supabase.table("users").select("*").eq("username", user).eq("password", pwd).execute()
                 
@@ -383,6 +384,20 @@ if check_password():
             st.rerun()
         st.markdown('</div>', unsafe_allow_html=True)
 
+        # Tráfego de dados da sessão (só admin)
+        if role == 'admin':
+            from modules.database import get_db_stats, get_envio_stats, get_prefetch_stats
+            db_stats = get_db_stats()
+            if db_stats:
+                with st.expander("📡 Tráfego de Dados"):
+                    for tabela, s in db_stats.items():
+                        st.caption(f"**{tabela}**: {s['consultas']} consultas · {s['linhas']:,} linhas · {s['bytes']/1024:,.1f} KB · {s['ms']:,.0f} ms (máx {s['max_ms']:,.0f})")
+                    for n_contas, s in sorted(get_envio_stats().items()):
+                        st.caption(f"**Gravação {n_contas} conta(s)**: {s['envios']} envios · média {s['ms']/s['envios']:,.0f} ms (máx {s['max_ms']:,.0f})")
+                    prefetch = get_prefetch_stats()
+                    if prefetch:
+                        st.caption(f"**Prefetch dashboard**: caminho crítico {prefetch['critico_ms']:,.0f} ms · soma {prefetch['soma_ms']:,.0f} ms")
+
     # --- ROTEAMENTO DE PÁGINAS ---
     pagina_atual = st.session_state.get("menu_selected", "Dashboard")
         
@@ -412,3 +427,12 @@ if check_password():
     
     else:
         st.error(f"Página não encontrada: '{pagina_atual}'")
+
+    # Leituras repetidas neste rerun que não foram à rede (só admin)
+    if role == 'admin':
+        from modules.database import get_duplicadas_evitadas
+        duplicadas = get_duplicadas_evitadas()
+        if duplicadas:
+            with st.sidebar.expander(f"♻️ Leituras Duplicadas Evitadas ({sum(n for _, _, n in duplicadas)})"):
+                for tabela, consulta, n in duplicadas:
+                    st.caption(f"**{tabela}** ×{n}: `{consulta}`")
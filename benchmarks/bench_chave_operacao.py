@@ -0,0 +1,80 @@
+"""
+Chave de operação: DataFrame.apply por linha (implementação antiga das telas)
+contra OperationGrouping.build_keys (vetorizada).
+
+Confere que as duas chaves são idênticas registro a registro e que o groupby
+resultante é o mesmo, e mede o tempo de cada uma. Resultado em JSON.
+
+Uso:
+    python benchmarks/bench_chave_operacao.py
+    python benchmarks/bench_chave_operacao.py --tamanhos 1000 100000 --saida resultado.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import pandas as pd
+
+from modules.logic import OperationGrouping
+from modules.database import tipar
+from benchmarks.gerar_historico import gerar
+
+TAMANHOS = [1_000, 10_000, 100_000, 1_000_000]
+
+def criar_chave_operacao(row):
+    """Referência: a função por linha que dashboard.show e historico.show usavam"""
+    if 'operacao_id' in row.index and pd.notna(row.get('operacao_id')):
+        return str(row['operacao_id'])
+    created = row.get('created_at', '')
+    if pd.notna(created):
+        minuto = str(created)[:16]
+    else:
+        minuto = str(row.get('data', ''))
+    return f"{row['data']}_{row['ativo']}_{row['resultado']}_{row.get('grupo_vinculo', '')}_{minuto}"
+
+def _cronometrar(funcao):
+    t0 = time.perf_counter()
+    resultado = funcao()
+    return resultado, (time.perf_counter() - t0) * 1000
+
+def comparar(df):
+    antiga, ms_apply = _cronometrar(lambda: df.apply(criar_chave_operacao, axis=1))
+    nova, ms_vetor = _cronometrar(lambda: OperationGrouping.build_keys(df))
+    iguais = antiga.astype(object).equals(nova)
+    mesmos_grupos = df.groupby(antiga).ngroups == df.groupby(nova).ngroups
+    return {
+        "linhas": len(df),
+        "operacoes": int(nova.nunique()),
+        "apply_ms": round(ms_apply, 1),
+        "vetorizado_ms": round(ms_vetor, 1),
+        "ganho": round(ms_apply / ms_vetor, 1) if ms_vetor > 0 else None,
+        "chaves_identicas": bool(iguais),
+        "mesmos_grupos": bool(mesmos_grupos),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da chave de operação (apply x vetorizado)")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS)
+    parser.add_argument("--antigos", type=float, default=0.3, help="fração de operações sem operacao_id")
+    parser.add_argument("--saida", default=None)
+    args = parser.parse_args()
+
+    resultados = []
+    for n in args.tamanhos:
+        df = tipar("trades", pd.DataFrame(gerar(n, fracao_antigos=args.antigos)["trades"]))
+        r = {"tamanho": n, **comparar(df)}
+        resultados.append(r)
+        print(f"{n:>10,} linhas  apply {r['apply_ms']:>10,.0f} ms  vetorizado {r['vetorizado_ms']:>8,.0f} ms  "
+              f"x{r['ganho']}  idênticas={r['chaves_identicas']}")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"resultados": resultados}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
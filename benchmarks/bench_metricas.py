@@ -0,0 +1,75 @@
+"""
+Cálculo do dashboard sem Streamlit: DashboardMetrics.compute direto sobre os
+DataFrames tipados, separado da renderização.
+
+Mede a montagem do índice e do rollup (o que a tela pega do cache) e o
+compute por filtro (período padrão de 30 dias, histórico todo, um grupo,
+uma conta). Resultado em JSON.
+
+Uso:
+    python benchmarks/bench_metricas.py
+    python benchmarks/bench_metricas.py --tamanhos 10000 100000 --saida metricas.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import pandas as pd
+
+from modules.analytics import PnLIndex, DailyRollup
+from modules.metrics import DashboardMetrics
+from modules.database import tipar
+from benchmarks.gerar_historico import gerar
+
+TAMANHOS = [1_000, 10_000, 100_000, 1_000_000]
+
+def _cronometrar(funcao):
+    t0 = time.perf_counter()
+    resultado = funcao()
+    return resultado, (time.perf_counter() - t0) * 1000
+
+def medir(df_trades, df_contas):
+    indice, ms_indice = _cronometrar(lambda: PnLIndex.build(df_trades))
+    rollup, ms_rollup = _cronometrar(lambda: DailyRollup.build(df_trades))
+    grupo = df_contas['grupo_nome'].iloc[0]
+    conta = df_contas[df_contas['grupo_nome'] == grupo]['conta_identificador'].iloc[0]
+    filtros = {
+        "30_dias": dict(d_inicio=date.today() - timedelta(days=30), d_fim=date.today()),
+        "historico": dict(),
+        "grupo": dict(d_inicio=date.today() - timedelta(days=30), d_fim=date.today(), grupo=grupo),
+        "conta": dict(d_inicio=date.today() - timedelta(days=30), d_fim=date.today(), grupo=grupo, conta=conta),
+    }
+    compute = {}
+    for nome, f in filtros.items():
+        r, ms = _cronometrar(lambda: DashboardMetrics.compute(df_trades, df_contas, indice=indice, rollup=rollup, **f))
+        compute[nome] = {"ms": round(ms, 1), "operacoes": r['desempenho']['total_operacoes']}
+    return {"indice_ms": round(ms_indice, 1), "rollup_ms": round(ms_rollup, 1), "compute": compute}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do cálculo do dashboard (sem Streamlit)")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS)
+    parser.add_argument("--saida", default=None)
+    args = parser.parse_args()
+
+    resultados = []
+    for n in args.tamanhos:
+        dados = gerar(n)
+        df_trades = tipar("trades", pd.DataFrame(dados["trades"])).sort_values('created_at').reset_index(drop=True)
+        df_contas = tipar("contas_config", pd.DataFrame(dados["contas_config"]))
+        r = {"tamanho": n, **medir(df_trades, df_contas)}
+        resultados.append(r)
+        detalhe = " · ".join(f"{k} {v['ms']:,.0f}" for k, v in r["compute"].items())
+        print(f"{n:>10,} linhas  índice {r['indice_ms']:>8,.0f} ms  rollup {r['rollup_ms']:>7,.0f} ms  compute [{detalhe}] ms")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"resultados": resultados}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark de ponta a ponta das telas com histórico sintético (backend offline).
+
+Para cada tamanho, semeia um OfflineClient e roda cada tela pelo AppTest do
+Streamlit: uma execução fria (caches vazios, como o primeiro acesso) e uma
+quente (rerun, como uma troca de filtro). As telas marcam as próprias etapas
+com modules.perf.Cronometro (carga, métricas, cards, gráficos) e o resultado
+sai em JSON para comparar regressões entre versões.
+
+Uso:
+    python benchmarks/bench_paginas.py
+    python benchmarks/bench_paginas.py --tamanhos 1000 10000 --paginas dashboard contas_monitor
+    python benchmarks/bench_paginas.py --saida benchmarks/resultados/base.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ["APEX_OFFLINE"] = "1"
+os.environ["APEX_CACHE_LOCAL"] = "0"
+
+import pandas as pd
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from modules import offline
+from benchmarks.gerar_historico import gerar
+
+# 1M fica de fora do padrão (as telas passam de minutos); peça com --tamanhos 1000000
+TAMANHOS = [1_000, 10_000, 100_000]
+
+# Tela -> módulo da view (o monitor é a aba 5 de contas.show)
+PAGINAS = {
+    "dashboard": "views.dashboard",
+    "historico": "views.historico",
+    "contas_monitor": "views.contas",
+}
+
+SCRIPT = """
+import sys
+sys.path.insert(0, {raiz!r})
+import importlib
+from modules.database import iniciar_execucao
+iniciar_execucao()
+importlib.import_module({modulo!r}).show({usuario!r}, "admin")
+"""
+
+def _medir(at):
+    t0 = time.perf_counter()
+    at.run()
+    total = (time.perf_counter() - t0) * 1000
+    estado = at.session_state
+    etapas = estado["perf_etapas"] if "perf_etapas" in estado else {}
+    stats = estado["db_stats"] if "db_stats" in estado else {}
+    return {
+        "total_ms": round(total, 1),
+        "etapas": {p: {e: round(ms, 1) for e, ms in t.items()} for p, t in etapas.items()},
+        "consultas": sum(s["consultas"] for s in stats.values()),
+        "linhas": sum(s["linhas"] for s in stats.values()),
+        "erro": [e.message for e in at.exception] or None,
+    }
+
+def rodar_pagina(cliente, usuario, pagina, timeout):
+    """Execução fria e quente de uma tela; devolve as duas medições"""
+    st.cache_data.clear()
+    at = AppTest.from_string(SCRIPT.format(raiz=RAIZ, modulo=PAGINAS[pagina], usuario=usuario), default_timeout=timeout)
+    at.session_state["supabase"] = cliente
+    at.session_state["logged_user"] = usuario
+    fria = _medir(at)
+    quente = _medir(at)
+    return fria, quente
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark das telas com histórico sintético")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS)
+    parser.add_argument("--paginas", nargs="+", choices=list(PAGINAS), default=list(PAGINAS))
+    parser.add_argument("--contas", type=int, default=5, help="contas por grupo")
+    parser.add_argument("--timeout", type=float, default=3600, help="segundos por execução de tela")
+    parser.add_argument("--saida", default=os.path.join(RAIZ, "benchmarks", "resultados",
+                                                         f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"))
+    args = parser.parse_args()
+
+    relatorio = {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "ambiente": {"python": platform.python_version(), "pandas": pd.__version__,
+                     "streamlit": st.__version__, "maquina": platform.machine()},
+        "resultados": [],
+    }
+
+    for n in args.tamanhos:
+        usuario = f"bench{n}"
+        t0 = time.perf_counter()
+        cliente = offline.OfflineClient(pasta_storage=os.path.join(RAIZ, ".cache", "offline", "storage"))
+        for tabela, linhas in gerar(n, contas_por_grupo=args.contas, usuario=usuario).items():
+            cliente.carregar(tabela, linhas)
+        print(f"\n== {n:,} trades (seed em {time.perf_counter() - t0:.1f}s)")
+
+        for pagina in args.paginas:
+            try:
+                fria, quente = rodar_pagina(cliente, usuario, pagina, args.timeout)
+            except Exception as e:
+                fria = quente = {"total_ms": None, "etapas": {}, "consultas": 0, "linhas": 0, "erro": [str(e)]}
+            for execucao, medida in (("fria", fria), ("quente", quente)):
+                relatorio["resultados"].append({"tamanho": n, "pagina": pagina, "execucao": execucao, **medida})
+                etapas = medida["etapas"].get(pagina, {})
+                detalhe = " · ".join(f"{e} {ms:,.0f}" for e, ms in etapas.items())
+                total = f"{medida['total_ms']:,.0f} ms" if medida["total_ms"] is not None else "falhou"
+                print(f"  {pagina:<15} {execucao:<6} {total:>12}  [{detalhe}]" + (f"  ERRO: {medida['erro'][0]}" if medida["erro"] else ""))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.saida)), exist_ok=True)
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados em {args.saida}")
+
+if __name__ == "__main__":
+    main()
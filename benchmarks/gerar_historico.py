@@ -0,0 +1,131 @@
+"""
+Gerador de histórico sintético para os benchmarks (backend offline).
+
+Gera o que as telas leem: grupos e contas, trades replicados por operação
+(um registro por conta do grupo, mesmo operacao_id), registros antigos sem
+operacao_id/conta_id, parciais, ajustes manuais, metas, check-ins e stops.
+As datas terminam hoje, então os filtros padrão das telas pegam dados.
+
+Uso:
+    python benchmarks/gerar_historico.py 10000 --saida seed.json
+    (o arquivo serve de OFFLINE_SEED para abrir o app offline)
+"""
+import sys
+import json
+import uuid
+import random
+import argparse
+from datetime import date, datetime, timedelta, timezone
+
+ATIVOS = {"MNQ": 2, "NQ": 20, "MES": 5, "ES": 50}
+CONTEXTOS = ["Contexto A", "Contexto B", "Contexto C", "Rompimento", "Pullback"]
+COMPORTAMENTOS = ["Normal", "Normal", "Normal", "Ansioso", "Vingativo"]
+OPERACOES_POR_DIA = 8
+
+def gerar(n_trades, n_grupos=2, contas_por_grupo=5, fracao_antigos=0.1, usuario="bench", seed=42):
+    """
+    Monta as tabelas do usuário com `n_trades` registros na tabela trades.
+
+    Returns:
+        dict: {tabela: [linhas]} pronto para OfflineClient.carregar / OFFLINE_SEED
+    """
+    rng = random.Random(seed)
+
+    grupos, contas = [], []
+    for g in range(n_grupos):
+        nome = f"GRUPO {g + 1}"
+        grupos.append({"id": g + 1, "usuario": usuario, "nome": nome})
+        for c in range(contas_por_grupo):
+            contas.append({
+                "id": len(contas) + 1, "usuario": usuario, "grupo_nome": nome,
+                "conta_identificador": f"APEX-{len(contas) + 1:04d}",
+                "saldo_inicial": 150000.0, "pico_previo": 150000.0,
+                "fase_entrada": "Fase 1", "status_conta": "Ativa",
+            })
+    contas_grupo = {g["nome"]: [c["id"] for c in contas if c["grupo_nome"] == g["nome"]] for g in grupos}
+
+    # Operações espalhadas de trás para frente até agora
+    media_por_op = fracao_antigos + (1 - fracao_antigos) * contas_por_grupo
+    n_ops = max(1, int(n_trades / media_por_op) + 1)
+    hoje = date.today()
+    inicio = hoje - timedelta(days=n_ops // OPERACOES_POR_DIA)
+    passo = timedelta(days=1) / OPERACOES_POR_DIA
+
+    trades = []
+    for i in range(n_ops):
+        if len(trades) >= n_trades: break
+        momento = datetime.combine(inicio, datetime.min.time(), tzinfo=timezone.utc) + passo * i
+        grupo = rng.choice(grupos)["nome"]
+        ativo = rng.choice(list(ATIVOS))
+        lote = rng.randint(1, 10)
+        stop = rng.choice([10.0, 15.0, 20.0, 25.0])
+        if rng.random() < 0.55:
+            pts = round(rng.uniform(5, 60) * 4) / 4
+            parciais = [{"pts": pts, "qtd": lote}] if lote < 2 else [{"pts": pts / 2, "qtd": lote // 2}, {"pts": pts, "qtd": lote - lote // 2}]
+        else:
+            parciais = [{"pts": -stop, "qtd": lote}]
+        resultado = sum(p["pts"] * ATIVOS[ativo] * p["qtd"] for p in parciais)
+        base = {
+            "usuario": usuario, "data": momento.date().isoformat(), "ativo": ativo,
+            "direcao": rng.choice(["Compra", "Venda"]), "contexto": rng.choice(CONTEXTOS),
+            "comportamento": rng.choice(COMPORTAMENTOS), "lote": lote, "resultado": resultado,
+            "pts_medio": sum(p["pts"] * p["qtd"] for p in parciais) / lote, "grupo_vinculo": grupo,
+            "prints": "", "risco_fin": stop * ATIVOS[ativo] * lote, "stop_pts": stop,
+            "parciais": parciais, "observacoes": "",
+        }
+        if rng.random() < fracao_antigos:
+            # Registro antigo: um só, sem conta nem operação
+            trades.append({**base, "id": str(uuid.UUID(int=rng.getrandbits(128))), "conta_id": None,
+                           "operacao_id": None, "created_at": momento.isoformat()})
+            continue
+        operacao_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        for k, conta_id in enumerate(contas_grupo[grupo]):
+            trades.append({**base, "id": str(uuid.UUID(int=rng.getrandbits(128))), "conta_id": conta_id,
+                           "operacao_id": operacao_id,
+                           "created_at": (momento + timedelta(milliseconds=k)).isoformat()})
+    trades = trades[:n_trades]
+
+    # O último registro fica em agora (e nenhum no futuro): a marca d'água do sync
+    # incremental não pode ficar à frente de um trade inserido durante a sessão
+    agora = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(seconds=1)
+    if trades:
+        ajuste = agora - max(datetime.fromisoformat(t["created_at"]) for t in trades)
+        for t in trades:
+            momento = datetime.fromisoformat(t["created_at"]) + ajuste
+            t["created_at"] = momento.isoformat()
+            t["data"] = momento.date().isoformat()
+
+    dias = sorted({t["data"] for t in trades})
+    ajustes = [{
+        "id": str(uuid.UUID(int=rng.getrandbits(128))), "usuario": usuario,
+        "conta_id": rng.choice(contas)["id"], "tipo": rng.choice(["Taxa", "Slippage", "Correção"]),
+        "valor": round(rng.uniform(-50, 20), 2), "descricao": "sintético",
+        "created_at": min(datetime.fromisoformat(f"{d}T23:00:00+00:00"), agora).isoformat(),
+    } for d in dias[::5]]
+    checkins = [{
+        "usuario": usuario, "data": d, "sono": rng.randint(4, 10), "ansiedade": rng.randint(1, 8),
+        "clareza": rng.randint(4, 10), "fez_respiracao": True, "leu_regras": True, "quer_recuperar": False,
+        "score_geral": 7.0, "liberado_operar": True, "ignorou_recomendacao": False, "observacoes": "",
+    } for d in dias[-60:]]
+
+    return {
+        "grupos_config": grupos,
+        "contas_config": contas,
+        "trades": trades,
+        "ajustes_manuais": ajustes,
+        "metas_config": [{"usuario": usuario, "grupo_nome": g["nome"], "meta_semanal": 1500.0, "bloquear_ao_bater": False} for g in grupos],
+        "checkin_diario": checkins,
+        "stops_dia": [{"usuario": usuario, "data": hoje.isoformat(), "stops_count": 0, "stops_consecutivos": 0}],
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera histórico sintético (JSON de seed do backend offline)")
+    parser.add_argument("n_trades", type=int)
+    parser.add_argument("--contas", type=int, default=5, help="contas por grupo")
+    parser.add_argument("--grupos", type=int, default=2)
+    parser.add_argument("--usuario", default="bench")
+    parser.add_argument("--saida", default="-")
+    args = parser.parse_args()
+    dados = gerar(args.n_trades, args.grupos, args.contas, usuario=args.usuario)
+    destino = sys.stdout if args.saida == "-" else open(args.saida, "w", encoding="utf-8")
+    json.dump(dados, destino, ensure_ascii=False)
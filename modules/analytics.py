@@ -0,0 +1,953 @@
+import math
+import numpy as np
+import pandas as pd
+
+# Métricas de desempenho acumuláveis.
+# O MetricsAccumulator guarda só contagens, somas, soma dos quadrados e a curva
+# de equity resumida (saldo, pico, vale, pior queda). Cada operação nova entra
+# em O(1), dois acumuladores se juntam com merge() e o estado vai e volta de
+# um dict JSON, então um resumo salvo pode ser estendido só com os trades novos.
+
+class MetricsAccumulator:
+    """
+    Acumulador das métricas dos cards do dashboard, por OPERAÇÃO.
+
+    Cada operação entra com o resultado de UMA conta (`resultado`) e o total
+    dos registros dela em todas as contas (`liquido`, que soma no Resultado
+    Líquido). A pior queda segue a ordem de entrada: alimente em ordem
+    cronológica, e merge(outro) assume que `outro` vem depois.
+    """
+
+    CAMPOS = ("n_ops", "n_registros", "liquido", "n_wins", "n_losses", "soma_wins", "soma_losses",
+              "soma", "soma_quadrados", "n_pts_win", "soma_pts_win", "n_pts_loss", "soma_pts_loss",
+              "n_lote", "soma_lote", "saldo", "pico", "vale", "max_dd", "ultimo_ativo")
+
+    def __init__(self):
+        self.n_ops = 0
+        self.n_registros = 0
+        self.liquido = 0.0
+        self.n_wins = 0
+        self.n_losses = 0
+        self.soma_wins = 0.0
+        self.soma_losses = 0.0      # negativo (soma dos resultados < 0)
+        self.soma = 0.0
+        self.soma_quadrados = 0.0
+        self.n_pts_win = 0
+        self.soma_pts_win = 0.0
+        self.n_pts_loss = 0
+        self.soma_pts_loss = 0.0
+        self.n_lote = 0
+        self.soma_lote = 0.0
+        # Curva de equity das operações: saldo final, maior e menor saldo e pior
+        # queda (saldo - pico anterior); pico/vale só valem com n_ops > 0
+        self.saldo = 0.0
+        self.pico = 0.0
+        self.vale = 0.0
+        self.max_dd = 0.0
+        self.ultimo_ativo = None
+
+    def add(self, resultado, pts_medio=None, lote=None, ativo=None, liquido=None, registros=1):
+        """
+        Inclui uma operação.
+
+        Args:
+            resultado: Resultado da operação em UMA conta
+            pts_medio: Pontos médios (None/NaN = não conta na média)
+            lote: Contratos (None/NaN = não conta na média)
+            ativo: Ativo operado (o último vira a referência de risco)
+            liquido: Soma dos registros da operação em todas as contas (padrão: resultado)
+            registros: Número de registros (contas) da operação
+        """
+        resultado = float(resultado)
+        self.n_ops += 1
+        self.n_registros += int(registros)
+        self.liquido += resultado if liquido is None else float(liquido)
+        self.soma += resultado
+        self.soma_quadrados += resultado * resultado
+
+        tem_pts = pts_medio is not None and not pd.isna(pts_medio)
+        if resultado > 0:
+            self.n_wins += 1
+            self.soma_wins += resultado
+            if tem_pts:
+                self.n_pts_win += 1
+                self.soma_pts_win += float(pts_medio)
+        elif resultado < 0:
+            self.n_losses += 1
+            self.soma_losses += resultado
+            if tem_pts:
+                self.n_pts_loss += 1
+                self.soma_pts_loss += float(pts_medio)
+
+        if lote is not None and not pd.isna(lote):
+            self.n_lote += 1
+            self.soma_lote += float(lote)
+        if ativo is not None and not pd.isna(ativo):
+            self.ultimo_ativo = ativo
+
+        self.saldo += resultado
+        if self.n_ops == 1:
+            self.pico = self.vale = self.saldo
+        else:
+            self.pico = max(self.pico, self.saldo)
+            self.vale = min(self.vale, self.saldo)
+        self.max_dd = min(self.max_dd, self.saldo - self.pico)
+        return self
+
+    def merge(self, outro):
+        """
+        Junta `outro` (operações posteriores) a este acumulador.
+
+        Contagens e somas valem em qualquer ordem; a pior queda só é exata se
+        `outro` vier depois cronologicamente (ex: resumo salvo + trades novos).
+        """
+        if outro.n_ops == 0:
+            return self
+        if self.n_ops == 0:
+            self.__dict__.update(outro.to_dict())
+            return self
+
+        # Queda que cruza a junção: pico daqui até o vale de lá
+        dd_juncao = (self.saldo + outro.vale) - self.pico
+        self.max_dd = min(self.max_dd, outro.max_dd, dd_juncao)
+        self.pico = max(self.pico, self.saldo + outro.pico)
+        self.vale = min(self.vale, self.saldo + outro.vale)
+        self.saldo += outro.saldo
+
+        for campo in ("n_ops", "n_registros", "liquido", "n_wins", "n_losses", "soma_wins", "soma_losses",
+                      "soma", "soma_quadrados", "n_pts_win", "soma_pts_win", "n_pts_loss", "soma_pts_loss",
+                      "n_lote", "soma_lote"):
+            setattr(self, campo, getattr(self, campo) + getattr(outro, campo))
+        if outro.ultimo_ativo is not None:
+            self.ultimo_ativo = outro.ultimo_ativo
+        return self
+
+    def extend(self, operacoes):
+        """Inclui um DataFrame de operações novas (posteriores às já acumuladas)"""
+        return self.merge(MetricsAccumulator.from_operations(operacoes))
+
+    @staticmethod
+    def from_operations(operacoes):
+        """
+        Monta o acumulador de um DataFrame de operações de uma vez (vetorizado).
+
+        Args:
+            operacoes: Uma linha por operação, em ordem cronológica, com resultado
+                e opcionalmente pts_medio, lote, ativo, liquido e registros
+
+        Returns:
+            MetricsAccumulator: Mesmo estado de chamar add() linha a linha
+        """
+        acc = MetricsAccumulator()
+        if operacoes is None or operacoes.empty:
+            return acc
+
+        def coluna(nome):
+            if nome not in operacoes.columns:
+                return np.full(len(operacoes), np.nan)
+            return pd.to_numeric(operacoes[nome], errors='coerce').to_numpy(dtype=float)
+
+        res = coluna('resultado')
+        pts = coluna('pts_medio')
+        lote = coluna('lote')
+        ganho, perda = res > 0, res < 0
+
+        acc.n_ops = len(res)
+        acc.n_registros = int(coluna('registros').sum()) if 'registros' in operacoes.columns else acc.n_ops
+        acc.liquido = float(coluna('liquido').sum()) if 'liquido' in operacoes.columns else float(res.sum())
+        acc.n_wins, acc.n_losses = int(ganho.sum()), int(perda.sum())
+        acc.soma_wins, acc.soma_losses = float(res[ganho].sum()), float(res[perda].sum())
+        acc.soma, acc.soma_quadrados = float(res.sum()), float((res * res).sum())
+        acc.n_pts_win = int((ganho & ~np.isnan(pts)).sum())
+        acc.soma_pts_win = float(np.nansum(pts[ganho]))
+        acc.n_pts_loss = int((perda & ~np.isnan(pts)).sum())
+        acc.soma_pts_loss = float(np.nansum(pts[perda]))
+        acc.n_lote = int((~np.isnan(lote)).sum())
+        acc.soma_lote = float(np.nansum(lote))
+
+        equity = np.cumsum(res)
+        picos = np.maximum.accumulate(equity)
+        acc.saldo = float(equity[-1])
+        acc.pico, acc.vale = float(picos[-1]), float(equity.min())
+        acc.max_dd = min(0.0, float((equity - picos).min()))
+
+        if 'ativo' in operacoes.columns:
+            ativos = operacoes['ativo'].dropna()
+            if not ativos.empty:
+                acc.ultimo_ativo = ativos.iloc[-1]
+        return acc
+
+    def to_dict(self):
+        """Estado serializável (JSON)"""
+        estado = {campo: getattr(self, campo) for campo in self.CAMPOS}
+        if estado["ultimo_ativo"] is not None:
+            estado["ultimo_ativo"] = str(estado["ultimo_ativo"])
+        return estado
+
+    @staticmethod
+    def from_dict(estado):
+        """Reconstrói o acumulador de to_dict()"""
+        acc = MetricsAccumulator()
+        for campo in MetricsAccumulator.CAMPOS:
+            if campo in estado:
+                setattr(acc, campo, estado[campo])
+        return acc
+
+    def summary(self):
+        """
+        Métricas prontas para os cards.
+
+        Returns:
+            dict: net_profit, gross_profit, gross_loss, pf, win_rate, total_operacoes,
+            n_wins, n_losses, avg_win, avg_loss, payoff, expectancy, avg_pts_gain,
+            avg_pts_loss, lote_medio, max_dd, desvio, ativo_ref
+        """
+        n = self.n_ops
+        gross_profit = self.soma_wins
+        gross_loss = abs(self.soma_losses)
+        win_rate = (self.n_wins / n * 100) if n > 0 else 0.0
+        avg_win = self.soma_wins / self.n_wins if self.n_wins else 0.0
+        avg_loss = abs(self.soma_losses / self.n_losses) if self.n_losses else 0.0
+        payoff = avg_win / avg_loss if avg_loss > 0 else 0.0
+        media = self.soma / n if n else 0.0
+        variancia = (self.soma_quadrados - n * media * media) / (n - 1) if n > 1 else 0.0
+        return {
+            "net_profit": self.liquido,
+            "gross_profit": gross_profit,
+            "gross_loss": gross_loss,
+            "pf": (gross_profit / gross_loss if gross_loss > 0 else 99.99) if n else 0.0,
+            "win_rate": win_rate,
+            "total_operacoes": n,
+            "n_wins": self.n_wins,
+            "n_losses": self.n_losses,
+            "avg_win": avg_win,
+            "avg_loss": avg_loss,
+            "payoff": payoff,
+            "expectancy": ((win_rate / 100) * avg_win) - ((1 - (win_rate / 100)) * avg_loss) if n else 0.0,
+            "avg_pts_gain": self.soma_pts_win / self.n_pts_win if self.n_pts_win else 0.0,
+            "avg_pts_loss": abs(self.soma_pts_loss / self.n_pts_loss) if self.n_pts_loss else 0.0,
+            "lote_medio": self.soma_lote / self.n_lote if self.n_lote else 0.0,
+            "max_dd": self.max_dd,
+            "desvio": math.sqrt(max(variancia, 0.0)),
+            "ativo_ref": self.ultimo_ativo,
+        }
+
+
+class RollingMetrics:
+    """
+    PF, win rate, expectativa, payoff e Z-Score serial nas últimas N operações.
+
+    Tudo sai de somas acumuladas (janela = acumulado[i] - acumulado[i - N]),
+    então o custo é O(n) para qualquer N, sem laço por janela.
+    """
+
+    @staticmethod
+    def _janela(valores, janela):
+        """Soma móvel de tamanho `janela` (posição i = soma de i-janela+1 até i)"""
+        acumulado = np.concatenate(([0.0], np.cumsum(valores, dtype=float)))
+        fim = np.arange(1, len(valores) + 1)
+        return acumulado[fim] - acumulado[np.maximum(fim - janela, 0)]
+
+    @staticmethod
+    def compute(resultados, janela=20):
+        """
+        Calcula as métricas móveis sobre a sequência de operações.
+
+        Args:
+            resultados: Resultados por operação, em ordem cronológica
+            janela: Número de operações da janela
+
+        Returns:
+            pd.DataFrame: Uma linha por operação (pf, win_rate, expectancy, payoff,
+            z_score); NaN até completar a primeira janela. PF fica NaN em janelas
+            sem perda (no card o mesmo caso vira 99.99)
+        """
+        res = np.asarray(resultados, dtype=float)
+        n = len(res)
+        colunas = ['pf', 'win_rate', 'expectancy', 'payoff', 'z_score']
+        if n == 0 or janela < 2:
+            return pd.DataFrame(np.full((n, len(colunas)), np.nan), columns=colunas)
+
+        ganho, perda = res > 0, res < 0
+        n_win = RollingMetrics._janela(ganho, janela)
+        n_loss = RollingMetrics._janela(perda, janela)
+        soma_win = RollingMetrics._janela(np.where(ganho, res, 0.0), janela)
+        soma_loss = -RollingMetrics._janela(np.where(perda, res, 0.0), janela)
+        n_ops = np.minimum(np.arange(1, n + 1), janela)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pf = np.where(soma_loss > 0, soma_win / soma_loss, np.nan)
+            taxa = n_win / n_ops
+            avg_win = np.where(n_win > 0, soma_win / n_win, 0.0)
+            avg_loss = np.where(n_loss > 0, soma_loss / n_loss, 0.0)
+            payoff = np.where(avg_loss > 0, avg_win / avg_loss, 0.0)
+            expectancy = taxa * avg_win - (1 - taxa) * avg_loss
+
+        z = RollingMetrics._z_score(res, janela, n_win, n_loss)
+
+        metricas = pd.DataFrame({
+            'pf': pf, 'win_rate': taxa * 100, 'expectancy': expectancy,
+            'payoff': payoff, 'z_score': z,
+        })
+        metricas.iloc[:janela - 1] = np.nan
+        return metricas
+
+    @staticmethod
+    def _z_score(res, janela, n_win, n_loss):
+        """
+        Z-Score serial (Wald-Wolfowitz) de cada janela, igual a
+        RiskEngine.calculate_z_score_serial aplicado às últimas N operações.
+
+        Empates ficam fora da sequência: uma troca de sinal conta na janela se o
+        registro que troca e o não-empate anterior a ele estão dentro dela.
+        """
+        n = len(res)
+        sinal = np.sign(res)
+        pos = np.flatnonzero(sinal)            # posições dos não-empates
+        if len(pos) < 2:
+            return np.zeros(n)
+
+        # troca[k] = 1 se o não-empate na posição pos[k] tem sinal diferente do anterior
+        troca = np.zeros(n)
+        troca[pos[1:]] = sinal[pos[1:]] != sinal[pos[:-1]]
+        trocas = RollingMetrics._janela(troca, janela)
+
+        # A troca do primeiro não-empate da janela olha para fora dela: descontar
+        inicio = np.maximum(np.arange(n) - janela + 1, 0)
+        k = np.searchsorted(pos, inicio)       # primeiro não-empate >= início
+        primeiro = np.where(k < len(pos), pos[np.minimum(k, len(pos) - 1)], n)
+        dentro = primeiro <= np.arange(n)
+        trocas -= np.where(dentro, troca[np.minimum(primeiro, n - 1)], 0.0)
+        runs = trocas + 1
+
+        total = n_win + n_loss
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mu = (2 * n_win * n_loss) / total + 1
+            sigma = np.sqrt((mu - 1) * (mu - 2) / (total - 1))
+            z = (runs - mu) / sigma
+        valido = (total >= 2) & (n_win > 0) & (n_loss > 0) & (sigma > 0)
+        return np.where(valido, z, 0.0)
+
+
+class DrawdownEngine:
+    """
+    Drawdowns da curva de equity das operações numa passada O(n).
+
+    Submerso = equity - pico anterior (cummax), a mesma conta do card
+    "Drawdown Máximo". Um episódio começa no último pico antes de afundar,
+    tem fundo no menor valor e termina quando a equity volta ao pico.
+    """
+
+    @staticmethod
+    def analyze(resultados, datas=None):
+        """
+        Analisa todos os drawdowns da sequência de operações.
+
+        Args:
+            resultados: Resultados por operação, em ordem cronológica
+            datas: Momento de cada operação (mesmo tamanho); None = sem durações em dias
+
+        Returns:
+            dict: underwater (np.ndarray, <= 0), episodios (pd.DataFrame: inicio, fundo,
+            recuperacao, profundidade, duracao_trades, recuperacao_trades, duracao_dias,
+            aberto; posições na sequência) e stats (agregados)
+        """
+        res = np.asarray(resultados, dtype=float)
+        n = len(res)
+        colunas = ['inicio', 'fundo', 'recuperacao', 'profundidade', 'duracao_trades',
+                   'recuperacao_trades', 'duracao_dias', 'aberto']
+        if n == 0:
+            return {"underwater": np.zeros(0), "episodios": pd.DataFrame(columns=colunas),
+                    "stats": DrawdownEngine._stats(pd.DataFrame(columns=colunas), np.zeros(0))}
+
+        equity = np.cumsum(res)
+        underwater = equity - np.maximum.accumulate(equity)
+        submerso = underwater < 0
+
+        # Trechos contíguos submersos: [entra, sai) em posições
+        borda = np.diff(np.concatenate(([False], submerso, [False])).astype(np.int8))
+        entra = np.flatnonzero(borda == 1)
+        sai = np.flatnonzero(borda == -1)
+        if len(entra) == 0:
+            return {"underwater": underwater, "episodios": pd.DataFrame(columns=colunas),
+                    "stats": DrawdownEngine._stats(pd.DataFrame(columns=colunas), underwater)}
+
+        profundidade = np.minimum.reduceat(underwater, entra)
+
+        # Fundo: primeira posição de cada trecho que atinge a profundidade dele
+        trecho = np.cumsum(borda[:-1] == 1) - 1
+        candidatos = np.flatnonzero(submerso & (underwater == profundidade[np.maximum(trecho, 0)]))
+        primeiro = np.concatenate(([True], trecho[candidatos][1:] != trecho[candidatos][:-1]))
+        fundo = candidatos[primeiro]
+
+        inicio = entra - 1                    # o pico (posição 0 nunca está submersa)
+        aberto = sai >= n                     # não voltou ao pico até a última operação
+        fim = np.where(aberto, n - 1, sai)    # recuperação ou última operação
+
+        episodios = pd.DataFrame({
+            'inicio': inicio,
+            'fundo': fundo,
+            'recuperacao': np.where(aberto, -1, sai),
+            'profundidade': profundidade,
+            'duracao_trades': fim - inicio,
+            'recuperacao_trades': np.where(aberto, -1, sai - fundo),
+            'duracao_dias': np.nan,
+            'aberto': aberto,
+        })
+        if datas is not None:
+            momentos = pd.to_datetime(pd.Series(datas)).reset_index(drop=True)
+            dias = (momentos.iloc[fim].to_numpy() - momentos.iloc[inicio].to_numpy()) / np.timedelta64(1, 'D')
+            episodios['duracao_dias'] = dias.astype(float)
+
+        return {"underwater": underwater, "episodios": episodios,
+                "stats": DrawdownEngine._stats(episodios, underwater)}
+
+    @staticmethod
+    def _stats(episodios, underwater):
+        """Agregados dos episódios"""
+        vazio = episodios.empty
+        fechados = episodios[~episodios['aberto'].astype(bool)] if not vazio else episodios
+        return {
+            "n_episodios": len(episodios),
+            "max_drawdown": float(underwater.min()) if len(underwater) else 0.0,
+            "drawdown_medio": float(episodios['profundidade'].mean()) if not vazio else 0.0,
+            "duracao_media_trades": float(episodios['duracao_trades'].mean()) if not vazio else 0.0,
+            "duracao_max_trades": int(episodios['duracao_trades'].max()) if not vazio else 0,
+            "duracao_media_dias": float(episodios['duracao_dias'].mean()) if not vazio else 0.0,
+            "duracao_max_dias": float(episodios['duracao_dias'].max()) if not vazio else 0.0,
+            "recuperacao_media_trades": float(fechados['recuperacao_trades'].mean()) if not fechados.empty else 0.0,
+            "tempo_submerso_pct": float((underwater < 0).mean() * 100) if len(underwater) else 0.0,
+            "aberto": bool(episodios['aberto'].iloc[-1]) if not vazio else False,
+            "drawdown_atual": float(underwater[-1]) if len(underwater) else 0.0,
+        }
+
+
+class PnLIndex:
+    """
+    Índice de somas acumuladas por data para responder totais de qualquer período.
+
+    Registros e operações ficam ordenados por (data, created_at). Cada escopo
+    (todos, um grupo, uma conta) guarda as posições dos seus itens e as somas
+    acumuladas dos campos do MetricsAccumulator. O total de um período sai de
+    duas buscas binárias na coluna de datas e uma subtração.
+
+    Operações de um grupo (ou de todos) contam uma vez, com o resultado de UMA
+    conta; as de uma conta são os registros dela.
+    """
+
+    CAMPOS = ("liquido", "n_registros", "n_ops", "n_wins", "n_losses", "soma_wins", "soma_losses",
+              "soma", "soma_quadrados", "n_pts_win", "soma_pts_win", "n_pts_loss", "soma_pts_loss",
+              "n_lote", "soma_lote")
+
+    def __init__(self, registros, operacoes):
+        self.registros = registros
+        self.operacoes = operacoes
+        self._escopos = {}
+        self._arvores = {}          # DrawdownTree por escopo, montada na primeira consulta
+        self._contribuicoes = {"registros": self._contribuir(registros), "operacoes": self._contribuir(operacoes)}
+
+        # Escopos de operações: todos e cada grupo sobre as operações; cada conta sobre os registros
+        self._indexar(("ops", None), "operacoes", np.arange(len(operacoes)))
+        self._indexar(("reg", None), "registros", np.arange(len(registros)))
+        for campo, base, prefixo in (("grupo_vinculo", operacoes, "ops_grupo"), ("grupo_vinculo", registros, "reg_grupo"),
+                                     ("conta_id", registros, "conta")):
+            if campo not in base.columns or base.empty:
+                continue
+            codigos, valores = pd.factorize(base[campo])
+            ordem = np.argsort(codigos, kind='stable')
+            cortes = np.searchsorted(codigos[ordem], np.arange(len(valores) + 1))
+            nome_base = "operacoes" if base is operacoes else "registros"
+            for i, valor in enumerate(valores):
+                self._indexar((prefixo, valor), nome_base, ordem[cortes[i]:cortes[i + 1]])
+
+    @staticmethod
+    def _dias(df):
+        return pd.to_datetime(df['data']).to_numpy(dtype='datetime64[D]')
+
+    @staticmethod
+    def _contribuir(df):
+        """Contribuição de cada linha para os campos acumuláveis"""
+        if df.empty:
+            return {campo: np.zeros(0) for campo in PnLIndex.CAMPOS}
+        res = df['resultado'].to_numpy(dtype=float)
+        pts = df['pts_medio'].to_numpy(dtype=float) if 'pts_medio' in df.columns else np.full(len(df), np.nan)
+        lote = df['lote'].to_numpy(dtype=float) if 'lote' in df.columns else np.full(len(df), np.nan)
+        ganho, perda = res > 0, res < 0
+        tem_pts, tem_lote = ~np.isnan(pts), ~np.isnan(lote)
+        return {
+            "liquido": df['liquido'].to_numpy(dtype=float) if 'liquido' in df.columns else res,
+            "n_registros": df['registros'].to_numpy(dtype=float) if 'registros' in df.columns else np.ones(len(df)),
+            "n_ops": np.ones(len(df)),
+            "n_wins": ganho.astype(float), "n_losses": perda.astype(float),
+            "soma_wins": np.where(ganho, res, 0.0), "soma_losses": np.where(perda, res, 0.0),
+            "soma": res, "soma_quadrados": res * res,
+            "n_pts_win": (ganho & tem_pts).astype(float), "soma_pts_win": np.where(ganho & tem_pts, pts, 0.0),
+            "n_pts_loss": (perda & tem_pts).astype(float), "soma_pts_loss": np.where(perda & tem_pts, pts, 0.0),
+            "n_lote": tem_lote.astype(float), "soma_lote": np.where(tem_lote, lote, 0.0),
+        }
+
+    def _indexar(self, chave, base, posicoes):
+        frame = getattr(self, base)
+        dias = self._dias(frame)[posicoes] if not frame.empty else np.zeros(0, dtype='datetime64[D]')
+        contrib = self._contribuicoes[base]
+        acumulado = {campo: np.concatenate(([0.0], np.cumsum(contrib[campo][posicoes]))) for campo in self.CAMPOS}
+        self._escopos[chave] = (base, posicoes, dias, acumulado)
+
+    @staticmethod
+    def build(df_trades):
+        """
+        Monta o índice de todos os trades do usuário.
+
+        Args:
+            df_trades: DataFrame de trades (data, created_at, resultado, grupo_vinculo,
+                conta_id e as colunas da chave de operação)
+
+        Returns:
+            PnLIndex
+        """
+        # Import tardio: logic não depende de analytics
+        from modules.logic import OperationGrouping
+
+        if df_trades is None or df_trades.empty or 'data' not in df_trades.columns:
+            return PnLIndex(pd.DataFrame(), pd.DataFrame())
+
+        registros = df_trades[df_trades['data'].notna()]
+        ordem = ['data', 'created_at'] if 'created_at' in registros.columns else ['data']
+        registros = registros.sort_values(ordem, kind='stable').reset_index(drop=True)
+
+        op_key = OperationGrouping.build_keys(registros)
+        g = registros.groupby(op_key, sort=False)
+        operacoes = g.first()
+        operacoes['liquido'] = g['resultado'].sum()
+        operacoes['registros'] = g.size()
+        operacoes = operacoes.sort_values(ordem, kind='stable').reset_index(drop=True)
+        return PnLIndex(registros, operacoes)
+
+    def _escopo(self, tipo, grupo=None, conta_id=None):
+        """(base, posições, dias, acumulado) do escopo; None se não houver dados"""
+        if conta_id is not None:
+            return self._escopos.get(("conta", conta_id))
+        if grupo is not None:
+            return self._escopos.get((f"{tipo}_grupo", grupo))
+        return self._escopos.get((tipo, None))
+
+    def _intervalo(self, escopo, d_inicio, d_fim):
+        """Posições [lo, hi) do período inclusivo nas datas do escopo (duas buscas binárias)"""
+        dias = escopo[2]
+        lo = np.searchsorted(dias, np.datetime64(d_inicio, 'D'), 'left') if d_inicio is not None else 0
+        hi = np.searchsorted(dias, np.datetime64(d_fim, 'D'), 'right') if d_fim is not None else len(dias)
+        return lo, max(lo, hi)
+
+    def totais(self, d_inicio=None, d_fim=None, grupo=None, conta_id=None):
+        """
+        Totais do período no formato de MetricsAccumulator.to_dict() (sem a curva de equity).
+
+        Args:
+            d_inicio, d_fim: Período inclusivo sobre a coluna `data` (None = sem limite)
+            grupo: Só este grupo (None = todos)
+            conta_id: Só esta conta (tem prioridade sobre grupo)
+
+        Returns:
+            dict: Campos acumuláveis + ultimo_ativo
+        """
+        escopo = self._escopo("ops", grupo, conta_id)
+        if escopo is None:
+            return {**{campo: 0 for campo in self.CAMPOS}, "ultimo_ativo": None}
+        base, posicoes, _, acumulado = escopo
+        lo, hi = self._intervalo(escopo, d_inicio, d_fim)
+        totais = {campo: float(acumulado[campo][hi] - acumulado[campo][lo]) for campo in self.CAMPOS}
+        for campo in self.CAMPOS:
+            if campo.startswith("n_"):
+                totais[campo] = int(round(totais[campo]))
+        frame = getattr(self, base)
+        ativo = frame['ativo'].iloc[posicoes[hi - 1]] if hi > lo and 'ativo' in frame.columns else None
+        totais["ultimo_ativo"] = None if ativo is None or pd.isna(ativo) else ativo
+        return totais
+
+    def drawdown(self, d_inicio=None, d_fim=None, grupo=None, conta_id=None, registros=False):
+        """
+        Pico e pior queda do período (DrawdownTree do escopo, O(log n)).
+
+        Args:
+            registros: True = curva dos registros somados de todas as contas (monitor
+                do grupo); False = curva das operações (uma conta)
+
+        Returns:
+            dict: resultado, hwm, fundo (equity acumulada do escopo desde o início
+            do histórico) e max_drawdown dentro do período
+        """
+        tipo = "reg" if registros else "ops"
+        escopo = self._escopo(tipo, grupo, conta_id)
+        if escopo is None:
+            return DrawdownTree([]).query(0, 0)
+        base, posicoes, _, _ = escopo
+        chave = ("conta", conta_id) if conta_id is not None else (tipo, grupo)
+        arvore = self._arvores.get(chave)
+        if arvore is None:
+            arvore = self._arvores[chave] = DrawdownTree(self._contribuicoes[base]["soma"][posicoes])
+        return arvore.query(*self._intervalo(escopo, d_inicio, d_fim))
+
+    def periodo_operacoes(self, d_inicio=None, d_fim=None, grupo=None, conta_id=None):
+        """Operações do período (uma linha por operação, ordem de data)"""
+        escopo = self._escopo("ops", grupo, conta_id)
+        if escopo is None:
+            return pd.DataFrame(columns=self.operacoes.columns)
+        lo, hi = self._intervalo(escopo, d_inicio, d_fim)
+        return getattr(self, escopo[0]).iloc[escopo[1][lo:hi]]
+
+    def periodo_registros(self, d_inicio=None, d_fim=None, grupo=None, conta_id=None):
+        """Registros (um por conta) do período, em ordem de data"""
+        escopo = self._escopo("reg", grupo, conta_id)
+        if escopo is None:
+            return pd.DataFrame(columns=self.registros.columns)
+        lo, hi = self._intervalo(escopo, d_inicio, d_fim)
+        return self.registros.iloc[escopo[1][lo:hi]]
+
+
+class DrawdownTree:
+    """
+    Árvore de segmentos sobre a sequência de resultados para consultar pico,
+    fundo e pior queda de qualquer janela [lo, hi) em O(log n).
+
+    Cada nó guarda, relativo ao início do seu trecho: soma, maior e menor
+    saldo acumulado e pior queda (saldo - pico anterior, como cummax). Dois
+    trechos vizinhos se juntam como MetricsAccumulator.merge:
+        pico = max(pico_a, soma_a + pico_b)
+        vale = min(vale_a, soma_a + vale_b)
+        dd   = min(dd_a, dd_b, soma_a + vale_b - pico_a)
+    """
+
+    def __init__(self, resultados, inicial=0.0):
+        res = np.asarray(resultados, dtype=float)
+        self.n = len(res)
+        self.inicial = float(inicial)
+        self._acumulado = np.concatenate(([0.0], np.cumsum(res)))
+
+        # Folhas em [tamanho, 2*tamanho); sobras com o elemento neutro (soma 0, pico -inf, vale +inf)
+        self.tamanho = 1 << max(0, (self.n - 1).bit_length())
+        t = self.tamanho
+        self.soma = np.zeros(2 * t)
+        self.pico = np.full(2 * t, -np.inf)
+        self.vale = np.full(2 * t, np.inf)
+        self.dd = np.zeros(2 * t)
+        self.soma[t:t + self.n] = res
+        self.pico[t:t + self.n] = res
+        self.vale[t:t + self.n] = res
+
+        # Montagem nível a nível, vetorizada: O(n)
+        nivel = t // 2
+        while nivel >= 1:
+            pais = np.arange(nivel, 2 * nivel)
+            esq, dir_ = 2 * pais, 2 * pais + 1
+            self.soma[pais], self.pico[pais], self.vale[pais], self.dd[pais] = self._juntar(
+                (self.soma[esq], self.pico[esq], self.vale[esq], self.dd[esq]),
+                (self.soma[dir_], self.pico[dir_], self.vale[dir_], self.dd[dir_]))
+            nivel //= 2
+
+    @staticmethod
+    def _juntar(a, b):
+        soma_a, pico_a, vale_a, dd_a = a
+        soma_b, pico_b, vale_b, dd_b = b
+        with np.errstate(invalid='ignore'):
+            return (soma_a + soma_b,
+                    np.maximum(pico_a, soma_a + pico_b),
+                    np.minimum(vale_a, soma_a + vale_b),
+                    np.minimum(np.minimum(dd_a, dd_b), soma_a + vale_b - pico_a))
+
+    def _no(self, i):
+        return (self.soma[i], self.pico[i], self.vale[i], self.dd[i])
+
+    def query(self, lo, hi):
+        """
+        Pico, fundo e pior queda da janela de posições [lo, hi).
+
+        Args:
+            lo, hi: Posições na sequência (hi exclusivo)
+
+        Returns:
+            dict: resultado (soma da janela), hwm e fundo (saldo absoluto, a partir
+            de `inicial` + tudo antes de lo), max_drawdown (<= 0, dentro da janela)
+        """
+        lo, hi = max(0, int(lo)), min(self.n, int(hi))
+        base = self.inicial + self._acumulado[lo] if self.n else self.inicial
+        if hi <= lo:
+            return {"resultado": 0.0, "hwm": base, "fundo": base, "max_drawdown": 0.0}
+
+        neutro = (0.0, -np.inf, np.inf, 0.0)
+        esquerda, direita = neutro, neutro
+        l, r = lo + self.tamanho, hi + self.tamanho
+        while l < r:
+            if l & 1:
+                esquerda = self._juntar(esquerda, self._no(l)); l += 1
+            if r & 1:
+                r -= 1; direita = self._juntar(self._no(r), direita)
+            l //= 2; r //= 2
+        soma, pico, vale, dd = self._juntar(esquerda, direita)
+        return {"resultado": float(soma), "hwm": float(base + pico), "fundo": float(base + vale),
+                "max_drawdown": float(min(dd, 0.0))}
+
+
+# conta_id dos registros antigos (sem conta) dentro do rollup
+SEM_CONTA = -1
+# grupo_vinculo nulo dentro do rollup (o groupby descartaria a linha e ela sumiria de "Todos")
+SEM_GRUPO = ""
+
+class DailyRollup:
+    """
+    Agregado por (grupo, conta, dia): resultado, registros, wins, losses, lotes e pontos.
+
+    Mantido junto do cache de trades: aplicar(df, +1) soma registros novos e
+    aplicar(df, -1) tira os apagados, sem reagrupar o histórico. Gráficos e
+    metas leem daqui (dias x grupos x contas) em vez dos trades crus.
+    """
+
+    CHAVES = ["grupo_vinculo", "conta_id", "data"]
+    CAMPOS = ["resultado", "registros", "wins", "losses", "lote", "pts"]
+
+    def __init__(self, tabela=None):
+        self.tabela = tabela if tabela is not None else self._vazia()
+
+    @staticmethod
+    def _vazia():
+        indice = pd.MultiIndex.from_arrays([[], [], []], names=DailyRollup.CHAVES)
+        return pd.DataFrame({c: pd.Series(dtype=float) for c in DailyRollup.CAMPOS}, index=indice)
+
+    @staticmethod
+    def semana_trading(datas):
+        """Domingo que abre a semana de trading de cada data (sábado fica na semana que acabou)"""
+        dias = pd.to_datetime(pd.Series(datas)).reset_index(drop=True)
+        return (dias - pd.to_timedelta((dias.dt.weekday + 1) % 7, unit='D')).dt.date
+
+    @staticmethod
+    def _agregar(df):
+        """Soma os registros de `df` por (grupo, conta, dia)"""
+        if df is None or df.empty or 'data' not in df.columns or 'resultado' not in df.columns:
+            return DailyRollup._vazia()
+        res = pd.to_numeric(df['resultado'], errors='coerce').fillna(0.0)
+        grupo = df['grupo_vinculo'].astype(object) if 'grupo_vinculo' in df.columns else pd.Series("Geral", index=df.index)
+        conta = df['conta_id'].astype(object) if 'conta_id' in df.columns else pd.Series(None, index=df.index, dtype=object)
+        valores = pd.DataFrame({
+            "resultado": res,
+            "registros": 1.0,
+            "wins": (res > 0).astype(float),
+            "losses": (res < 0).astype(float),
+            "lote": pd.to_numeric(df['lote'], errors='coerce').fillna(0.0) if 'lote' in df.columns else 0.0,
+            "pts": pd.to_numeric(df['pts_medio'], errors='coerce').fillna(0.0) if 'pts_medio' in df.columns else 0.0,
+        }, index=df.index)
+        chaves = [grupo.where(grupo.notna(), SEM_GRUPO).rename("grupo_vinculo"), conta.where(conta.notna(), SEM_CONTA).rename("conta_id"), df['data'].rename("data")]
+        return valores.groupby(chaves).sum()
+
+    @staticmethod
+    def build(df_trades):
+        """Rollup completo de um DataFrame de trades"""
+        return DailyRollup(DailyRollup._agregar(df_trades))
+
+    def aplicar(self, df, sinal=1):
+        """
+        Soma (sinal=1) ou tira (sinal=-1) registros do rollup.
+
+        Só os dias/contas tocados por `df` mudam; linhas que zeram a contagem saem.
+        """
+        delta = self._agregar(df)
+        if delta.empty:
+            return self
+        if sinal < 0:
+            delta = -delta
+        tabela = delta if self.tabela.empty else self.tabela.add(delta, fill_value=0.0)
+        self.tabela = tabela[tabela['registros'] != 0]
+        return self
+
+    def _filtrar(self, d_inicio=None, d_fim=None, grupo=None):
+        tabela = self.tabela
+        if tabela.empty:
+            return tabela
+        mascara = np.ones(len(tabela), dtype=bool)
+        datas = tabela.index.get_level_values("data")
+        if d_inicio is not None: mascara &= np.asarray(datas >= d_inicio)
+        if d_fim is not None: mascara &= np.asarray(datas <= d_fim)
+        if grupo is not None: mascara &= np.asarray(tabela.index.get_level_values("grupo_vinculo") == grupo)
+        return tabela[mascara]
+
+    def resumo(self, d_inicio=None, d_fim=None, grupo=None, por=("grupo_vinculo",)):
+        """
+        Totais do período agrupados pelas chaves em `por`.
+
+        Args:
+            d_inicio, d_fim: Período inclusivo sobre `data` (None = sem limite)
+            grupo: Só este grupo (None = todos)
+            por: Níveis do agrupamento (grupo_vinculo, conta_id, data)
+
+        Returns:
+            pd.DataFrame: CAMPOS indexados por `por`
+        """
+        return self._filtrar(d_inicio, d_fim, grupo).groupby(level=list(por)).sum()
+
+    def diario(self, d_inicio=None, d_fim=None, grupo=None):
+        """Uma linha por dia do período: data + CAMPOS"""
+        return self.resumo(d_inicio, d_fim, grupo, por=("data",)).reset_index()
+
+    def semanal(self, d_inicio=None, d_fim=None, grupo=None):
+        """Uma linha por semana de trading (domingo de início): semana + CAMPOS"""
+        diario = self.diario(d_inicio, d_fim, grupo)
+        if diario.empty:
+            return pd.DataFrame(columns=["semana"] + self.CAMPOS)
+        diario["semana"] = self.semana_trading(diario["data"]).to_numpy()
+        return diario.groupby("semana")[self.CAMPOS].sum().reset_index()
+
+
+class CurveDownsampler:
+    """
+    Redução de pontos das curvas de equity para os gráficos (Largest-Triangle-Three-Buckets).
+
+    Abaixo de LIMIAR pontos a curva vai inteira. Acima, cada série sai com no
+    máximo PONTOS pontos: o LTTB escolhe, em cada balde, o ponto que forma o
+    maior triângulo com o anterior e a média do próximo balde, e os extremos
+    (topo, fundo, pico e vale da pior queda) entram sempre. Os métodos devolvem
+    posições, então x, y e hover saem da mesma linha do DataFrame.
+    """
+
+    LIMIAR = 5000
+    PONTOS = 2000
+
+    @staticmethod
+    def _eixo(x, n):
+        """Eixo x numérico (datas viram nanossegundos; None = posição)"""
+        if x is None:
+            return np.arange(n, dtype=float)
+        serie = pd.Series(x).reset_index(drop=True)
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            return serie.astype("int64").to_numpy(dtype=float)
+        return pd.to_numeric(serie, errors='coerce').to_numpy(dtype=float)
+
+    @staticmethod
+    def lttb(x, y, pontos):
+        """
+        Posições escolhidas pelo LTTB (primeiro e último sempre entram).
+
+        Args:
+            x, y: Arrays numéricos do mesmo tamanho
+            pontos: Quantidade de pontos na saída
+
+        Returns:
+            np.ndarray: Posições em ordem crescente
+        """
+        n = len(y)
+        if pontos >= n:
+            return np.arange(n)
+        if pontos < 3:
+            return np.array([0, n - 1]) if n > 1 else np.arange(n)
+
+        # pontos - 2 baldes cobrindo [1, n-1); o "próximo" do último balde é o ponto final
+        bordas = np.linspace(1, n - 1, pontos - 1).astype(int)
+        acum_x = np.concatenate(([0.0], np.cumsum(x)))
+        acum_y = np.concatenate(([0.0], np.cumsum(y)))
+        prox_ini = bordas[1:]
+        prox_fim = np.append(bordas[2:], n)
+        tam = prox_fim - prox_ini
+        media_x = (acum_x[prox_fim] - acum_x[prox_ini]) / tam
+        media_y = (acum_y[prox_fim] - acum_y[prox_ini]) / tam
+
+        escolhidos = np.empty(pontos, dtype=int)
+        escolhidos[0], escolhidos[-1] = 0, n - 1
+        a = 0
+        for i in range(pontos - 2):
+            ini, fim = bordas[i], bordas[i + 1]
+            bx, by = x[ini:fim], y[ini:fim]
+            area = np.abs((x[a] - media_x[i]) * (by - y[a]) - (x[a] - bx) * (media_y[i] - y[a]))
+            a = ini + int(np.argmax(area))
+            escolhidos[i + 1] = a
+        return escolhidos
+
+    @staticmethod
+    def _completar(x, y, obrigatorios, pontos):
+        """LTTB com as posições obrigatórias garantidas, sem passar de `pontos`"""
+        obrigatorios = np.unique(obrigatorios)
+        base = CurveDownsampler.lttb(x, y, max(pontos - len(obrigatorios), 2))
+        return np.union1d(base, obrigatorios)
+
+    @staticmethod
+    def curva(y, x=None, pontos=None, limiar=None):
+        """
+        Posições a plotar de uma curva de saldo/lucro.
+
+        Args:
+            y: Valores da curva
+            x: Eixo x (números ou datas; None = sequência)
+            pontos: Máximo de pontos na saída (padrão PONTOS)
+            limiar: Tamanho a partir do qual reduz (padrão LIMIAR)
+
+        Returns:
+            np.ndarray: Posições em ordem crescente (todas, se a curva é pequena)
+        """
+        pontos = int(pontos or CurveDownsampler.PONTOS)
+        limiar = int(limiar or CurveDownsampler.LIMIAR)
+        vals = np.asarray(y, dtype=float)
+        n = len(vals)
+        if n <= max(limiar, pontos):
+            return np.arange(n)
+
+        # Pior queda: vale = menor (saldo - pico anterior); pico = maior saldo até o vale
+        queda = vals - np.maximum.accumulate(vals)
+        vale = int(np.argmin(queda))
+        pico = int(np.argmax(vals[:vale + 1]))
+        obrigatorios = [0, n - 1, int(np.argmax(vals)), int(np.argmin(vals)), pico, vale]
+        return CurveDownsampler._completar(CurveDownsampler._eixo(x, n), vals, obrigatorios, pontos)
+
+    @staticmethod
+    def degraus(y, x=None, pontos=None, limiar=None):
+        """
+        Posições a plotar de uma série em degraus (trailing stop).
+
+        Cada mudança de nível entra com o último ponto antes e o primeiro depois,
+        para o degrau continuar vertical. Se as mudanças não cabem em `pontos`,
+        ficam os maiores degraus (até metade dos pontos) e o LTTB completa.
+        """
+        pontos = int(pontos or CurveDownsampler.PONTOS)
+        limiar = int(limiar or CurveDownsampler.LIMIAR)
+        vals = np.asarray(y, dtype=float)
+        n = len(vals)
+        if n <= max(limiar, pontos):
+            return np.arange(n)
+
+        saltos = np.diff(vals)
+        mudancas = np.flatnonzero(saltos != 0) + 1
+        cantos = np.unique(np.concatenate(([0, n - 1], mudancas - 1, mudancas)))
+        if len(cantos) <= pontos:
+            return cantos
+
+        maiores = mudancas[np.argsort(-np.abs(saltos[mudancas - 1]), kind='stable')[:pontos // 4]]
+        obrigatorios = np.concatenate(([0, n - 1], maiores - 1, maiores))
+        return CurveDownsampler._completar(CurveDownsampler._eixo(x, n), vals, obrigatorios, pontos)
+
+    @staticmethod
+    def serie(y, x=None, pontos=None, limiar=None):
+        """
+        Posições a plotar de uma série com lacunas (métricas móveis: NaN até
+        fechar a primeira janela, PF sem perda na janela).
+
+        O LTTB roda só sobre os valores finitos, com máximo e mínimo garantidos.
+        Cada lacuna entra com a primeira posição, para a linha continuar
+        interrompida ali; se há lacunas demais, ficam as maiores (até um quarto
+        dos pontos).
+        """
+        pontos = int(pontos or CurveDownsampler.PONTOS)
+        limiar = int(limiar or CurveDownsampler.LIMIAR)
+        vals = np.asarray(y, dtype=float)
+        n = len(vals)
+        if n <= max(limiar, pontos):
+            return np.arange(n)
+
+        finito = np.isfinite(vals)
+        vazio = ~finito
+        inicio = np.flatnonzero(vazio & np.concatenate(([True], finito[:-1])))
+        fim = np.flatnonzero(vazio & np.concatenate((finito[1:], [True]))) + 1
+        lacunas = inicio[np.argsort(-(fim - inicio), kind='stable')[:pontos // 4]]
+
+        finitos = np.flatnonzero(finito)
+        if len(finitos) == 0:
+            return np.array([0, n - 1])
+        fy = vals[finitos]
+        fx = CurveDownsampler._eixo(x, n)[finitos]
+        obrigatorios = [0, len(finitos) - 1, int(np.argmax(fy)), int(np.argmin(fy))]
+        escolhidos = finitos[CurveDownsampler._completar(fx, fy, obrigatorios, pontos - len(lacunas) - 1)]
+        return np.union1d(escolhidos, np.concatenate((lacunas, [n - 1])))
@@ -0,0 +1,86 @@
+import os
+import json
+import hashlib
+import logging
+import streamlit as st
+import pandas as pd
+
+# Cache local (opcional) dos DataFrames já tipados, um arquivo Parquet por usuário/tabela.
+# Liga com CACHE_LOCAL = true no secrets.toml ou APEX_CACHE_LOCAL=1 no ambiente.
+LIMITE_MB = 200
+
+log = logging.getLogger(__name__)
+
+def config(nome, padrao=None):
+    try:
+        if nome in st.secrets: return st.secrets[nome]
+    except: pass
+    return os.environ.get(f"APEX_{nome}", padrao)
+
+def ativo():
+    return str(config("CACHE_LOCAL", "")).lower() in ("1", "true", "sim", "yes")
+
+def _pasta():
+    return config("CACHE_DIR", os.path.join(".cache", "apex"))
+
+def _caminho(user, nome):
+    h = hashlib.sha1(f"{user}|{nome}".encode("utf-8")).hexdigest()[:20]
+    return os.path.join(_pasta(), f"{h}.parquet")
+
+def _serializar(df):
+    """Colunas com listas/dicts (parciais, prints) vão para o disco como JSON"""
+    df = df.copy()
+    for c in df.columns:
+        if df[c].dtype == object and df[c].map(lambda v: isinstance(v, (list, dict))).any():
+            df[c] = df[c].map(lambda v: json.dumps(v) if isinstance(v, (list, dict)) else v)
+    return df
+
+def ler(user, nome):
+    """Lê o DataFrame salvo; arquivo ausente ou corrompido devolve None (e o corrompido é apagado)"""
+    caminho = _caminho(user, nome)
+    if not os.path.exists(caminho): return None
+    try:
+        df = pd.read_parquet(caminho)
+        os.utime(caminho)  # marca como usado recentemente (LRU)
+        return df
+    except Exception as e:
+        log.warning("Cache local corrompido (%s): %s", caminho, e)
+        try: os.remove(caminho)
+        except OSError: pass
+        return None
+
+def gravar(user, nome, df):
+    """Grava de forma atômica (arquivo temporário + rename) e aplica o limite de tamanho"""
+    caminho = _caminho(user, nome)
+    try:
+        os.makedirs(_pasta(), exist_ok=True)
+        tmp = caminho + ".tmp"
+        _serializar(df).to_parquet(tmp, index=False)
+        os.replace(tmp, caminho)
+        _aplicar_limite()
+        return True
+    except Exception as e:
+        log.warning("Erro ao gravar cache local: %s", e)
+        return False
+
+def apagar(user, nome):
+    try: os.remove(_caminho(user, nome))
+    except OSError: pass
+
+def _aplicar_limite():
+    """Remove os arquivos menos usados até a pasta caber em LIMITE_MB"""
+    pasta = _pasta()
+    arquivos = []
+    for f in os.listdir(pasta):
+        if f.endswith(".parquet"):
+            p = os.path.join(pasta, f)
+            st_ = os.stat(p)
+            arquivos.append((st_.st_mtime, st_.st_size, p))
+    total = sum(a[1] for a in arquivos)
+    limite = float(config("CACHE_LIMITE_MB", LIMITE_MB)) * 1024 * 1024
+    for _, tamanho, p in sorted(arquivos):
+        if total <= limite: break
+        try:
+            os.remove(p)
+            total -= tamanho
+        except OSError: pass
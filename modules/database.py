@@ -1,10 +1,30 @@
+import copy
+import json
+import time
+import uuid
+import logging
+from urllib.parse import unquote
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
 from supabase import create_client, Client
 
-# Inicializa conexão (Singleton)
+from modules import cache_local, offline
+from modules.analytics import PnLIndex, DailyRollup
+
+# ============================================================
+# CAMADA DE DADOS ÚNICA
+# Todas as telas leem por aqui: conexão, tipos, cache e medição
+# ============================================================
+
+log = logging.getLogger(__name__)
+
+# --- 1. CONEXÃO (Singleton) ---
 @st.cache_resource
 def get_db():
+    if offline.ativo(): return offline.criar_cliente()
     try:
         url = st.secrets["SUPABASE_URL"]
         key = st.secrets["SUPABASE_KEY"]
@@ -15,49 +35,752 @@ def get_db():
 
 supabase = get_db()
 
-def load_trades(user):
+def get_supabase():
+    """Cliente da sessão (login) ou o singleton do módulo"""
+    if "supabase" in st.session_state: return st.session_state["supabase"]
+    return supabase
+
+# --- 2. SCHEMA TIPADO ---
+# Projeções por tela: cada página baixa só as colunas que usa
+COLUNAS_TRADES_DASHBOARD = "id, data, created_at, ativo, resultado, lote, pts_medio, grupo_vinculo, conta_id, operacao_id, contexto"
+COLUNAS_TRADES_CONTAS = "id, data, created_at, resultado, grupo_vinculo, conta_id"
+COLUNAS_TRADES_META = "id, data, created_at, resultado, grupo_vinculo, conta_id"
+
+# Por tabela: colunas de data, timestamp, numéricas e valores padrão de colunas ausentes
+SCHEMA = {
+    "trades": {
+        "datas": ["data"],
+        "timestamps": ["created_at"],
+        "numericos": ["resultado", "lote", "pts_medio", "risco_fin", "stop_pts"],
+        "padroes": {"grupo_vinculo": "Geral", "conta_id": None},
+    },
+    "contas_config": {
+        "padroes": {"pico_previo": lambda df: df['saldo_inicial'], "fase_entrada": "Fase 1", "status_conta": "Ativa"},
+        "numericos": ["saldo_inicial", "pico_previo"],
+    },
+    "ajustes_manuais": {
+        "timestamps": ["created_at"],
+        "numericos": ["valor"],
+    },
+}
+
+def tipar(tabela, df):
+    """Aplica o SCHEMA da tabela (datas, numéricos e colunas padrão)"""
+    if df.empty: return df
+    schema = SCHEMA.get(tabela, {})
+    for c, padrao in schema.get("padroes", {}).items():
+        if c not in df.columns: df[c] = padrao(df) if callable(padrao) else padrao
+    for c in schema.get("datas", []):
+        if c in df.columns: df[c] = pd.to_datetime(df[c], format='ISO8601').dt.date
+    for c in schema.get("timestamps", []):
+        if c in df.columns: df[c] = pd.to_datetime(df[c], format='ISO8601')
+    for c in schema.get("numericos", []):
+        if c in df.columns: df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0.0)
+    return df
+
+def _tipar_trades(df):
+    return tipar("trades", df)
+
+# --- 3. EXECUÇÃO MEDIDA ---
+_lock_stats = threading.Lock()  # leituras em paralelo (prefetch) somam nas mesmas estatísticas
+
+# Memo da execução: leituras idênticas dentro de um mesmo rerun vão à rede uma vez só.
+# O app.py chama iniciar_execucao() no topo de cada rerun; escritas limpam a tabela.
+def iniciar_execucao():
+    st.session_state["db_execucao"] = {"memo": {}, "evitadas": {}}
+
+def _assinatura(q):
+    """(método, tabela, chave) da requisição; None se o builder não expõe a requisição"""
+    req = getattr(q, "request", q)
+    metodo, path = getattr(req, "http_method", None), getattr(req, "path", None)
+    if metodo is None or path is None: return None
+    headers = getattr(req, "headers", None) or {}
+    return str(metodo).upper(), str(path).rstrip("/").rsplit("/", 1)[-1], f"{req.params}|{headers.get('Prefer', '')}"
+
+def _memo_execucao():
+    try: return st.session_state.get("db_execucao")
+    except: return None
+
+def _executar(q, tabela):
+    """Executa a query e acumula consultas, linhas, bytes (JSON aproximado) e tempo por tabela"""
+    execucao = _memo_execucao()
+    assinatura = _assinatura(q) if execucao is not None else None
+    if assinatura and assinatura[0] == "GET":
+        _, tabela_req, chave = assinatura
+        anterior = execucao["memo"].get(tabela_req, {}).get(chave)
+        if anterior is not None:
+            with _lock_stats:
+                evitadas = execucao["evitadas"]
+                evitadas[(tabela_req, chave)] = evitadas.get((tabela_req, chave), 0) + 1
+            res = copy.copy(anterior)
+            res.data = copy.deepcopy(anterior.data)
+            return res
+
+    t0 = time.perf_counter()
+    res = q.execute()
+    ms = (time.perf_counter() - t0) * 1000
+    if assinatura:
+        memo = execucao["memo"].setdefault(assinatura[1], {})
+        if assinatura[0] == "GET": memo[assinatura[2]] = res
+        else: memo.clear()
+    dados = res.data or []
     try:
-        res = supabase.table("trades").select("*").execute()
-        df = pd.DataFrame(res.data)
-        if not df.empty:
-            df['data'] = pd.to_datetime(df['data']).dt.date
-            df['created_at'] = pd.to_datetime(df['created_at'])
-            df['resultado'] = pd.to_numeric(df['resultado'], errors='coerce').fillna(0.0)
-            df['lote'] = pd.to_numeric(df['lote'], errors='coerce').fillna(0)
-            if 'grupo_vinculo' not in df.columns: df['grupo_vinculo'] = 'Geral'
-            if 'comportamento' not in df.columns: df['comportamento'] = 'Normal'
-            return df[df['usuario'] == user].copy()
-        return pd.DataFrame()
+        tamanho = len(json.dumps(dados, default=str).encode("utf-8"))
+        with _lock_stats:
+            stats = st.session_state.setdefault("db_stats", {})
+            s = stats.setdefault(tabela, {"consultas": 0, "linhas": 0, "bytes": 0, "ms": 0.0, "max_ms": 0.0})
+            s["consultas"] += 1
+            s["linhas"] += len(dados)
+            s["bytes"] += tamanho
+            s["ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+    except: pass
+    return res
+
+def consultar(q, tabela):
+    """Executa uma leitura pelo memo da execução (e conta nas estatísticas de tráfego)"""
+    return _executar(q, tabela)
+
+def get_duplicadas_evitadas():
+    """Leituras repetidas servidas pelo memo neste rerun: [(tabela, consulta, vezes)]"""
+    execucao = _memo_execucao() or {"evitadas": {}}
+    return [(t, unquote(chave.split("|")[0]), n) for (t, chave), n in sorted(execucao["evitadas"].items())]
+
+def get_db_stats():
+    """Retorna {tabela: {consultas, linhas, bytes, ms, max_ms}} acumulado na sessão"""
+    return st.session_state.get("db_stats", {})
+
+# --- 4. CACHE DE LEITURA (TTL + VERSÃO DE DADOS POR USUÁRIO) ---
+# Cada usuário tem um contador de versão, único no processo (vale para todas as
+# sessões/abas). Toda escrita chama registrar_escrita(tabela, user=...): o contador
+# sobe e as leituras em cache daquele usuário deixam de valer, mesmo antes do TTL.
+# Tabelas globais (atm_configs) usam user=None.
+TTL_LEITURA_SEG = 300
+
+@st.cache_resource
+def _versoes_dados():
+    return {"lock": threading.Lock(), "versoes": {}, "tabelas": {}}
+
+def versao_dados(user):
+    return _versoes_dados()["versoes"].get(user, 0)
+
+def _incrementar_versao(user):
+    v = _versoes_dados()
+    with v["lock"]: v["versoes"][user] = v["versoes"].get(user, 0) + 1
+
+def escritas_tabela(user, tabela):
+    """Quantas escritas em `tabela` do usuário o processo viu (todas as sessões)"""
+    return _versoes_dados()["tabelas"].get((user, tabela), 0)
+
+def _escritas_proprias():
+    """Escritas feitas por esta sessão, por (usuário, tabela); None fora de uma execução do script"""
+    if get_script_run_ctx() is None: return None
+    return st.session_state.setdefault("escritas_proprias", {})
+
+def escritas_externas(user, tabela, referencia):
+    """
+    Escritas em `tabela` feitas por OUTRAS sessões desde `referencia`.
+
+    As escritas da própria sessão já corrigem o cache de sync (cache_trades_*);
+    as de outra aba/sessão (delete, troca de grupo) não mudam created_at e só
+    aparecem num sync completo.
+    """
+    proprias = _escritas_proprias() or {}
+    total, minhas = referencia
+    return (escritas_tabela(user, tabela) - total) - (proprias.get((user, tabela), 0) - minhas)
+
+def _referencia_escritas(user, tabela):
+    proprias = _escritas_proprias() or {}
+    return (escritas_tabela(user, tabela), proprias.get((user, tabela), 0))
+
+def registrar_escrita(*tabelas, user=None):
+    _incrementar_versao(user)
+    v = _versoes_dados()
+    with v["lock"]:
+        for t in tabelas: v["tabelas"][(user, t)] = v["tabelas"].get((user, t), 0) + 1
+    proprias = _escritas_proprias()
+    if proprias is not None:
+        for t in tabelas: proprias[(user, t)] = proprias.get((user, t), 0) + 1
+    _limpar_memo(*tabelas)
+
+def _limpar_memo(*tabelas):
+    execucao = _memo_execucao()
+    if execucao is not None:
+        for t in tabelas: execucao["memo"].pop(t, None)
+
+@st.cache_data(ttl=TTL_LEITURA_SEG, max_entries=1000, show_spinner=False)
+def _leitura_versionada(tabela, chave, versao, _carregar):
+    return _carregar()
+
+def _cacheado(tabela, chave, carregar):
+    """Leitura em st.cache_data com chave (tabela, usuário, versão de dados do usuário)"""
+    return _leitura_versionada(tabela, chave, versao_dados(chave), carregar)
+
+@st.cache_resource(ttl=TTL_LEITURA_SEG, max_entries=50, show_spinner=False)
+def _indice_pnl(user, versao, assinatura, _df_trades):
+    return PnLIndex.build(_df_trades)
+
+def indice_pnl(user, df_trades):
+    """
+    PnLIndex dos trades do usuário, refeito só quando os dados mudam.
+
+    A chave é a versão de dados do usuário + colunas, tamanho e último registro
+    do DataFrame (cada tela carrega uma projeção diferente).
+    """
+    assinatura = (tuple(df_trades.columns), len(df_trades),
+                  str(df_trades['created_at'].iloc[-1]) if not df_trades.empty else "")
+    return _indice_pnl(user, versao_dados(user), assinatura, df_trades)
+
+# PostgREST corta respostas em 1000 linhas por padrão (max-rows do projeto)
+TAMANHO_PAGINA = 1000
+
+def _filtrar_trades(q, user, grupo, conta_id, d_inicio, d_fim, desde=None):
+    q = q.eq("usuario", user)
+    if desde is not None: q = q.gte("created_at", desde)
+    if grupo: q = q.eq("grupo_vinculo", grupo)
+    if conta_id is not None: q = q.eq("conta_id", conta_id)
+    if d_inicio: q = q.gte("data", str(d_inicio))
+    if d_fim: q = q.lte("data", str(d_fim))
+    return q
+
+def _colunas_keyset(colunas):
+    """Garante created_at e id na projeção (são a chave da paginação)"""
+    if colunas.strip() == "*": return colunas
+    lista = [c.strip() for c in colunas.split(",")]
+    for chave in ("created_at", "id"):
+        if chave not in lista: lista.append(chave)
+    return ", ".join(lista)
+
+def _iter_paginas(tabela, filtrar, colunas="*", tamanho_pagina=TAMANHO_PAGINA, contagem=None):
+    """
+    Gera páginas de `tabela` ordenadas por (created_at, id) usando keyset pagination.
+
+    Cada página pede só as linhas depois da última chave vista, então o corte de
+    linhas por resposta do PostgREST nunca trunca o histórico. A primeira página
+    pede também a contagem exata; o fim é detectado por ela (e não por uma página
+    curta), o que continua correto se o max-rows do servidor for menor que
+    `tamanho_pagina`. Se `contagem` for um dict, recebe contagem["total"].
+
+    Yields:
+        list[dict]: Linhas cruas da página (no máximo `tamanho_pagina`)
+    """
+    sb = get_supabase()
+    colunas = _colunas_keyset(colunas)
+    total = None
+    recebidas = 0
+    ultima = None
+    while True:
+        q = sb.table(tabela).select(colunas, count="exact" if ultima is None else None)
+        q = filtrar(q)
+        if ultima is not None:
+            ts, id_ = ultima
+            q = q.or_(f'created_at.gt."{ts}",and(created_at.eq."{ts}",id.gt."{id_}")')
+        res = _executar(q.order("created_at").order("id").limit(tamanho_pagina), tabela)
+        if ultima is None:
+            total = res.count
+            if contagem is not None: contagem["total"] = total
+        pagina = res.data or []
+        if not pagina: return
+        recebidas += len(pagina)
+        yield pagina
+        if total is not None and recebidas >= total: return
+        if total is None and len(pagina) < tamanho_pagina: return
+        ultima = (pagina[-1]["created_at"], pagina[-1]["id"])
+
+def _buscar_tudo(tabela, filtrar, colunas="*", tamanho_pagina=TAMANHO_PAGINA):
+    """Junta as páginas em uma lista e confere com a contagem do servidor"""
+    contagem = {}
+    linhas = []
+    for pagina in _iter_paginas(tabela, filtrar, colunas, tamanho_pagina, contagem):
+        linhas.extend(pagina)
+    
+    # Conferência: o servidor tem mais linhas do que recebemos?
+    esperado = contagem.get("total")
+    if esperado is not None and len(linhas) < esperado:
+        st.warning(f"⚠️ Histórico incompleto ({tabela}): {len(linhas):,} de {esperado:,} linhas carregadas.")
+    return linhas
+
+def iter_trades_paginas(user, grupo=None, conta_id=None, d_inicio=None, d_fim=None, colunas="*", tamanho_pagina=TAMANHO_PAGINA, contagem=None, desde=None):
+    """Páginas de trades do usuário com os filtros no servidor (ver _iter_paginas)"""
+    filtrar = lambda q: _filtrar_trades(q, user, grupo, conta_id, d_inicio, d_fim, desde)
+    yield from _iter_paginas("trades", filtrar, colunas, tamanho_pagina, contagem)
+
+def query_trades(user, grupo=None, conta_id=None, d_inicio=None, d_fim=None, colunas="*", tamanho_pagina=TAMANHO_PAGINA, desde=None):
+    """
+    Busca os trades de um usuário com os filtros aplicados no banco.
+
+    Args:
+        user: Usuário dono dos trades (sempre filtrado no servidor)
+        grupo: grupo_vinculo (None = todos)
+        conta_id: Conta específica (None = todas)
+        d_inicio, d_fim: Intervalo de datas inclusivo sobre a coluna `data`
+        colunas: Projeção do select (use as constantes COLUNAS_TRADES_*)
+        tamanho_pagina: Linhas por requisição da paginação
+        desde: Só trades com created_at >= desde (ISO)
+
+    Returns:
+        DataFrame tipado com o histórico completo (vazio em caso de erro)
+    """
+    try: return _buscar_trades(user, grupo, conta_id, d_inicio, d_fim, colunas, tamanho_pagina, desde)
     except: return pd.DataFrame()
 
-def load_contas(user):
-    try:
-        res = supabase.table("contas_config").select("*").eq("usuario", user).execute()
-        df = pd.DataFrame(res.data)
-        if not df.empty:
-            df['saldo_inicial'] = pd.to_numeric(df['saldo_inicial'], errors='coerce').fillna(0.0)
-            df['pico_previo'] = pd.to_numeric(df['pico_previo'], errors='coerce').fillna(0.0)
-        return df
+def _buscar_trades(user, grupo=None, conta_id=None, d_inicio=None, d_fim=None, colunas="*", tamanho_pagina=TAMANHO_PAGINA, desde=None):
+    """query_trades sem engolir erro: o cache de sync não pode confundir falha com histórico vazio"""
+    filtrar = lambda q: _filtrar_trades(q, user, grupo, conta_id, d_inicio, d_fim, desde)
+    return _tipar_trades(pd.DataFrame(_buscar_tudo("trades", filtrar, colunas, tamanho_pagina)))
+
+def query_trades_sem_operacao(user=None, colunas="*"):
+    """Registros antigos (operacao_id nulo), crus, de um usuário ou de todos - usado pelo backfill"""
+    def filtrar(q):
+        q = q.is_("operacao_id", "null")
+        return q.eq("usuario", user) if user else q
+    return _buscar_tudo("trades", filtrar, colunas)
+
+def query_ajustes(user, desde=None):
+    """Ajustes manuais do usuário (paginado, opcionalmente só a partir de `desde`)"""
+    try: return _buscar_ajustes(user, desde)
     except: return pd.DataFrame()
 
-def load_grupos(user):
+def _buscar_ajustes(user, desde=None):
+    """query_ajustes sem engolir erro (usado pelo cache de sync)"""
+    def filtrar(q):
+        q = q.eq("usuario", user)
+        return q.gte("created_at", desde) if desde is not None else q
+    return tipar("ajustes_manuais", pd.DataFrame(_buscar_tudo("ajustes_manuais", filtrar)))
+
+def _contar(tabela, user):
+    """Total de linhas do usuário no servidor (só a contagem, sem baixar dados)"""
     try:
-        res = supabase.table("grupos_config").select("*").eq("usuario", user).execute()
-        return pd.DataFrame(res.data)
-    except: return pd.DataFrame()
+        res = _executar(get_supabase().table(tabela).select("id", count="exact").eq("usuario", user).limit(1), tabela)
+        return res.count
+    except: return None
+
+# --- SINCRONIZAÇÃO INCREMENTAL (CACHE POR USUÁRIO NA SESSÃO + DISCO OPCIONAL) ---
+# A tabela trades não tem updated_at: inserts chegam pela marca d'água de created_at,
+# e as alterações feitas pelo app (delete, observações, troca de grupo) corrigem o
+# cache pelas funções abaixo. Escritas de outra sessão do mesmo usuário (contadas por
+# tabela em registrar_escrita) forçam um sync completo; alterações feitas fora do app
+# aparecem no resync periódico ou na conferência de contagem ao abrir o cache do disco.
+# Falha de rede mantém o que já estava em memória/disco, nunca um histórico vazio.
+JANELA_SOBREPOSICAO = pd.Timedelta(seconds=5)   # cobre commits fora de ordem
+RESYNC_COMPLETO_SEG = 600
+
+def _cache_sync():
+    return st.session_state.setdefault("trades_cache", {})
+
+def _trava_sync(chave):
+    """Trava de uma entrada do cache de sync (dict.setdefault é atômico, serve entre threads)"""
+    return st.session_state.setdefault("trades_cache_travas", {}).setdefault(chave, threading.RLock())
+
+def _merge_por_id(base, novos):
+    """Junta linhas novas ao cache, a versão mais recente de cada id prevalece"""
+    if novos.empty: return base
+    if base.empty: return novos
+    df = pd.concat([base, novos], ignore_index=True)
+    df = df.drop_duplicates(subset='id', keep='last')
+    return df.sort_values(['created_at', 'id']).reset_index(drop=True)
+
+def _marca(df):
+    return df['created_at'].max() if not df.empty and 'created_at' in df.columns else None
+
+def _sincronizar(user, tabela, colunas, buscar):
+    """
+    Mantém o histórico de `tabela` do usuário em memória entre reruns.
+
+    A primeira chamada da sessão parte do cache em disco (se ligado) ou baixa tudo;
+    as seguintes pedem só linhas com created_at a partir da maior marca vista (menos
+    uma pequena janela) e fazem merge por id. `buscar(desde)` retorna o DataFrame tipado.
+    """
+    return _entrada_sincronizada(user, tabela, colunas, buscar)["df"].copy()
+
+def _entrada_sincronizada(user, tabela, colunas, buscar):
+    """Entrada do cache de sync (df, marca, rollup...) já atualizada"""
+    cache = _cache_sync()
+    chave = (user, tabela, colunas)
+    # Busca, troca no rollup e df novo acontecem juntos: duas threads da sessão
+    # (prefetch + tela) no mesmo sync somariam os registros novos duas vezes no rollup
+    with _trava_sync(chave):
+        nome_disco = f"{tabela}|{colunas}"
+        entrada = cache.get(chave)
+        agora = time.time()
+        mudou = False
+        versao = versao_dados(user)
+    
+        # Nada foi escrito para o usuário desde um sync recente: responde da memória, sem rede
+        if entrada is not None and entrada.get("versao") == versao and agora - entrada["ultimo_sync"] < TTL_LEITURA_SEG:
+            return entrada
+    
+        # Partida a frio: tenta o disco antes da rede
+        if entrada is None and cache_local.ativo():
+            df_disco = cache_local.ler(user, nome_disco)
+            if df_disco is not None:
+                entrada = {"df": _tipar_disco(tabela, df_disco), "sync_completo": agora, "marca": None, "conferir": True}
+                entrada["marca"] = _marca(entrada["df"])
+    
+        # Delete/troca de grupo feitos em outra sessão não mudam created_at: só um sync completo pega
+        externas = entrada is not None and "escritas" in entrada and escritas_externas(user, tabela, entrada["escritas"]) > 0
+        referencia = _referencia_escritas(user, tabela)
+        try:
+            if entrada is None or externas or agora - entrada["sync_completo"] > RESYNC_COMPLETO_SEG:
+                entrada = {"df": buscar(None), "sync_completo": agora}
+                mudou = True
+            else:
+                marca = entrada.get("marca")
+                desde = (marca - JANELA_SOBREPOSICAO).isoformat() if marca is not None else None
+                novos = buscar(desde)
+                if not novos.empty:
+                    if tabela == "trades":
+                        _rollup_trocar(entrada, entrada["df"][entrada["df"]['id'].isin(novos['id'])], novos)
+                    entrada["df"] = _merge_por_id(entrada["df"], novos)
+                    mudou = True
+            
+                # Veio do disco: se a contagem não bate, algo foi apagado por fora → baixa tudo
+                if entrada.pop("conferir", False):
+                    total = _contar(tabela, user)
+                    if total is not None and total != len(entrada["df"]):
+                        entrada = {"df": buscar(None), "sync_completo": agora}
+                        mudou = True
+        except Exception as e:
+            # Falha de rede não vira histórico vazio: segue com o que já havia (memória ou disco),
+            # sem marcar como sincronizado (o próximo rerun tenta de novo) e sem tocar no disco
+            log.warning("Sync de %s falhou (%s): %s", tabela, user, e)
+            anterior = cache.get(chave) or entrada
+            return anterior if anterior is not None else {"df": pd.DataFrame(), "falhou": True}
+    
+        entrada["marca"] = _marca(entrada["df"])
+        entrada["ultimo_sync"] = agora
+        entrada["versao"] = versao
+        entrada["escritas"] = referencia
+        entrada["nome_disco"] = nome_disco
+        cache[chave] = entrada
+        if mudou and cache_local.ativo():
+            cache_local.gravar(user, nome_disco, entrada["df"])
+        return entrada
+
+def _tipar_disco(tabela, df):
+    """Parquet já guarda datas e números; só normaliza colunas vazias que voltam como NaN"""
+    if tabela == "trades" and 'conta_id' in df.columns:
+        df['conta_id'] = df['conta_id'].astype(object).where(df['conta_id'].notna(), None)
+    return df
+
+def sync_trades(user, colunas="*"):
+    """Histórico completo de trades do usuário via cache incremental (cópia, pode alterar)"""
+    return _sincronizar(user, "trades", colunas, lambda desde: _buscar_trades(user, colunas=colunas, desde=desde))
+
+def sync_ajustes(user):
+    """Ajustes manuais do usuário via cache incremental"""
+    return _sincronizar(user, "ajustes_manuais", "*", lambda desde: _buscar_ajustes(user, desde=desde))
+
+def _rollup(chave, entrada):
+    """DailyRollup da entrada de trades: montado na primeira leitura, depois só incremental"""
+    with _trava_sync(chave):
+        if "rollup" not in entrada:
+            entrada["rollup"] = DailyRollup.build(entrada["df"])
+        return entrada["rollup"]
+
+def _rollup_trocar(entrada, antigos, novos):
+    """Tira do rollup a versão antiga dos registros e soma a nova (se já montado)"""
+    if "rollup" in entrada:
+        entrada["rollup"].aplicar(antigos, -1).aplicar(novos, 1)
+
+def rollup_trades(user, colunas=None):
+    """
+    Rollup diário (grupo, conta, dia) dos trades do usuário, mantido com o cache de sync.
+
+    Sem `colunas`, usa a projeção já sincronizada na sessão (ou None se a sessão
+    ainda não carregou trades). Não alterar: é o objeto do cache.
+    """
+    if colunas is None:
+        existentes = [c for (u, t, c) in _cache_sync() if u == user and t == "trades"]
+        if not existentes: return None
+        colunas = existentes[0]
+    entrada = _entrada_sincronizada(user, "trades", colunas, lambda desde: _buscar_trades(user, colunas=colunas, desde=desde))
+    return _rollup((user, "trades", colunas), entrada)
+
+def _entradas_trades(user):
+    return [(c, e) for c, e in list(_cache_sync().items()) if c[0] == user and c[1] == "trades"]
+
+def _persistir(user, entrada):
+    if cache_local.ativo() and "nome_disco" in entrada:
+        cache_local.gravar(user, entrada["nome_disco"], entrada["df"])
+
+def cache_trades_remover(user, ids):
+    """Tira do cache trades deletados pelo app"""
+    ids = set(ids)
+    _limpar_memo("trades")
+    for chave, e in _entradas_trades(user):
+        with _trava_sync(chave):
+            if not e["df"].empty:
+                removidos = e["df"]['id'].isin(ids)
+                _rollup_trocar(e, e["df"][removidos], None)
+                e["df"] = e["df"][~removidos].reset_index(drop=True)
+                _persistir(user, e)
+
+def cache_trades_atualizar(user, campos, coluna="id", valor=None):
+    """Aplica no cache um update feito no banco (ex: observacoes por id, grupo_vinculo por conta_id)"""
+    _limpar_memo("trades")
+    for chave, e in _entradas_trades(user):
+        with _trava_sync(chave):
+            df = e["df"]
+            if df.empty or coluna not in df.columns: continue
+            mask = df[coluna] == valor
+            if not mask.any(): continue
+            antigos = df[mask].copy()
+            for campo, novo in campos.items():
+                if campo in df.columns: df.loc[mask, campo] = novo
+            _rollup_trocar(e, antigos, df[mask])
+            _persistir(user, e)
+
+def cache_trades_invalidar(user=None):
+    """Descarta o cache (de um usuário ou de todos); o próximo sync baixa tudo"""
+    _limpar_memo("trades", "ajustes_manuais")
+    cache = _cache_sync()
+    for chave in [k for k in cache if user is None or k[0] == user]:
+        e = cache.pop(chave)
+        if cache_local.ativo() and "nome_disco" in e:
+            cache_local.apagar(chave[0], e["nome_disco"])
+
+# --- 5. LOADERS (USADOS POR TODAS AS TELAS) ---
+def load_trades(user, colunas="*"):
+    df = sync_trades(user, colunas)
+    if colunas == "*" and not df.empty and 'comportamento' not in df.columns: df['comportamento'] = 'Normal'
+    return df
+
+def load_ajustes(user):
+    """Ajustes manuais (taxas, slippage, etc)"""
+    return sync_ajustes(user)
+
+def load_contas(user):
+    def carregar():
+        try:
+            res = _executar(get_supabase().table("contas_config").select("*").eq("usuario", user), "contas_config")
+            return tipar("contas_config", pd.DataFrame(res.data))
+        except: return pd.DataFrame()
+    return _cacheado("contas_config", user, carregar)
+
+def load_grupos(user):
+    def carregar():
+        try:
+            res = _executar(get_supabase().table("grupos_config").select("*").eq("usuario", user), "grupos_config")
+            return pd.DataFrame(res.data)
+        except: return pd.DataFrame()
+    return _cacheado("grupos_config", user, carregar)
 
 def load_atms():
+    """ATMs por nome, em ordem alfabética"""
+    def carregar():
+        try:
+            res = _executar(get_supabase().table("atm_configs").select("*").order("nome"), "atm_configs")
+            return {item['nome']: item for item in res.data}
+        except: return {}
+    return _cacheado("atm_configs", None, carregar)
+
+def load_metas(user):
+    """Configuração de metas por grupo: {grupo_nome: registro}"""
+    def carregar():
+        try:
+            res = _executar(get_supabase().table("metas_config").select("*").eq("usuario", user), "metas_config")
+            return {m['grupo_nome']: m for m in res.data} if res.data else {}
+        except: return {}
+    return _cacheado("metas_config", user, carregar)
+
+# --- 6. ESCRITA DE TRADES ---
+def inserir_trades(linhas):
+    """
+    Grava todos os registros de uma operação (1 por conta) em um único INSERT.
+
+    O PostgREST executa o array como um só statement: ou todas as contas
+    recebem o trade ou nenhuma (grupo nunca fica replicado pela metade).
+    Erros sobem para a tela tratar.
+
+    Returns:
+        float: Tempo do envio em ms (também acumulado em get_envio_stats)
+    """
+    if not linhas: return 0.0
+    t0 = time.perf_counter()
+    _executar(get_supabase().table("trades").insert(linhas), "trades (insert)")
+    ms = (time.perf_counter() - t0) * 1000
+    for usuario in {l.get("usuario") for l in linhas}: registrar_escrita("trades", user=usuario)
+    stats = st.session_state.setdefault("envio_stats", {})
+    s = stats.setdefault(len(linhas), {"envios": 0, "ms": 0.0, "max_ms": 0.0})
+    s["envios"] += 1
+    s["ms"] += ms
+    s["max_ms"] = max(s["max_ms"], ms)
+    return ms
+
+def get_envio_stats():
+    """Tempo de gravação de trades por número de contas: {n_contas: {envios, ms, max_ms}}"""
+    return st.session_state.get("envio_stats", {})
+
+# --- 7. STORAGE (EVIDÊNCIAS) ---
+UPLOAD_WORKERS = 4
+UPLOAD_TENTATIVAS = 3
+
+def _upload_com_retry(sb, bucket, nome, conteudo):
+    """Sobe um arquivo com backoff exponencial; o nome se subiu, None se não"""
+    for tentativa in range(UPLOAD_TENTATIVAS):
+        try:
+            sb.storage.from_(bucket).upload(nome, conteudo)
+            return nome
+        except Exception as e:
+            log.warning("Upload %s falhou (tentativa %d/%d): %s", nome, tentativa + 1, UPLOAD_TENTATIVAS, e)
+            if tentativa < UPLOAD_TENTATIVAS - 1: time.sleep(0.5 * 2 ** tentativa)
+    return None
+
+def iniciar_uploads(conteudos, bucket="prints"):
+    """
+    Dispara os uploads em paralelo (pool limitado) e retorna na hora.
+
+    A URL pública é montada só a partir do nome do arquivo, então já pode ir
+    para o registro do trade enquanto os arquivos ainda estão subindo.
+
+    Args:
+        conteudos: Lista de bytes (ler os arquivos na thread do Streamlit)
+
+    Returns:
+        tuple: (urls na ordem original, futures com o nome do arquivo ou None de cada upload)
+    """
+    if not conteudos: return [], []
+    sb = get_supabase()
+    nomes = [f"{uuid.uuid4()}.png" for _ in conteudos]
+    urls = [sb.storage.from_(bucket).get_public_url(n) for n in nomes]
+    executor = ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(conteudos)))
+    futuros = [executor.submit(_upload_com_retry, sb, bucket, n, c) for n, c in zip(nomes, conteudos)]
+    executor.shutdown(wait=False)
+    return urls, futuros
+
+def concluir_uploads(urls, futuros):
+    """Espera os uploads e devolve só as URLs que subiram (mesma ordem)"""
+    return [u for u, f in zip(urls, futuros) if f.result()]
+
+def descartar_uploads(futuros, bucket="prints"):
+    """
+    Desfaz os uploads de um trade que não foi gravado: cancela os que ainda
+    estão na fila, espera os que já começaram e apaga do bucket os que subiram.
+
+    Returns:
+        int: Arquivos apagados
+    """
+    for f in futuros: f.cancel()
+    nomes = [f.result() for f in futuros if not f.cancelled()]
+    nomes = [n for n in nomes if n]
+    if not nomes: return 0
     try:
-        res = supabase.table("atm_configs").select("*").execute()
-        return {item['nome']: item for item in res.data}
-    except: return {}
+        get_supabase().storage.from_(bucket).remove(nomes)
+        return len(nomes)
+    except Exception as e:
+        log.warning("Não foi possível apagar %d print(s) órfão(s) de %s: %s", len(nomes), bucket, e)
+        return 0
 
 # --- NOVO: PERSISTÊNCIA DE HWM ---
 def update_hwm(conta_id, novo_pico):
     """Atualiza o Pico Histórico no Banco para garantir o Trailing Stop"""
     try:
-        supabase.table("contas_config").update({"pico_previo": novo_pico}).eq("id", conta_id).execute()
+        res = get_supabase().table("contas_config").update({"pico_previo": novo_pico}).eq("id", conta_id).execute()
+        registrar_escrita("contas_config", user=res.data[0].get("usuario") if res.data else None)
         return True
     except Exception as e:
         print(f"Erro ao salvar HWM: {e}")
         return False
+
+# Um único worker: os lotes de HWM chegam ao banco na ordem em que foram gerados
+_gravador_hwm = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hwm")
+
+def salvar_hwms(user, df_contas, novos_picos):
+    """
+    Persiste vários HWMs em contas_config, fora da thread de render.
+
+    Só pico_previo é gravado, com update por id (nunca insere: conta apagada
+    em outra aba continua apagada, e edições de status/fase/grupo não são
+    revertidas) e só se o pico no banco ainda for menor. Quando o envio
+    termina, a versão de dados do usuário sobe e o próximo load_contas já traz
+    os picos novos; até lá, topos já enviados nesta sessão não são reenviados.
+    Falhas ficam em get_falhas_hwm() para a tela avisar no próximo render.
+
+    Args:
+        user: Dono das contas (chave do cache de load_contas)
+        df_contas: DataFrame de contas (como vem de load_contas)
+        novos_picos: dict {conta_id: novo pico}
+
+    Returns:
+        int: Quantidade de contas com topo novo enviadas
+    """
+    enviados = st.session_state.setdefault("hwm_enviados", {})
+    falhas = st.session_state.setdefault("hwm_falhas", [])
+    novos_picos = {i: float(p) for i, p in novos_picos.items() if p > enviados.get(i, float("-inf"))}
+    if not novos_picos or df_contas.empty: return 0
+    ids = set(df_contas['id'].tolist())
+    picos = {i: p for i, p in novos_picos.items() if i in ids}
+    if not picos: return 0
+
+    sb = get_supabase()
+    ctx = get_script_run_ctx()
+    def enviar():
+        # O worker é compartilhado entre sessões: anexa o contexto de quem enviou
+        add_script_run_ctx(threading.current_thread(), ctx)
+        gravou = False
+        for conta_id, pico in picos.items():
+            try:
+                res = sb.table("contas_config").update({"pico_previo": pico}).eq("id", conta_id).lt("pico_previo", pico).execute()
+                if res.data: gravou = True  # vazio = banco já tinha pico maior (ou conta apagada)
+            except Exception as e:
+                enviados.pop(conta_id, None)
+                falhas.append(f"Conta {conta_id}: {e}")
+        if gravou: _incrementar_versao(user)
+    enviados.update(picos)
+    _gravador_hwm.submit(enviar)
+    return len(picos)
+
+def get_falhas_hwm():
+    """Falhas de gravação de HWM desde a última leitura (a lista é esvaziada)"""
+    falhas = st.session_state.get("hwm_falhas") or []
+    pendentes = list(falhas)
+    del falhas[:len(pendentes)]
+    return pendentes
+
+# --- 9. PREFETCH CONCORRENTE ---
+PREFETCH_WORKERS = 4
+
+def carregar_em_paralelo(tarefas):
+    """
+    Executa leituras independentes ao mesmo tempo e devolve os resultados já tipados.
+
+    As threads recebem o contexto do script do Streamlit, então os loaders usam
+    o cache e as estatísticas da sessão normalmente. O tempo do caminho crítico
+    (relógio) e a soma dos tempos de cada leitura ficam em get_prefetch_stats()
+    (painel do admin) e vão para o log do módulo em DEBUG.
+
+    Args:
+        tarefas: dict {nome: função sem argumentos}
+
+    Returns:
+        dict: {nome: resultado}
+    """
+    # Estruturas da sessão criadas antes, para as threads não disputarem o setdefault
+    _cache_sync(); _versoes_dados(); st.session_state.setdefault("trades_cache_travas", {})
+    st.session_state.setdefault("db_stats", {})
+
+    ctx = get_script_run_ctx()
+    tempos = {}
+    def medir(nome, funcao):
+        t0 = time.perf_counter()
+        try: return funcao()
+        finally: tempos[nome] = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(PREFETCH_WORKERS, max(1, len(tarefas))),
+                            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)) as pool:
+        futuros = {nome: pool.submit(medir, nome, f) for nome, f in tarefas.items()}
+        resultados = {nome: f.result() for nome, f in futuros.items()}
+    critico = (time.perf_counter() - t0) * 1000
+
+    soma = sum(tempos.values())
+    st.session_state["prefetch_stats"] = {"critico_ms": critico, "soma_ms": soma, "tarefas": dict(tempos)}
+    if log.isEnabledFor(logging.DEBUG):
+        detalhe = ", ".join(f"{n} {ms:.0f}" for n, ms in tempos.items())
+        log.debug("prefetch: caminho crítico %.0f ms · soma das leituras %.0f ms (%s)", critico, soma, detalhe)
+    return resultados
+
+def get_prefetch_stats():
+    """Último prefetch da sessão: {critico_ms, soma_ms, tarefas: {nome: ms}}"""
+    return st.session_state.get("prefetch_stats")
@@ -325,3 +325,126 @@ class PositionSizing:
             kelly_safe = max(0.0, kelly_full / 4.0)
 
         return lote_min, lote_max, kelly_safe
+
+
+class OperationGrouping:
+    """
+    Chave de operação vetorizada.
+    Trades replicados (1 registro por conta) viram 1 operação.
+    
+    REGRA (a mesma do antigo criar_chave_operacao por linha):
+    - Com operacao_id: a própria operacao_id
+    - Sem operacao_id (trades antigos): "data_ativo_resultado_grupo_minuto",
+      com o minuto de created_at (ou a data, se created_at for nulo)
+    """
+    
+    @staticmethod
+    def _textos(serie, formatar=str):
+        """
+        Aplica `formatar` uma vez por valor distinto (factorize) em vez de por linha.
+        
+        Returns:
+            tuple: (array de textos, máscara de nulos) - nulos ficam como None
+        """
+        codigos, unicos = pd.factorize(serie)
+        textos = np.array([formatar(v) for v in unicos] + [None], dtype=object)
+        return textos[codigos], codigos == -1
+
+    @staticmethod
+    def _coluna(df, coluna):
+        """str() de cada valor, idêntico ao f-string por linha (inclusive nulos e -0.0)"""
+        if coluna not in df.columns:
+            return np.full(len(df), "", dtype=object)
+        serie = df[coluna]
+        textos, nulos = OperationGrouping._textos(serie)
+        # factorize junta None/NaN e 0.0/-0.0: esses casos saem do valor original
+        refazer = nulos | ((serie == 0).to_numpy() if pd.api.types.is_float_dtype(serie) else False)
+        if np.any(refazer):
+            textos[refazer] = [str(v) for v in serie.to_numpy(dtype=object)[refazer]]
+        return textos
+
+    @staticmethod
+    def build_keys(df):
+        """
+        Monta a chave de operação de cada registro.
+        
+        Args:
+            df: DataFrame de trades (operacao_id, data, ativo, resultado, grupo_vinculo, created_at)
+        
+        Returns:
+            pd.Series: Chave (str) com o mesmo índice de df
+        """
+        n = len(df)
+        chaves = np.empty(n, dtype=object)
+        if n == 0:
+            return pd.Series(chaves, index=df.index, dtype=object)
+        
+        tem_op = df['operacao_id'].notna().to_numpy() if 'operacao_id' in df.columns else np.zeros(n, dtype=bool)
+        if tem_op.any():
+            chaves[tem_op] = OperationGrouping._textos(df['operacao_id'][tem_op])[0]
+        
+        antigos = ~tem_op
+        if antigos.any():
+            legado = df[antigos]
+            data = OperationGrouping._coluna(legado, 'data')
+            
+            # Minuto de created_at (str()[:16] por valor distinto); sem created_at usa a data
+            if 'created_at' in legado.columns:
+                minuto, sem_ts = OperationGrouping._textos(legado['created_at'], lambda v: str(v)[:16])
+                minuto[sem_ts] = data[sem_ts]
+            else:
+                minuto = np.full(len(legado), "", dtype=object)
+            
+            chaves[antigos] = (data + "_" + OperationGrouping._coluna(legado, 'ativo')
+                               + "_" + OperationGrouping._coluna(legado, 'resultado')
+                               + "_" + OperationGrouping._coluna(legado, 'grupo_vinculo')
+                               + "_" + minuto)
+        
+        return pd.Series(chaves, index=df.index, dtype=object)
+
+
+class AccountLedger:
+    """
+    Saldo de todas as contas numa passada só.
+    
+    Cada trade/ajuste tem o conta_id da conta a que pertence (trades replicados
+    geram um registro por conta), então o lucro de cada conta é um groupby
+    por conta_id, em vez de filtrar trades e ajustes uma vez por conta.
+    """
+    
+    @staticmethod
+    def _somas(df, coluna):
+        """Soma de `coluna` por conta_id (vazio se a tabela não tiver as colunas)"""
+        if df is None or df.empty or 'conta_id' not in df.columns or coluna not in df.columns:
+            return pd.Series(dtype=float)
+        return df.groupby('conta_id')[coluna].sum()
+
+    @staticmethod
+    def balances(df_contas, df_trades, df_ajustes=None):
+        """
+        Calcula o lucro e o saldo atual de cada conta.
+        
+        Args:
+            df_contas: DataFrame de contas (id, saldo_inicial)
+            df_trades: DataFrame de trades (conta_id, resultado)
+            df_ajustes: DataFrame de ajustes manuais (conta_id, valor); None = sem ajustes
+        
+        Returns:
+            pd.DataFrame: Indexado pelo id da conta, com lucro_trades, lucro_ajustes,
+            lucro (trades + ajustes) e saldo (saldo_inicial + lucro)
+        """
+        colunas = ['lucro_trades', 'lucro_ajustes', 'lucro', 'saldo']
+        if df_contas is None or df_contas.empty:
+            return pd.DataFrame(columns=colunas, dtype=float)
+        
+        ids = df_contas['id']
+        lucro_trades = ids.map(AccountLedger._somas(df_trades, 'resultado')).fillna(0.0).astype(float)
+        lucro_ajustes = ids.map(AccountLedger._somas(df_ajustes, 'valor')).fillna(0.0).astype(float)
+        
+        ledger = pd.DataFrame({
+            'lucro_trades': lucro_trades.to_numpy(),
+            'lucro_ajustes': lucro_ajustes.to_numpy(),
+        }, index=pd.Index(ids.to_numpy(), name='conta_id'))
+        ledger['lucro'] = ledger['lucro_trades'] + ledger['lucro_ajustes']
+        ledger['saldo'] = df_contas['saldo_inicial'].astype(float).to_numpy() + ledger['lucro'].to_numpy()
+        return ledger
@@ -0,0 +1,186 @@
+import pandas as pd
+
+from modules.logic import ApexEngine, RiskEngine, PositionSizing, AccountLedger
+from modules.analytics import MetricsAccumulator, DrawdownEngine, PnLIndex, DailyRollup
+
+# Métricas do dashboard sem Streamlit.
+# DashboardMetrics.compute recebe os DataFrames tipados (trades e contas) e os
+# filtros da tela e devolve um dict com tudo o que os cards e gráficos mostram.
+# A tela só desenha; o mesmo resultado serve para cache, benchmark e testes.
+
+MULTIPLIERS = {"NQ": 20, "MNQ": 2, "ES": 50, "MES": 5}
+
+# Saldo base de cada conta (o gráfico mostra o lucro acima disso)
+BASE_CONTA = 150000.0
+
+class DashboardMetrics:
+    """
+    KPIs, sobrevivência, faixa de lote e séries dos gráficos do dashboard.
+
+    Seções do resultado:
+        filtros, contas, desempenho, medias, tecnica, sobrevivencia, lote,
+        novos_picos (topos a salvar) e series (curva, operacoes, contexto,
+        drawdowns, diario, semanal, dia_semana)
+    """
+
+    DIAS_PT = {'Monday': 'Seg', 'Tuesday': 'Ter', 'Wednesday': 'Qua', 'Thursday': 'Qui',
+               'Friday': 'Sex', 'Saturday': 'Sab', 'Sunday': 'Dom'}
+    ORDEM_SEMANA = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sab', 'Dom']
+
+    @staticmethod
+    def contas_do_grupo(df_contas, grupo=None):
+        """Contas do grupo (None = todas)"""
+        if df_contas is None or df_contas.empty:
+            return pd.DataFrame()
+        return df_contas[df_contas['grupo_nome'] == grupo] if grupo is not None else df_contas
+
+    @staticmethod
+    def _risco_contas(contas_alvo, trades_full_risk):
+        """Buffer somado das contas ativas e os topos novos (saldo acima do pico salvo)"""
+        total_buffer = 0.0; contas_ativas = 0; novos_picos = {}
+        if contas_alvo.empty:
+            return total_buffer, contas_ativas, novos_picos
+
+        # Saldo real de cada conta: um groupby por conta_id (cada conta tem seus próprios trades)
+        ledger = AccountLedger.balances(contas_alvo, trades_full_risk)
+        for _, conta in contas_alvo.iterrows():
+            if conta['status_conta'] == 'Ativa':
+                saldo_atual_est = ledger.at[conta['id'], 'saldo']
+                hwm_dinamico = max(float(conta['pico_previo']), saldo_atual_est)
+                if hwm_dinamico > float(conta['pico_previo']):
+                    novos_picos[conta['id']] = hwm_dinamico
+                saude = ApexEngine.calculate_health(saldo_atual_est, hwm_dinamico, conta.get('fase_entrada', 'Fase 1'))
+                total_buffer += saude['buffer']; contas_ativas += 1
+        return total_buffer, contas_ativas, novos_picos
+
+    @staticmethod
+    def _curva(operacoes, contas_alvo):
+        """
+        Lucro acumulado por operação do período (líquido de todas as contas),
+        partindo do lucro inicial das contas. `seq` conta operações, a mesma
+        unidade das métricas móveis.
+        """
+        lucro_inicial = float((contas_alvo['saldo_inicial'] - BASE_CONTA).sum()) if not contas_alvo.empty else 0.0
+        if operacoes.empty:
+            return pd.DataFrame(columns=['created_at', 'seq', 'lucro_acumulado']), lucro_inicial
+        liquido = operacoes['liquido'] if 'liquido' in operacoes.columns else operacoes['resultado']
+        curva = pd.DataFrame({
+            'created_at': operacoes['created_at'].to_numpy(),
+            'seq': range(1, len(operacoes) + 1),
+            'lucro_acumulado': liquido.cumsum().to_numpy() + lucro_inicial,
+        })
+        return curva, lucro_inicial
+
+    @staticmethod
+    def _temporal(rollup, d_inicio, d_fim, grupo):
+        """Resultado por dia, por semana de trading e por dia da semana (do rollup)"""
+        if rollup is None:
+            vazio = pd.DataFrame()
+            return vazio, vazio, vazio
+        diario = rollup.diario(d_inicio, d_fim, grupo=grupo)
+        if diario.empty:
+            return diario, pd.DataFrame(), pd.DataFrame()
+        semanal = rollup.semanal(d_inicio, d_fim, grupo=grupo)
+        dia_pt = pd.to_datetime(diario['data']).dt.day_name().map(DashboardMetrics.DIAS_PT)
+        dia_semana = (diario.groupby(dia_pt)['resultado'].sum()
+                      .reindex(DashboardMetrics.ORDEM_SEMANA).rename_axis('dia_pt').reset_index())
+        return diario, semanal, dia_semana
+
+    @staticmethod
+    def compute(df_trades, df_contas, d_inicio=None, d_fim=None, grupo=None, conta=None, indice=None, rollup=None):
+        """
+        Calcula tudo o que o dashboard mostra para os filtros da tela.
+
+        Args:
+            df_trades: Trades tipados do usuário (projeção do dashboard)
+            df_contas: Contas tipadas do usuário
+            d_inicio, d_fim: Período inclusivo sobre `data` (None = sem limite)
+            grupo: Grupo selecionado (None = todos)
+            conta: conta_identificador para ver uma conta só (None = visão geral)
+            indice: PnLIndex já montado de df_trades (None = monta aqui)
+            rollup: DailyRollup de df_trades (None = monta aqui)
+
+        Returns:
+            dict: Uma seção por bloco da tela (ver docstring da classe)
+        """
+        if indice is None:
+            indice = PnLIndex.build(df_trades)
+        if rollup is None:
+            rollup = DailyRollup.build(df_trades)
+
+        contas_do_grupo = DashboardMetrics.contas_do_grupo(df_contas, grupo)
+        if conta is None or contas_do_grupo.empty:
+            contas_alvo = contas_do_grupo
+        else:
+            contas_alvo = contas_do_grupo[contas_do_grupo['conta_identificador'] == conta]
+
+        # Risco olha o histórico todo do grupo; métricas e gráficos, só o período
+        trades_full_risk = indice.periodo_registros(grupo=grupo)
+        trades_view = indice.periodo_registros(d_inicio, d_fim, grupo=grupo)
+        total_buffer, contas_ativas, novos_picos = DashboardMetrics._risco_contas(contas_alvo, trades_full_risk)
+
+        # Métricas por OPERAÇÃO (não por registro): uma linha por operação, em ordem de data,
+        # com o resultado de UMA conta e o líquido somado de todas as contas
+        operacoes = indice.periodo_operacoes(d_inicio, d_fim, grupo=grupo)
+        metricas = MetricsAccumulator.from_dict(indice.totais(d_inicio, d_fim, grupo=grupo)).summary()
+        max_dd = indice.drawdown(d_inicio, d_fim, grupo=grupo)['max_drawdown']
+        total_ops = metricas['total_operacoes']
+        win_rate, payoff = metricas['win_rate'], metricas['payoff']
+        avg_win, avg_loss = metricas['avg_win'], metricas['avg_loss']
+        pts_loss_medio_real = metricas['avg_pts_loss'] or 15.0
+        lote_medio = metricas['lote_medio']
+        ativo_ref = metricas['ativo_ref'] or "MNQ"
+
+        custo_stop_padrao = pts_loss_medio_real * (lote_medio if lote_medio > 0 else 1) * MULTIPLIERS.get(ativo_ref, 2)
+        vidas_u = RiskEngine.calculate_lives(total_buffer, custo_stop_padrao, contas_ativas)
+
+        # Para prob ruina, usa lista de resultados por OPERACAO
+        results_list_ops = operacoes['resultado'].tolist() if not operacoes.empty else []
+        prob_ruina = RiskEngine.calculate_ruin(win_rate, avg_win, avg_loss, total_buffer, trades_results=results_list_ops)
+
+        loss_rate_dec = (metricas['n_losses'] / total_ops) if total_ops > 0 else 0
+        edge_calc = ((win_rate / 100) * payoff) - loss_rate_dec
+
+        # Z-Score serial sobre os registros do período (cada conta conta)
+        results_list_filtered = trades_view['resultado'].tolist() if not trades_view.empty else []
+        z_serial = RiskEngine.calculate_z_score_serial(results_list_filtered)
+
+        # Lote calculado sobre o buffer de UMA conta (operações são replicadas)
+        buffer_por_conta = total_buffer / contas_ativas if contas_ativas > 0 else 5000  # Default $5k trailing
+        lote_min, lote_max, kelly_pct = PositionSizing.calculate_limits(win_rate, payoff, buffer_por_conta, custo_stop_padrao)
+
+        curva, lucro_inicial = DashboardMetrics._curva(operacoes, contas_alvo)
+        contexto = None
+        if not trades_view.empty and 'contexto' in trades_view.columns:
+            contexto = trades_view.groupby('contexto')['resultado'].sum().reset_index()
+        drawdowns = DrawdownEngine.analyze(operacoes['resultado'].to_numpy(), operacoes['created_at']) if not operacoes.empty else None
+        diario, semanal, dia_semana = DashboardMetrics._temporal(rollup, d_inicio, d_fim, grupo)
+
+        return {
+            "filtros": {"d_inicio": d_inicio, "d_fim": d_fim, "grupo": grupo, "conta": conta},
+            "contas": {"alvo": contas_alvo, "ativas": contas_ativas},
+            "desempenho": {
+                "net_profit": metricas['net_profit'], "pf": metricas['pf'], "win_rate": win_rate,
+                "n_wins": metricas['n_wins'], "n_losses": metricas['n_losses'],
+                "expectancy": metricas['expectancy'], "total_operacoes": total_ops,
+            },
+            "medias": {"avg_win": avg_win, "avg_loss": avg_loss, "payoff": payoff, "max_dd": max_dd},
+            "tecnica": {
+                "avg_pts_gain": metricas['avg_pts_gain'], "avg_pts_loss": pts_loss_medio_real,
+                "lote_medio": lote_medio, "total_operacoes": total_ops,
+            },
+            "sobrevivencia": {
+                "n_registros": len(results_list_filtered), "z_serial": z_serial, "edge": edge_calc,
+                "vidas": vidas_u, "custo_stop": custo_stop_padrao, "prob_ruina": prob_ruina,
+            },
+            "lote": {
+                "total_buffer": total_buffer, "buffer_por_conta": buffer_por_conta, "kelly_pct": kelly_pct,
+                "risco_financeiro": buffer_por_conta * kelly_pct, "lote_min": lote_min, "lote_max": lote_max,
+            },
+            "novos_picos": novos_picos,
+            "series": {
+                "curva": curva, "lucro_inicial": lucro_inicial, "operacoes": operacoes,
+                "contexto": contexto, "drawdowns": drawdowns,
+                "diario": diario, "semanal": semanal, "dia_semana": dia_semana,
+            },
+        }
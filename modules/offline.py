@@ -0,0 +1,389 @@
+import os
+import re
+import json
+import base64
+import bisect
+import mimetypes
+import threading
+from datetime import datetime, timezone
+
+from modules.cache_local import config
+
+# ============================================================
+# BACKEND OFFLINE
+# Substituto em memória do cliente Supabase, com o mesmo subconjunto
+# da API usado pelo app. Liga com OFFLINE = true no secrets.toml ou
+# APEX_OFFLINE=1 no ambiente (login padrão: admin / admin).
+# ============================================================
+
+# Upsert sem on_conflict e sem id: chave única de cada tabela no banco real
+CHAVES_NATURAIS = {
+    "metas_config": ("usuario", "grupo_nome"),
+    "checkin_diario": ("usuario", "data"),
+    "journaling": ("usuario", "data"),
+    "stops_dia": ("usuario", "data"),
+    "antitilt_config": ("usuario",),
+}
+
+# Pasta servida pelo Streamlit em app/static/ (enableStaticServing no config.toml): static/ ao lado do app.py
+PASTA_STATIC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+
+def ativo():
+    return str(config("OFFLINE", "")).lower() in ("1", "true", "sim", "yes")
+
+def criar_cliente():
+    """Cliente offline com o seed de OFFLINE_SEED (JSON {tabela: [linhas]}), se houver"""
+    cliente = OfflineClient(pasta_storage=config("OFFLINE_STORAGE", os.path.join(PASTA_STATIC, "offline")))
+    seed = config("OFFLINE_SEED")
+    if seed and os.path.exists(seed):
+        with open(seed, encoding="utf-8") as f:
+            for tabela, linhas in json.load(f).items():
+                cliente.carregar(tabela, linhas)
+    if not cliente.tabelas.get("users"):
+        cliente.carregar("users", [{"username": "admin", "password": "admin", "role": "admin"}])
+    return cliente
+
+# --- 1. VALORES ---
+def _json(o):
+    if hasattr(o, "item"): return o.item()          # numpy
+    if hasattr(o, "isoformat"): return o.isoformat()  # datas
+    return str(o)
+
+def _como_no_banco(linhas):
+    """Ida e volta por JSON, como no PostgREST: tipos simples e nenhuma referência compartilhada"""
+    return json.loads(json.dumps(linhas, default=_json))
+
+def _comparavel(v):
+    """Normaliza para comparar como o Postgres: número, timestamp/data ou texto"""
+    if isinstance(v, bool) or v is None: return v
+    if isinstance(v, (int, float)): return float(v)
+    s = str(v)
+    try: return float(s)
+    except ValueError: pass
+    if re.match(r"^\d{4}-\d{2}-\d{2}", s):
+        try:
+            d = datetime.fromisoformat(s)
+            return d if d.tzinfo else d.replace(tzinfo=timezone.utc)
+        except ValueError: pass
+    return s
+
+def _texto(v):
+    if v is None: return None
+    if isinstance(v, bool): return "true" if v else "false"
+    return str(v)
+
+OPERADORES = {
+    "eq": lambda a, b: a is not None and (_texto(a) == _texto(b) or _comparavel(a) == _comparavel(b)),
+    "neq": lambda a, b: a is not None and not (_texto(a) == _texto(b) or _comparavel(a) == _comparavel(b)),
+    "gt": lambda a, b: a is not None and _comparavel(a) > _comparavel(b),
+    "gte": lambda a, b: a is not None and _comparavel(a) >= _comparavel(b),
+    "lt": lambda a, b: a is not None and _comparavel(a) < _comparavel(b),
+    "lte": lambda a, b: a is not None and _comparavel(a) <= _comparavel(b),
+    "in": lambda a, b: a is not None and _texto(a) in {_texto(x) for x in b},
+    "is": lambda a, b: (a is None) if b in (None, "null") else (a is b),
+}
+
+# --- 2. FILTROS LÓGICOS (or_ / and() no formato do PostgREST) ---
+def _dividir(expr):
+    """Divide por vírgulas de nível zero (fora de parênteses e aspas)"""
+    partes, nivel, aspas, atual = [], 0, False, ""
+    for ch in expr:
+        if ch == '"': aspas = not aspas
+        elif not aspas and ch == "(": nivel += 1
+        elif not aspas and ch == ")": nivel -= 1
+        if ch == "," and nivel == 0 and not aspas:
+            partes.append(atual); atual = ""
+        else:
+            atual += ch
+    if atual: partes.append(atual)
+    return partes
+
+def _compilar(expr, juncao=any):
+    termos = []
+    for parte in _dividir(expr.strip()):
+        m = re.match(r"^(and|or)\((.*)\)$", parte)
+        if m:
+            termos.append(_compilar(m.group(2), all if m.group(1) == "and" else any))
+            continue
+        coluna, op, valor = parte.split(".", 2)
+        valor = valor[1:-1] if valor.startswith('"') and valor.endswith('"') else valor
+        termos.append(lambda r, c=coluna, o=op, v=valor: OPERADORES[o](r.get(c), v))
+    return lambda r: juncao(t(r) for t in termos)
+
+# --- 3. CONSULTAS ---
+CURSOR_KEYSET = re.compile(r'^created_at\.gt\."([^"]*)",and\(created_at\.eq\."([^"]*)",id\.gt\."([^"]*)"\)$')
+ORDEM_KEYSET = [("created_at", False), ("id", False)]
+
+class _Maximo:
+    """Maior que qualquer id: (t, MAXIMO) fica depois de todas as chaves com created_at == t"""
+    def __lt__(self, outro): return False
+    def __gt__(self, outro): return True
+MAXIMO = _Maximo()
+
+class Resposta:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class _Requisicao:
+    """Só o necessário para o memo da execução (database._assinatura) identificar a consulta"""
+    def __init__(self, http_method, path, params, headers):
+        self.http_method, self.path, self.params, self.headers = http_method, path, params, headers
+
+class Consulta:
+    def __init__(self, cliente, tabela):
+        self.cliente = cliente
+        self.tabela = tabela
+        self.operacao = "select"
+        self.colunas = "*"
+        self.contagem = None
+        self.payload = None
+        self.on_conflict = None
+        self.filtros = []
+        self.ordens = []
+        self.limite = None
+        self.params = []
+        self.cursor = None
+        self.piso = None
+
+    # Operações
+    def select(self, colunas="*", count=None):
+        self.colunas, self.contagem = colunas, count
+        self.params.append(f"select={colunas}")
+        return self
+
+    def insert(self, dados):
+        self.operacao, self.payload = "insert", dados
+        return self
+
+    def upsert(self, dados, on_conflict=None, **_):
+        self.operacao, self.payload, self.on_conflict = "upsert", dados, on_conflict
+        return self
+
+    def update(self, dados):
+        self.operacao, self.payload = "update", dados
+        return self
+
+    def delete(self):
+        self.operacao = "delete"
+        return self
+
+    # Filtros
+    def _filtro(self, op, coluna, valor):
+        if coluna == "created_at" and op in ("gt", "gte"):
+            self.piso = (op, _comparavel(valor))
+        self.filtros.append(lambda r: OPERADORES[op](r.get(coluna), valor))
+        self.params.append(f"{coluna}={op}.{valor}")
+        return self
+
+    def eq(self, coluna, valor): return self._filtro("eq", coluna, valor)
+    def neq(self, coluna, valor): return self._filtro("neq", coluna, valor)
+    def gt(self, coluna, valor): return self._filtro("gt", coluna, valor)
+    def gte(self, coluna, valor): return self._filtro("gte", coluna, valor)
+    def lt(self, coluna, valor): return self._filtro("lt", coluna, valor)
+    def lte(self, coluna, valor): return self._filtro("lte", coluna, valor)
+    def in_(self, coluna, valores): return self._filtro("in", coluna, list(valores))
+    def is_(self, coluna, valor): return self._filtro("is", coluna, valor)
+
+    def or_(self, expr):
+        # Cursor da paginação keyset (database._iter_paginas): vira busca binária no índice ordenado
+        m = CURSOR_KEYSET.match(expr)
+        if m and m.group(1) == m.group(2):
+            self.cursor = (_comparavel(m.group(1)), _comparavel(m.group(3)))
+        else:
+            self.filtros.append(_compilar(expr))
+        self.params.append(f"or=({expr})")
+        return self
+
+    def order(self, coluna, desc=False, **_):
+        self.ordens.append((coluna, desc))
+        self.params.append(f"order={coluna}.{'desc' if desc else 'asc'}")
+        return self
+
+    def limit(self, n, **_):
+        self.limite = n
+        self.params.append(f"limit={n}")
+        return self
+
+    @property
+    def request(self):
+        metodo = {"select": "GET", "insert": "POST", "upsert": "POST", "update": "PATCH", "delete": "DELETE"}[self.operacao]
+        headers = {"Prefer": f"count={self.contagem}" if self.contagem else ""}
+        return _Requisicao(metodo, f"/rest/v1/{self.tabela}", "&".join(self.params), headers)
+
+    def execute(self):
+        with self.cliente.lock:
+            if self.operacao != "select": self.cliente.alterou(self.tabela)
+            return getattr(self, f"_{self.operacao}")(self.cliente.tabelas.setdefault(self.tabela, []))
+
+    def _filtradas(self, linhas):
+        return [r for r in linhas if all(f(r) for f in self.filtros)]
+
+    def _select(self, linhas):
+        if self.ordens == ORDEM_KEYSET and self.limite is not None:
+            return self._select_keyset(linhas)
+        filtradas = self._filtradas(linhas)
+        if self.cursor is not None:
+            filtradas = [r for r in filtradas if _chave_keyset(r) > self.cursor]
+        total = len(filtradas) if self.contagem else None
+        # Ordenação estável aplicada da última chave para a primeira; NULL vai para o fim
+        for coluna, desc in reversed(self.ordens):
+            com_valor = [r for r in filtradas if r.get(coluna) is not None]
+            nulos = [r for r in filtradas if r.get(coluna) is None]
+            com_valor.sort(key=lambda r: _comparavel(r[coluna]), reverse=desc)
+            filtradas = com_valor + nulos
+        if self.limite is not None: filtradas = filtradas[:self.limite]
+        if self.colunas.strip() != "*":
+            cols = [c.strip() for c in self.colunas.split(",")]
+            filtradas = [{c: r.get(c) for c in cols} for r in filtradas]
+        return Resposta(_como_no_banco(filtradas), total)
+
+    def _select_keyset(self, linhas):
+        """
+        Página ordenada por (created_at, id): busca binária até o cursor e varre só
+        até completar o limite, em vez de filtrar e ordenar a tabela toda por página.
+        """
+        chaves, ordenadas = self.cliente.indice_keyset(self.tabela, linhas)
+        # created_at >= / > desde (sync incremental): contagem e varredura começam ali
+        base = 0
+        if self.piso is not None:
+            op, valor = self.piso
+            marco = (valor,) if op == "gte" else (valor, MAXIMO)
+            base = bisect.bisect_left(chaves, marco)
+        inicio = max(base, bisect.bisect_right(chaves, self.cursor)) if self.cursor is not None else base
+        pagina = []
+        for r in ordenadas[inicio:] if inicio else ordenadas:
+            if all(f(r) for f in self.filtros):
+                pagina.append(r)
+                if len(pagina) >= self.limite: break
+        total = sum(1 for r in ordenadas[base:] if all(f(r) for f in self.filtros)) if self.contagem else None
+        if self.colunas.strip() != "*":
+            cols = [c.strip() for c in self.colunas.split(",")]
+            pagina = [{c: r.get(c) for c in cols} for r in pagina]
+        return Resposta(_como_no_banco(pagina), total)
+
+    def _insert(self, linhas):
+        novas = [self.cliente.completar(self.tabela, r) for r in _como_no_banco(_lista(self.payload))]
+        linhas.extend(novas)
+        return Resposta(_como_no_banco(novas))
+
+    def _upsert(self, linhas):
+        resultado = []
+        for r in _como_no_banco(_lista(self.payload)):
+            chave = _chave_upsert(self.tabela, r, self.on_conflict)
+            existente = next((x for x in linhas if chave and all(_texto(x.get(c)) == _texto(r.get(c)) for c in chave)), None)
+            if existente is not None:
+                existente.update(r)
+                resultado.append(existente)
+            else:
+                nova = self.cliente.completar(self.tabela, r)
+                linhas.append(nova)
+                resultado.append(nova)
+        return Resposta(_como_no_banco(resultado))
+
+    def _update(self, linhas):
+        alvo = self._filtradas(linhas)
+        valores = _como_no_banco(self.payload)
+        for r in alvo: r.update(valores)
+        return Resposta(_como_no_banco(alvo))
+
+    def _delete(self, linhas):
+        alvo = self._filtradas(linhas)
+        ids = {id(r) for r in alvo}
+        linhas[:] = [r for r in linhas if id(r) not in ids]
+        return Resposta(_como_no_banco(alvo))
+
+def _chave_keyset(r):
+    return (_comparavel(r.get("created_at")), _comparavel(r.get("id")))
+
+def _lista(dados):
+    return dados if isinstance(dados, list) else [dados]
+
+def _chave_upsert(tabela, linha, on_conflict):
+    if on_conflict: return tuple(c.strip() for c in on_conflict.split(","))
+    if "id" in linha: return ("id",)
+    return CHAVES_NATURAIS.get(tabela)
+
+# --- 4. STORAGE (ARQUIVOS LOCAIS) ---
+class Bucket:
+    def __init__(self, pasta):
+        self.pasta = pasta
+
+    def upload(self, caminho, conteudo, file_options=None):
+        destino = os.path.join(self.pasta, caminho)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with open(destino, "wb") as f: f.write(conteudo)
+        return Resposta({"Key": caminho})
+
+    def remove(self, caminhos):
+        removidos = []
+        for caminho in caminhos:
+            try:
+                os.remove(os.path.join(self.pasta, caminho))
+                removidos.append({"name": caminho})
+            except OSError: pass
+        return removidos
+
+    def get_public_url(self, caminho, *_):
+        # O navegador não lê arquivos do servidor: dentro de static/ o arquivo sai pelo
+        # static serving do Streamlit (URL fixa, já vale antes do upload terminar);
+        # fora dele, só como data URI de um arquivo que já subiu
+        arquivo = os.path.abspath(os.path.join(self.pasta, caminho))
+        relativo = os.path.relpath(arquivo, os.path.abspath(PASTA_STATIC))
+        if not relativo.startswith(".."):
+            return "app/static/" + relativo.replace(os.sep, "/")
+        if not os.path.exists(arquivo):
+            return arquivo
+        tipo = mimetypes.guess_type(arquivo)[0] or "application/octet-stream"
+        with open(arquivo, "rb") as f:
+            return f"data:{tipo};base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+class Storage:
+    def __init__(self, pasta):
+        self.pasta = pasta
+
+    def from_(self, bucket):
+        return Bucket(os.path.join(self.pasta, bucket))
+
+# --- 5. CLIENTE ---
+class OfflineClient:
+    def __init__(self, pasta_storage):
+        self.tabelas = {}
+        self.lock = threading.RLock()
+        self.storage = Storage(pasta_storage)
+        self._sequencias = {}
+        self._indices = {}
+
+    def alterou(self, tabela):
+        """Escrita na tabela: o índice keyset é refeito na próxima leitura paginada"""
+        self._indices.pop(tabela, None)
+
+    def indice_keyset(self, tabela, linhas):
+        """Linhas da tabela ordenadas por (created_at, id) + as chaves, para busca binária"""
+        indice = self._indices.get(tabela)
+        if indice is None or indice[0] is not linhas or indice[1] != len(linhas):
+            ordenadas = sorted((r for r in linhas if r.get("created_at") is not None), key=_chave_keyset)
+            indice = (linhas, len(linhas), [_chave_keyset(r) for r in ordenadas], ordenadas)
+            self._indices[tabela] = indice
+        return indice[2], indice[3]
+
+    def table(self, tabela):
+        return Consulta(self, tabela)
+
+    def completar(self, tabela, linha):
+        """Preenche id (sequência) e created_at como os defaults do banco"""
+        if linha.get("id") is None:
+            self._sequencias[tabela] = self._sequencias.get(tabela, 0) + 1
+            linha["id"] = self._sequencias[tabela]
+        if linha.get("created_at") is None:
+            linha["created_at"] = datetime.now(timezone.utc).isoformat()
+        return linha
+
+    def carregar(self, tabela, linhas):
+        """Seed direto das tabelas (benchmarks, reprodução de telas lentas)"""
+        with self.lock:
+            novas = [self.completar(tabela, r) for r in _como_no_banco(list(linhas))]
+            self.tabelas.setdefault(tabela, []).extend(novas)
+            self.alterou(tabela)
+            ids = [r["id"] for r in novas if isinstance(r["id"], int)]
+            if ids: self._sequencias[tabela] = max(self._sequencias.get(tabela, 0), max(ids))
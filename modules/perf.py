@@ -0,0 +1,22 @@
+import time
+import streamlit as st
+
+# Cronômetro de etapas por tela (carga, métricas, cards, gráficos).
+# Cada marca() registra o tempo desde a marca anterior em
+# st.session_state["perf_etapas"][pagina]; o benchmark lê de lá após o rerun.
+
+class Cronometro:
+    def __init__(self, pagina):
+        self.pagina = pagina
+        self.t = time.perf_counter()
+        st.session_state.setdefault("perf_etapas", {})[pagina] = {}
+
+    def marca(self, etapa):
+        agora = time.perf_counter()
+        tempos = st.session_state["perf_etapas"][self.pagina]
+        tempos[etapa] = tempos.get(etapa, 0.0) + (agora - self.t) * 1000
+        self.t = agora
+
+def get_etapas():
+    """Tempos (ms) por etapa de cada tela no último rerun: {pagina: {etapa: ms}}"""
+    return st.session_state.get("perf_etapas", {})
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from modules.database import tipar
+from benchmarks.gerar_historico import gerar
+
+@pytest.fixture(scope="session")
+def trades():
+    """Histórico sintético tipado (com registros antigos sem operacao_id), em ordem de created_at"""
+    dados = gerar(3000, seed=7)
+    return tipar("trades", pd.DataFrame(dados["trades"])).sort_values('created_at').reset_index(drop=True)
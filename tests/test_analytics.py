@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.analytics import MetricsAccumulator, DrawdownTree, DailyRollup, CurveDownsampler, SEM_GRUPO
+
+# --- 1. DRAWDOWN TREE x CUMMAX ---
+def _referencia(res, inicial, lo, hi):
+    """Pico, fundo e pior queda da janela pela conta direta (cumsum + cummax)"""
+    base = inicial + res[:lo].sum()
+    saldo = np.cumsum(res[lo:hi])
+    return {
+        "resultado": float(saldo[-1]), "hwm": float(base + saldo.max()), "fundo": float(base + saldo.min()),
+        "max_drawdown": float(min(0.0, (saldo - np.maximum.accumulate(saldo)).min())),
+    }
+
+@pytest.mark.parametrize("n", [1, 2, 7, 64, 1000])
+def test_drawdown_tree_bate_com_cummax_em_janelas_aleatorias(n):
+    rng = np.random.default_rng(n)
+    res = rng.normal(10, 300, n).round(2)
+    arvore = DrawdownTree(res, inicial=1500.0)
+    for _ in range(200):
+        lo = int(rng.integers(0, n))
+        hi = int(rng.integers(lo + 1, n + 1))
+        obtido, esperado = arvore.query(lo, hi), _referencia(res, 1500.0, lo, hi)
+        assert obtido == pytest.approx(esperado), (lo, hi)
+
+def test_drawdown_tree_janela_vazia():
+    arvore = DrawdownTree([100.0, -50.0], inicial=10.0)
+    assert arvore.query(1, 1) == {"resultado": 0.0, "hwm": 110.0, "fundo": 110.0, "max_drawdown": 0.0}
+
+# --- 2. ACUMULADOR: MERGE x ADD ---
+def _operacoes(n, seed):
+    rng = np.random.default_rng(seed)
+    return [dict(resultado=float(r), pts_medio=p, lote=l, ativo=a, liquido=float(r) * k, registros=k)
+            for r, p, l, a, k in zip(rng.normal(0, 200, n).round(2),
+                                     rng.choice([np.nan, 10.0, 25.5], n), rng.choice([None, 1, 3], n),
+                                     rng.choice(["MNQ", "NQ"], n), rng.integers(1, 6, n))]
+
+@pytest.mark.parametrize("corte", [0, 1, 37, 99, 100])
+def test_merge_igual_a_add_em_sequencia(corte):
+    ops = _operacoes(100, corte)
+    inteiro = MetricsAccumulator()
+    for op in ops: inteiro.add(**op)
+
+    antes, depois = MetricsAccumulator(), MetricsAccumulator()
+    for op in ops[:corte]: antes.add(**op)
+    for op in ops[corte:]: depois.add(**op)
+    juntos = antes.merge(depois).to_dict()
+
+    esperado = inteiro.to_dict()
+    assert juntos.pop("ultimo_ativo") == esperado.pop("ultimo_ativo")
+    assert juntos == pytest.approx(esperado)
+
+# --- 3. ROLLUP INCREMENTAL x RECONSTRUÍDO ---
+def _comparar_rollup(incremental, trades_finais):
+    reconstruido = DailyRollup.build(trades_finais).tabela.sort_index()
+    obtido = incremental.tabela.sort_index()
+    assert list(obtido.index) == list(reconstruido.index)
+    pd.testing.assert_frame_equal(obtido, reconstruido, check_exact=False, check_dtype=False, check_index_type=False)
+
+def test_rollup_apos_insercao_remocao_e_troca_de_grupo(trades):
+    trades = trades.copy()
+    trades.loc[trades.index[::50], 'grupo_vinculo'] = None
+    base, novos = trades.iloc[:2500], trades.iloc[2500:]
+
+    # Inserção: trades novos entram com +1
+    rollup = DailyRollup.build(base).aplicar(novos)
+    _comparar_rollup(rollup, trades)
+
+    # Remoção: apagados saem com -1
+    apagados = trades.sample(200, random_state=1)
+    rollup.aplicar(apagados, -1)
+    restantes = trades.drop(apagados.index)
+    _comparar_rollup(rollup, restantes)
+
+    # Troca de grupo: sai a versão antiga, entra a nova
+    movidos = restantes[restantes['grupo_vinculo'] == "GRUPO 1"].head(300)
+    novos_movidos = movidos.assign(grupo_vinculo="GRUPO 2")
+    rollup.aplicar(movidos, -1).aplicar(novos_movidos)
+    _comparar_rollup(rollup, pd.concat([restantes.drop(movidos.index), novos_movidos]))
+
+def test_rollup_conta_registros_sem_grupo_em_todos(trades):
+    trades = trades.copy()
+    sem_grupo = trades.index[::10]
+    trades.loc[sem_grupo, 'grupo_vinculo'] = None
+    rollup = DailyRollup.build(trades)
+    assert rollup.diario()['resultado'].sum() == pytest.approx(trades['resultado'].sum())
+    assert rollup.diario(grupo=SEM_GRUPO)['registros'].sum() == len(sem_grupo)
+
+# --- 4. LTTB ---
+def _curva_longa(n=20000, seed=3):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.normal(1, 100, n))
+
+def test_lttb_mantem_pontas_e_respeita_o_limite():
+    y = _curva_longa()
+    pos = CurveDownsampler.lttb(np.arange(len(y), dtype=float), y, 500)
+    assert len(pos) == 500
+    assert pos[0] == 0 and pos[-1] == len(y) - 1
+    assert np.all(np.diff(pos) > 0)
+
+def test_curva_mantem_extremos_e_pior_queda():
+    y = _curva_longa()
+    pos = CurveDownsampler.curva(y, pontos=1000, limiar=5000)
+    assert len(pos) <= 1000
+    queda = y - np.maximum.accumulate(y)
+    vale = int(np.argmin(queda))
+    pico = int(np.argmax(y[:vale + 1]))
+    for obrigatorio in (0, len(y) - 1, int(np.argmax(y)), int(np.argmin(y)), pico, vale):
+        assert obrigatorio in pos
+    # Pior queda do desenho igual à da curva inteira
+    reduzida = y[pos]
+    assert (reduzida - np.maximum.accumulate(reduzida)).min() == pytest.approx(queda.min())
+
+def test_curva_pequena_vai_inteira():
+    y = _curva_longa(300)
+    assert np.array_equal(CurveDownsampler.curva(y, pontos=100, limiar=5000), np.arange(300))
+
+def test_serie_com_lacunas_mantem_extremos_e_quebras():
+    y = _curva_longa()
+    y[:19] = np.nan
+    y[8000:8100] = np.nan
+    pos = CurveDownsampler.serie(y, pontos=1000, limiar=5000)
+    assert len(pos) <= 1000
+    assert {0, 8000, len(y) - 1, int(np.nanargmax(y)), int(np.nanargmin(y))} <= set(pos.tolist())
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from modules.logic import OperationGrouping
+from benchmarks.bench_chave_operacao import criar_chave_operacao
+
+# --- 1. CHAVE DE OPERAÇÃO: VETORIZADA x APPLY ---
+def _comparar_chaves(df):
+    antiga = df.apply(criar_chave_operacao, axis=1).astype(object)
+    nova = OperationGrouping.build_keys(df)
+    pd.testing.assert_series_equal(nova, antiga, check_names=False)
+
+def test_build_keys_igual_ao_apply(trades):
+    # O histórico sintético já mistura registros com e sem operacao_id
+    assert trades['operacao_id'].isna().any() and trades['operacao_id'].notna().any()
+    _comparar_chaves(trades)
+
+def test_build_keys_sem_created_at_e_sem_grupo(trades):
+    df = trades.head(500).copy()
+    df['operacao_id'] = df['operacao_id'].where(np.arange(len(df)) % 3 == 0)
+    df.loc[df.index[::4], 'created_at'] = pd.NaT
+    df.loc[df.index[::7], 'grupo_vinculo'] = None
+    _comparar_chaves(df)
+
+def test_build_keys_mantem_o_indice(trades):
+    df = trades.sample(300, random_state=2)
+    assert OperationGrouping.build_keys(df).index.equals(df.index)
+    assert OperationGrouping.build_keys(df.iloc[:0]).empty
@@ -0,0 +1,125 @@
+"""
+Backfill único de operacao_id nos trades antigos.
+
+Registros sem operacao_id obrigam as telas a reconstruir as operações a cada
+render pela heurística data + ativo + resultado + grupo + minuto de created_at.
+Este script agrupa esses registros com a MESMA regra (OperationGrouping, por
+usuário) e grava um operacao_id estável em cada grupo. O id é um UUID5 da
+chave, então rodar de novo gera os mesmos valores (e não acha mais nada).
+
+Por padrão é dry-run: só mostra o resumo e grava o diff. Com --aplicar, grava
+só a coluna operacao_id, só em registros que ainda estão sem operacao_id
+(apagados ou já preenchidos no meio do caminho ficam como estão).
+
+Custo: pelo menos UMA requisição por operação. Cada operação tem o seu
+operacao_id, e um update do PostgREST grava o mesmo valor em todas as linhas
+que casam, então operações diferentes não dividem requisição (juntar exigiria
+upsert da linha inteira ou uma função no banco). --lote limita só quantos ids
+de UMA operação vão no filtro in.(...) de cada update; operações com mais
+registros que isso viram mais de uma requisição. 50 mil operações = ~50 mil
+requisições.
+
+Uso:
+    python tools/backfill_operacao_id.py                          # dry-run, todos os usuários
+    python tools/backfill_operacao_id.py --usuario joao --relatorio diff.csv
+    python tools/backfill_operacao_id.py --aplicar --lote 500
+"""
+import os
+import sys
+import uuid
+import argparse
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import pandas as pd
+
+from modules.logic import OperationGrouping
+from modules.database import get_db, tipar, query_trades_sem_operacao
+
+# Namespace fixo: a mesma operação antiga sempre recebe o mesmo operacao_id
+NAMESPACE_OPERACAO = uuid.uuid5(uuid.NAMESPACE_URL, "apex-shield/operacao-legada")
+
+def planejar(linhas):
+    """
+    Agrupa os registros antigos em operações e define o operacao_id de cada uma.
+
+    Args:
+        linhas: Registros crus da tabela trades com operacao_id nulo
+
+    Returns:
+        tuple: (DataFrame registro -> operacao_id novo, DataFrame de diff por operação)
+    """
+    if not linhas:
+        return pd.DataFrame(), pd.DataFrame()
+    df = tipar("trades", pd.DataFrame(linhas))
+    df['chave'] = OperationGrouping.build_keys(df)
+    df['operacao_id_novo'] = [str(uuid.uuid5(NAMESPACE_OPERACAO, f"{u}|{c}")) for u, c in zip(df['usuario'], df['chave'])]
+
+    g = df.groupby('operacao_id_novo', sort=False)
+    diff = g.agg(
+        usuario=('usuario', 'first'), data=('data', 'first'), ativo=('ativo', 'first'),
+        resultado=('resultado', 'first'), grupo_vinculo=('grupo_vinculo', 'first'),
+        chave=('chave', 'first'), registros=('id', 'size'),
+        contas=('conta_id', lambda s: sorted(str(c) for c in s.dropna())),
+        sem_conta=('conta_id', lambda s: int(s.isna().sum())),
+        ids=('id', list),
+    ).reset_index()
+    # Suspeito: mais de um registro sem conta ou conta repetida = trades distintos que a
+    # heurística junta (no app eles já aparecem juntos; aqui ficam para revisão)
+    diff['suspeito'] = (diff['registros'] > 1) & ((diff['sem_conta'] > 1) | (diff['contas'].map(len) != diff['contas'].map(lambda c: len(set(c)))))
+    return df[['id', 'usuario', 'operacao_id_novo']], diff.sort_values(['usuario', 'data', 'chave']).reset_index(drop=True)
+
+def aplicar(sb, plano, lote):
+    """
+    Grava operacao_id por operação: update só dessa coluna, nunca insere nem reverte edições.
+
+    Uma requisição por operação (mais uma a cada `lote` ids dentro da mesma
+    operação); operações diferentes nunca vão juntas, porque o valor muda.
+    """
+    gravados = 0
+    grupos = list(plano.groupby('operacao_id_novo', sort=False)['id'])
+    for n, (oid, ids) in enumerate(grupos, start=1):
+        ids = ids.tolist()
+        for i in range(0, len(ids), lote):
+            res = (sb.table("trades").update({"operacao_id": oid})
+                   .in_("id", ids[i:i + lote]).is_("operacao_id", "null").execute())
+            gravados += len(res.data or [])
+        if n % 500 == 0 or n == len(grupos):
+            print(f"  {n:,}/{len(grupos):,} operações")
+    return gravados
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill de operacao_id nos trades antigos")
+    parser.add_argument("--usuario", default=None, help="só este usuário (padrão: todos)")
+    parser.add_argument("--relatorio", default="backfill_operacao_id.csv", help="diff por operação (CSV)")
+    parser.add_argument("--aplicar", action="store_true", help="grava no banco (sem isso é dry-run)")
+    parser.add_argument("--lote", type=int, default=500, help="máximo de ids de UMA operação por update (o custo continua sendo uma requisição por operação)")
+    args = parser.parse_args()
+
+    sb = get_db()
+    linhas = query_trades_sem_operacao(args.usuario)
+    plano, diff = planejar(linhas)
+    if diff.empty:
+        print("Nenhum registro sem operacao_id. Nada a fazer.")
+        return
+
+    diff.to_csv(args.relatorio, index=False)
+    por_tamanho = diff['registros'].value_counts().sort_index()
+    print(f"Registros sem operacao_id: {len(plano):,}")
+    print(f"Operações reconstruídas:   {len(diff):,}  (usuários: {diff['usuario'].nunique()})")
+    print("Registros por operação:    " + ", ".join(f"{k}: {v:,}" for k, v in por_tamanho.items()))
+    print(f"Suspeitas (revisar):       {int(diff['suspeito'].sum()):,}")
+    print(f"Diff em {args.relatorio}")
+
+    if not args.aplicar:
+        print("\nDry-run: nada foi gravado. Rode com --aplicar para gravar.")
+        return
+
+    print("\nGravando...")
+    gravados = aplicar(sb, plano, args.lote)
+    restantes = len(query_trades_sem_operacao(args.usuario, colunas="id"))
+    print(f"Pronto: {gravados:,} registros atualizados, {restantes:,} ainda sem operacao_id.")
+
+if __name__ == "__main__":
+    main()
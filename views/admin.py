@@ -1,16 +1,8 @@
 import streamlit as st
 import pandas as pd
-from supabase import create_client
 import time
 
-def get_supabase():
-    try:
-        if "supabase" in st.session_state: return st.session_state["supabase"]
-        else:
-            url = st.secrets["SUPABASE_URL"]
-            key = st.secrets["SUPABASE_KEY"]
-            return create_client(url, key)
-    except: return None
+from modules.database import get_supabase
 
 def show(user, role):
     st.title("👥 Admin: Gerenciar Usuários")
@@ -2,17 +2,10 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date, timedelta
-from supabase import create_client
 import json
 import time
 
-# --- CONEXAO ---
-def get_supabase():
-    if "supabase" in st.session_state:
-        return st.session_state["supabase"]
-    url = st.secrets["SUPABASE_URL"]
-    key = st.secrets["SUPABASE_KEY"]
-    return create_client(url, key)
+from modules.database import get_supabase, consultar, registrar_escrita
 
 # ==========================================
 # FUNCOES DE DADOS
@@ -20,7 +13,7 @@ def get_supabase():
 
 def get_config(user):
     sb = get_supabase()
-    res = sb.table("antitilt_config").select("*").eq("usuario", user).execute()
+    res = consultar(sb.table("antitilt_config").select("*").eq("usuario", user), "antitilt_config")
     
     if res.data:
         return res.data[0]
@@ -38,12 +31,13 @@ def get_config(user):
             "journaling_obrigatorio": True
         }
         sb.table("antitilt_config").insert(config).execute()
+        registrar_escrita("antitilt_config", user=user)
         return config
 
 def get_checkin_hoje(user):
     sb = get_supabase()
     hoje = date.today().isoformat()
-    res = sb.table("checkin_diario").select("*").eq("usuario", user).eq("data", hoje).execute()
+    res = consultar(sb.table("checkin_diario").select("*").eq("usuario", user).eq("data", hoje), "checkin_diario")
     return res.data[0] if res.data else None
 
 def salvar_checkin(user, dados):
@@ -71,12 +65,13 @@ def salvar_checkin(user, dados):
     }
     
     sb.table("checkin_diario").upsert(checkin).execute()
+    registrar_escrita("checkin_diario", user=user)
     return checkin
 
 def get_stops_hoje(user):
     sb = get_supabase()
     hoje = date.today().isoformat()
-    res = sb.table("stops_dia").select("*").eq("usuario", user).eq("data", hoje).execute()
+    res = consultar(sb.table("stops_dia").select("*").eq("usuario", user).eq("data", hoje), "stops_dia")
     
     if res.data:
         return res.data[0]
@@ -88,6 +83,7 @@ def get_stops_hoje(user):
             "stops_consecutivos": 0
         }
         sb.table("stops_dia").insert(registro).execute()
+        registrar_escrita("stops_dia", user=user)
         return registro
 
 def registrar_stop(user):
@@ -116,6 +112,7 @@ def registrar_stop(user):
     }
     
     sb.table("stops_dia").update(update).eq("usuario", user).eq("data", hoje).execute()
+    registrar_escrita("stops_dia", user=user)
     
     return {
         "stops_count": novo_count,
@@ -132,11 +129,12 @@ def registrar_gain(user):
     sb.table("stops_dia").update({
         "stops_consecutivos": 0
     }).eq("usuario", user).eq("data", hoje).execute()
+    registrar_escrita("stops_dia", user=user)
 
 def get_journaling_hoje(user):
     sb = get_supabase()
     hoje = date.today().isoformat()
-    res = sb.table("journaling").select("*").eq("usuario", user).eq("data", hoje).execute()
+    res = consultar(sb.table("journaling").select("*").eq("usuario", user).eq("data", hoje), "journaling")
     return res.data[0] if res.data else None
 
 def salvar_journaling(user, dados):
@@ -158,14 +156,15 @@ def salvar_journaling(user, dados):
     }
     
     sb.table("journaling").upsert(journaling).execute()
+    registrar_escrita("journaling", user=user)
     return journaling
 
 def get_historico_mental(user, dias=30):
     sb = get_supabase()
     data_inicio = (date.today() - timedelta(days=dias)).isoformat()
     
-    checkins = sb.table("checkin_diario").select("*").eq("usuario", user).gte("data", data_inicio).execute()
-    journals = sb.table("journaling").select("*").eq("usuario", user).gte("data", data_inicio).execute()
+    checkins = consultar(sb.table("checkin_diario").select("*").eq("usuario", user).gte("data", data_inicio), "checkin_diario")
+    journals = consultar(sb.table("journaling").select("*").eq("usuario", user).gte("data", data_inicio), "journaling")
     
     return {
         "checkins": checkins.data or [],
@@ -199,6 +198,7 @@ def ignorar_recomendacao(user):
     sb.table("checkin_diario").update({
         "ignorou_recomendacao": True
     }).eq("usuario", user).eq("data", hoje).execute()
+    registrar_escrita("checkin_diario", user=user)
 
 # ==========================================
 # CSS
@@ -639,5 +639,6 @@ def show(user, role):
                 "bloqueio_automatico": bloqueio_auto,
                 "journaling_obrigatorio": journal_obg
             }).eq("usuario", user).execute()
+            registrar_escrita("antitilt_config", user=user)
             
             st.toast("Configuracoes salvas!")
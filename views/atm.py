@@ -1,20 +1,11 @@
 import streamlit as st
 import pandas as pd
-from supabase import create_client
 import json
 import time
 
-# --- 1. CONEXÃO ---
-def get_supabase():
-    try:
-        if "supabase" in st.session_state: return st.session_state["supabase"]
-        else:
-            url = st.secrets["SUPABASE_URL"]
-            key = st.secrets["SUPABASE_KEY"]
-            return create_client(url, key)
-    except: return None
+from modules.database import get_supabase, load_atms, registrar_escrita
 
-# --- 2. TELA DE CONFIGURAÇÃO ATM ---
+# --- 1. TELA DE CONFIGURAÇÃO ATM ---
 def show(user, role):
     st.title("⚙️ Gerenciar Estratégias (ATM)")
     
@@ -33,11 +24,7 @@ def show(user, role):
         }
 
     # Carrega ATMs existentes
-    try:
-        res = sb.table("atm_configs").select("*").order("nome").execute()
-        existing_atms = res.data
-    except:
-        existing_atms = []
+    existing_atms = list(load_atms().values())
 
     # Layout: Formulário (Esq) e Lista (Dir)
     c_form, c_list = st.columns([1.5, 1])
@@ -73,6 +60,7 @@ def show(user, role):
                         
                     if c_del.button("🗑️ Excluir", key=f"del_{item['id']}"):
                         sb.table("atm_configs").delete().eq("id", item['id']).execute()
+                        registrar_escrita("atm_configs")
                         if st.session_state.atm_form_data["id"] == item['id']:
                             reset_atm_form()
                         st.rerun()
@@ -150,6 +138,7 @@ def show(user, role):
                     # Insert
                     sb.table("atm_configs").insert(payload).execute()
                     st.toast("Estratégia Criada!", icon="✨")
+                registrar_escrita("atm_configs")
                 
                 time.sleep(1)
                 reset_atm_form()
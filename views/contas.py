@@ -3,98 +3,24 @@ import pandas as pd
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
-from supabase import create_client
 import time
 import math
 import uuid
 
 # Importa o Cérebro
-from modules.logic import ApexEngine
+from modules.logic import ApexEngine, AccountLedger
+from modules.perf import Cronometro
+from modules.analytics import CurveDownsampler
+from modules.cache_local import config
+from modules.database import (get_supabase, load_trades, load_ajustes, load_contas, load_grupos,
+                              registrar_escrita, cache_trades_atualizar, indice_pnl, carregar_em_paralelo,
+                              COLUNAS_TRADES_CONTAS)
 
-# --- 1. CONEXÃO ---
-def get_supabase():
-    try:
-        if "supabase" in st.session_state: return st.session_state["supabase"]
-        else:
-            url = st.secrets["SUPABASE_URL"]
-            key = st.secrets["SUPABASE_KEY"]
-            return create_client(url, key)
-    except: return None
-
-def load_grupos(user):
-    try:
-        sb = get_supabase()
-        res = sb.table("grupos_config").select("*").eq("usuario", user).execute()
-        return pd.DataFrame(res.data)
-    except: return pd.DataFrame()
-
-def load_contas(user):
-    try:
-        sb = get_supabase()
-        res = sb.table("contas_config").select("*").eq("usuario", user).execute()
-        df = pd.DataFrame(res.data)
-        if not df.empty:
-            if 'pico_previo' not in df.columns: df['pico_previo'] = df['saldo_inicial']
-            if 'fase_entrada' not in df.columns: df['fase_entrada'] = 'Fase 1'
-            if 'status_conta' not in df.columns: df['status_conta'] = 'Ativa'
-            df['saldo_inicial'] = df['saldo_inicial'].astype(float)
-            df['pico_previo'] = df['pico_previo'].astype(float)
-        return df
-    except: return pd.DataFrame()
-
-def load_trades(user):
-    try:
-        sb = get_supabase()
-        res = sb.table("trades").select("*").execute()
-        df = pd.DataFrame(res.data)
-        if not df.empty:
-            df = df[df['usuario'] == user]
-            df['data'] = pd.to_datetime(df['data']).dt.date
-            df['created_at'] = pd.to_datetime(df['created_at'])
-            if 'grupo_vinculo' not in df.columns: df['grupo_vinculo'] = 'Geral'
-            if 'conta_id' not in df.columns: df['conta_id'] = None
-            df['resultado'] = pd.to_numeric(df['resultado'], errors='coerce').fillna(0.0)
-        return df
-    except: return pd.DataFrame()
-
-def load_ajustes(user):
-    """Carrega ajustes manuais (taxas, slippage, etc)"""
-    try:
-        sb = get_supabase()
-        res = sb.table("ajustes_manuais").select("*").eq("usuario", user).execute()
-        df = pd.DataFrame(res.data)
-        if not df.empty:
-            df['valor'] = pd.to_numeric(df['valor'], errors='coerce').fillna(0.0)
-            df['created_at'] = pd.to_datetime(df['created_at'])
-        return df
-    except: return pd.DataFrame()
-
-def calcular_lucro_conta(conta_id, grupo_nome, df_trades, df_ajustes):
-    """
-    Calcula o lucro real de uma conta específica.
-    
-    Lógica:
-    1. Trades desta conta (conta_id = esta conta) → soma 100%
-    2. Ajustes manuais desta conta → soma 100%
-    
-    OBS: Trades replicados agora criam um registro por conta,
-    então não precisa mais de lógica especial.
-    """
-    lucro_total = 0.0
-    
-    if not df_trades.empty:
-        # Todos os trades desta conta
-        trades_conta = df_trades[df_trades['conta_id'] == conta_id]
-        lucro_total += trades_conta['resultado'].sum()
-    
-    # Ajustes manuais desta conta
-    if not df_ajustes.empty:
-        ajustes_conta = df_ajustes[df_ajustes['conta_id'] == conta_id]
-        lucro_total += ajustes_conta['valor'].sum()
-    
-    return lucro_total
+# Curvas longas vão reduzidas para o navegador (mesma configuração do dashboard)
+GRAFICO_PONTOS = int(config("GRAFICO_PONTOS", CurveDownsampler.PONTOS))
+GRAFICO_LIMIAR = int(config("GRAFICO_LIMIAR", CurveDownsampler.LIMIAR))
 
-# --- 2. COMPONENTE VISUAL ---
+# --- 1. COMPONENTE VISUAL ---
 def card_monitor(label, value, sub_text, color="white", border_color="#333"):
     st.markdown(
         f"""
@@ -120,7 +46,7 @@ def card_monitor(label, value, sub_text, color="white", border_color="#333"):
         unsafe_allow_html=True
     )
 
-# --- 3. TELA PRINCIPAL ---
+# --- 2. TELA PRINCIPAL ---
 def show(user, role):
     st.title("💼 Gestão de Portfólio")
     
@@ -129,6 +55,17 @@ def show(user, role):
         return
 
     sb = get_supabase()
+
+    # Todas as abas leem as mesmas tabelas: a carga fria sai junta, antes da primeira aba,
+    # e o monitor (aba 5) mede a partir daqui
+    cron = Cronometro("contas_monitor")
+    carregar_em_paralelo({
+        "contas": lambda: load_contas(user),
+        "grupos": lambda: load_grupos(user),
+        "trades": lambda: load_trades(user, COLUNAS_TRADES_CONTAS),
+        "ajustes": lambda: load_ajustes(user),
+    })
+    cron.marca("carga")
     
     t1, t2, t3, t4, t5 = st.tabs(["📂 Criar Grupo", "💳 Cadastrar Conta", "📋 Visão Geral", "📉 Ajustes Manuais", "🚀 Monitor de Performance"])
     
@@ -140,6 +77,7 @@ def show(user, role):
             if st.form_submit_button("Criar Grupo"):
                 if novo_grupo:
                     sb.table("grupos_config").insert({"usuario": user, "nome": novo_grupo}).execute()
+                    registrar_escrita("grupos_config", user=user)
                     st.toast("Grupo criado!", icon="✅")
                     time.sleep(1)
                     st.rerun()
@@ -154,6 +92,7 @@ def show(user, role):
                 c1.info(f"📂 {row['nome']}")
                 if c2.button("Excluir", key=f"del_g_{row['id']}"):
                     sb.table("grupos_config").delete().eq("id", row['id']).execute()
+                    registrar_escrita("grupos_config", user=user)
                     st.rerun()
         else:
             st.info("Nenhum grupo criado.")
@@ -181,6 +120,7 @@ def show(user, role):
                                 "saldo_inicial": s_ini, "pico_previo": p_pre,
                                 "fase_entrada": fase_ini, "status_conta": "Ativa"
                             }).execute()
+                            registrar_escrita("contas_config", user=user)
                             st.toast("Conta cadastrada!", icon="✅")
                             time.sleep(1)
                             st.rerun()
@@ -193,8 +133,9 @@ def show(user, role):
         st.subheader("📋 Gestão e Edição")
         df_c = load_contas(user)
         df_g_list = load_grupos(user)
-        df_t = load_trades(user)
+        df_t = load_trades(user, COLUNAS_TRADES_CONTAS)
         df_aj = load_ajustes(user)
+        ledger = AccountLedger.balances(df_c, df_t, df_aj)
         
         BASE_CONTA = 150000  # Valor base das contas Phase 2
         
@@ -207,11 +148,9 @@ def show(user, role):
                     contas_g = df_c[df_c['grupo_nome'] == grp]
                     
                     for _, row in contas_g.iterrows():
-                        # Calcula lucro dos trades/ajustes desta conta
-                        lucro_trades = calcular_lucro_conta(row['id'], grp, df_t, df_aj)
-                        
                         st_icon = "🟢" if row['status_conta'] == "Ativa" else "🔴"
-                        saldo_atual = float(row['saldo_inicial']) + lucro_trades
+                        # Saldo = saldo_inicial + trades + ajustes desta conta
+                        saldo_atual = ledger.at[row['id'], 'saldo']
                         
                         # Lucro REAL = saldo atual - base ($150k)
                         lucro_real = saldo_atual - BASE_CONTA
@@ -256,6 +195,8 @@ def show(user, role):
                                     sb.table("trades").update({
                                         "grupo_vinculo": novo_grp
                                     }).eq("conta_id", row['id']).execute()
+                                    cache_trades_atualizar(user, {"grupo_vinculo": novo_grp}, coluna="conta_id", valor=row['id'])
+                                    registrar_escrita("trades", user=user)
                                     
                                     st.toast(f"Trades movidos para {novo_grp}!")
                                 
@@ -267,12 +208,14 @@ def show(user, role):
                                     "pico_previo": novo_pico,
                                     "fase_entrada": nova_fase
                                 }).eq("id", row['id']).execute()
+                                registrar_escrita("contas_config", user=user)
                                 st.toast("Conta atualizada!")
                                 time.sleep(1)
                                 st.rerun()
 
                         if c_del.button("🗑️", key=f"del_acc_{row['id']}"):
                             sb.table("contas_config").delete().eq("id", row['id']).execute()
+                            registrar_escrita("contas_config", user=user)
                             st.rerun()
         else:
             st.info("Nenhuma conta configurada.")
@@ -284,7 +227,7 @@ def show(user, role):
         
         df_c = load_contas(user)
         df_aj = load_ajustes(user)
-        df_tr = load_trades(user)
+        df_tr = load_trades(user, COLUNAS_TRADES_CONTAS)
         
         BASE_CONTA = 150000  # Valor base das contas Phase 2
         
@@ -303,8 +246,7 @@ def show(user, role):
                 
                 # Mostra saldo atual da conta selecionada
                 conta_row = df_c[df_c['display'] == conta_display].iloc[0]
-                lucro_trades = calcular_lucro_conta(conta_row['id'], conta_row['grupo_nome'], df_tr, df_aj)
-                saldo_atual = conta_row['saldo_inicial'] + lucro_trades
+                saldo_atual = AccountLedger.balances(df_c, df_tr, df_aj).at[conta_row['id'], 'saldo']
                 lucro_real = saldo_atual - BASE_CONTA  # Lucro real acima de $150k
                 
                 st.markdown(f"""
@@ -351,6 +293,7 @@ def show(user, role):
                                 "valor": valor_ajuste,
                                 "descricao": descricao
                             }).execute()
+                            registrar_escrita("ajustes_manuais", user=user)
                             
                             st.toast(f"Ajuste registrado: ${valor_ajuste:+,.2f}", icon="✅")
                             time.sleep(1)
@@ -392,9 +335,12 @@ def show(user, role):
     # --- ABA 5: MONITOR DE PERFORMANCE ---
     with t5:
         st.subheader("🚀 Monitor de Grupo (Apex Engine)")
+        cron.marca("abas_1_4")
         df_c = load_contas(user)
-        df_t = load_trades(user)
+        df_t = load_trades(user, COLUNAS_TRADES_CONTAS)
         df_aj = load_ajustes(user)
+        ledger = AccountLedger.balances(df_c, df_t, df_aj)
+        cron.marca("saldos")
 
         if not df_c.empty:
             grps = sorted(df_c['grupo_nome'].unique())
@@ -409,8 +355,9 @@ def show(user, role):
             
             st.markdown("---")
             
-            # Filtra trades do grupo
-            trades_g = df_t[df_t['grupo_vinculo'] == sel_g] if not df_t.empty else pd.DataFrame()
+            # Trades do grupo em ordem de data (mesma ordem do índice de drawdown)
+            indice = indice_pnl(user, df_t)
+            trades_g = indice.periodo_registros(grupo=sel_g) if not df_t.empty else pd.DataFrame()
             
             # --- DADOS ---
             saude_final = {}
@@ -429,10 +376,7 @@ def show(user, role):
                 
                 for _, conta in contas_g.iterrows():
                     if conta['status_conta'] == 'Ativa':
-                        # Calcula lucro REAL desta conta
-                        lucro_conta = calcular_lucro_conta(conta['id'], sel_g, df_t, df_aj)
-                        
-                        saldo_atual_c = float(conta['saldo_inicial']) + lucro_conta
+                        saldo_atual_c = ledger.at[conta['id'], 'saldo']
                         hwm_prev_c = float(conta.get('pico_previo', conta['saldo_inicial']))
                         
                         res = ApexEngine.calculate_health(saldo_atual_c, hwm_prev_c, conta.get('fase_entrada', 'Fase 1'))
@@ -465,10 +409,7 @@ def show(user, role):
                 if not conta_alvo.empty:
                     conta_ref = conta_alvo.iloc[0]
                     
-                    # Calcula lucro REAL desta conta
-                    lucro_conta = calcular_lucro_conta(conta_ref['id'], sel_g, df_t, df_aj)
-                    
-                    saldo_atual_est = float(conta_ref['saldo_inicial']) + lucro_conta
+                    saldo_atual_est = ledger.at[conta_ref['id'], 'saldo']
                     hwm_prev = float(conta_ref.get('pico_previo', conta_ref['saldo_inicial']))
                     saldo_inicial_plot = float(conta_ref['saldo_inicial'])
                     
@@ -477,6 +418,8 @@ def show(user, role):
                     st.warning("Conta não encontrada.")
                     st.stop()
 
+            cron.marca("metricas")
+
             # --- CARDS ---
             k1, k2, k3, k4 = st.columns(4)
             with k1:
@@ -504,6 +447,7 @@ def show(user, role):
                 card_monitor("STATUS / FASE", lbl_fase, sub_fase, cor_fase, cor_fase)
 
             st.markdown("<br>", unsafe_allow_html=True)
+            cron.marca("cards")
             
             cg, cp = st.columns([2.5, 1])
 
@@ -511,7 +455,7 @@ def show(user, role):
             with cg:
                 st.markdown(f"**🌊 {titulo_grafico}**")
                 if not trades_g.empty:
-                    df_plot = trades_g.sort_values('created_at').copy()
+                    df_plot = trades_g.copy()
                     
                     df_plot['saldo_acc'] = df_plot['resultado'].cumsum() + saldo_inicial_plot
                     df_plot['seq'] = range(1, len(df_plot)+1)
@@ -532,10 +476,14 @@ def show(user, role):
                     if saude_final['saldo'] >= meta_plot_val:
                         meta_plot_val = 161000.0 * n_contas_calc
                     
+                    # Patrimônio mantém extremos e pior queda; o stop mantém cada degrau
+                    pos_saldo = CurveDownsampler.curva(df_plot['saldo_acc'], None, GRAFICO_PONTOS, GRAFICO_LIMIAR)
+                    pos_stop = CurveDownsampler.degraus(df_plot['stop_hist'], None, GRAFICO_PONTOS, GRAFICO_LIMIAR)
+                    
                     fig = go.Figure()
                     
                     fig.add_trace(go.Scatter(
-                        x=df_plot['seq'], y=df_plot['saldo_acc'],
+                        x=df_plot['seq'].iloc[pos_saldo], y=df_plot['saldo_acc'].iloc[pos_saldo],
                         mode='lines', name='Patrimônio',
                         line=dict(color='#2962FF', width=2),
                         fill='tozeroy', fillcolor='rgba(41, 98, 255, 0.1)',
@@ -543,7 +491,7 @@ def show(user, role):
                     ))
                     
                     fig.add_trace(go.Scatter(
-                        x=df_plot['seq'], y=df_plot['stop_hist'],
+                        x=df_plot['seq'].iloc[pos_stop], y=df_plot['stop_hist'].iloc[pos_stop],
                         mode='lines', name='Trailing Stop',
                         line=dict(color='#FF4B4B', width=2, dash='solid'),
                         hovertemplate='Trade %{x}<br>Stop: $%{y:,.2f}<extra></extra>'
@@ -570,8 +518,24 @@ def show(user, role):
                         yaxis=dict(range=[min_y - padding, max_y + padding], tickformat="$,.0f")
                     )
                     st.plotly_chart(fig, use_container_width=True)
+                    
+                    # Topo e pior queda de qualquer janela da curva (árvore de segmentos, O(log n))
+                    janela = st.date_input("Janela de análise", (df_plot['data'].min(), df_plot['data'].max()),
+                                           key=f"janela_monitor_{sel_g}")
+                    if isinstance(janela, (tuple, list)) and len(janela) == 2:
+                        dd_janela = indice.drawdown(janela[0], janela[1], grupo=sel_g, registros=True)
+                        topo_janela = saldo_inicial_plot + dd_janela['hwm']
+                        cor_res = "#00FF88" if dd_janela['resultado'] >= 0 else "#FF4B4B"
+                        st.markdown(f"""
+                            <div style="display:flex; justify-content:space-between; color:#888; font-size:12px;">
+                                <span>Topo na janela: <b style="color:#FFFF00">${topo_janela:,.2f}</b></span>
+                                <span>Maior queda: <b style="color:#FF4B4B">${dd_janela['max_drawdown']:,.2f}</b></span>
+                                <span>Resultado: <b style="color:{cor_res}">${dd_janela['resultado']:+,.2f}</b></span>
+                            </div>
+                        """, unsafe_allow_html=True)
                 else:
                     st.info("Registre trades para ver a curva.")
+            cron.marca("graficos")
 
             with cp:
                 st.markdown("**🎯 Progresso da Fase**")
@@ -1,16 +1,24 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
-from supabase import create_client
 
 # Importando seus motores matemáticos
-from modules.logic import ApexEngine, RiskEngine, PositionSizing
-from modules.database import update_hwm 
-
-# --- 1. CONFIGURAÇÕES E CONEXÃO ---
-MULTIPLIERS = {"NQ": 20, "MNQ": 2, "ES": 50, "MES": 5}
+from modules.metrics import DashboardMetrics
+from modules.perf import Cronometro
+from modules.analytics import RollingMetrics, DailyRollup, SEM_CONTA, CurveDownsampler
+from modules.cache_local import config
+from modules.database import (get_supabase, salvar_hwms, get_falhas_hwm, query_trades, load_trades, load_contas, load_metas,
+                              registrar_escrita, carregar_em_paralelo, indice_pnl, rollup_trades,
+                              COLUNAS_TRADES_DASHBOARD, COLUNAS_TRADES_META)
+
+# --- 1. CONFIGURAÇÕES ---
+# Curvas longas vão reduzidas para o navegador (GRAFICO_PONTOS / GRAFICO_LIMIAR no secrets.toml ou APEX_*)
+GRAFICO_PONTOS = int(config("GRAFICO_PONTOS", CurveDownsampler.PONTOS))
+GRAFICO_LIMIAR = int(config("GRAFICO_LIMIAR", CurveDownsampler.LIMIAR))
 
 # --- TOOLTIPS: Explicações claras para cada métrica ---
 TOOLTIPS = {
@@ -22,6 +30,10 @@ TOOLTIPS = {
     "media_loss": "Valor médio das suas OPERAÇÕES negativas (por conta). Quanto você perde, em média, quando erra.",
     "payoff": "Razão entre ganho médio e perda média. Ex: 1:2.86 significa que seu gain médio é 2.86x seu loss médio.",
     "drawdown": "Maior queda do seu saldo desde um pico até um vale. Mostra o pior momento da sua curva.",
+    "tempo_submerso": "Porcentagem das operações em que a curva estava abaixo do pico anterior (em drawdown).",
+    "duracao_dd": "Quantas operações (e dias) vão do pico até a curva voltar a ele. Média e pior caso dos drawdowns do período.",
+    "recuperacao_dd": "Operações, em média, do fundo do drawdown até voltar ao pico (só drawdowns já recuperados).",
+    "drawdown_atual": "Distância atual até o pico da curva. Zero = você está no topo.",
     "pts_gain": "Média de pontos capturados nos trades positivos. Mostra sua eficiência técnica nos gains.",
     "stop_medio": "Média de pontos perdidos nos trades negativos. É a base para calcular seu risco real.",
     "lote_medio": "Quantidade média de contratos operados por operação.",
@@ -36,54 +48,6 @@ TOOLTIPS = {
     "sugestao_lote": "Faixa de contratos recomendada para operar, baseada no seu buffer e risco calculado."
 }
 
-def get_supabase():
-    try:
-        if "supabase" in st.session_state: return st.session_state["supabase"]
-        else:
-            url = st.secrets["SUPABASE_URL"]
-            key = st.secrets["SUPABASE_KEY"]
-            return create_client(url, key)
-    except: return None
-
-def load_trades_db():
-    try:
-        sb = get_supabase()
-        res = sb.table("trades").select("*").execute()
-        df = pd.DataFrame(res.data)
-        if not df.empty:
-            df['data'] = pd.to_datetime(df['data']).dt.date
-            df['created_at'] = pd.to_datetime(df['created_at'])
-            if 'grupo_vinculo' not in df.columns: df['grupo_vinculo'] = 'Geral'
-            
-            cols_float = ['resultado', 'lote', 'pts_medio']
-            for c in cols_float:
-                if c in df.columns:
-                    df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0.0)
-        return df
-    except: return pd.DataFrame()
-
-def load_contas_config(user):
-    try:
-        sb = get_supabase()
-        res = sb.table("contas_config").select("*").eq("usuario", user).execute()
-        df = pd.DataFrame(res.data)
-        if not df.empty:
-            if 'pico_previo' not in df.columns: df['pico_previo'] = df['saldo_inicial']
-            if 'status_conta' not in df.columns: df['status_conta'] = 'Ativa'
-            df['saldo_inicial'] = df['saldo_inicial'].astype(float)
-            df['pico_previo'] = df['pico_previo'].astype(float)
-        return df
-    except: return pd.DataFrame()
-
-def load_metas_config(user):
-    """Carrega configuracao de metas por grupo"""
-    try:
-        sb = get_supabase()
-        res = sb.table("metas_config").select("*").eq("usuario", user).execute()
-        return {m['grupo_nome']: m for m in res.data} if res.data else {}
-    except:
-        return {}
-
 def get_meta_grupo(user, grupo_nome, metas_dict):
     """Retorna meta do grupo ou default 500"""
     if grupo_nome in metas_dict:
@@ -110,45 +74,75 @@ def get_semana_atual():
     
     return inicio_semana, fim_semana
 
-def calcular_resultado_semana(df_trades, grupo_nome, inicio_semana, fim_semana):
-    """Calcula resultado da semana para um grupo"""
-    if df_trades.empty:
-        return 0.0
-    
-    df_grupo = df_trades[df_trades['grupo_vinculo'] == grupo_nome]
-    if df_grupo.empty:
-        return 0.0
-    
-    df_semana = df_grupo[(df_grupo['data'] >= inicio_semana) & (df_grupo['data'] <= fim_semana)]
-    
-    if df_semana.empty:
-        return 0.0
-    
-    # Busca numero de contas ATIVAS do grupo
-    try:
-        sb = get_supabase()
-        contas = sb.table("contas_config").select("id").eq("grupo_nome", grupo_nome).eq("status_conta", "Ativa").execute()
-        n_contas = len(contas.data) if contas.data else 1
-    except:
-        n_contas = 1
-    n_contas = max(1, n_contas)
+def contar_contas_ativas(df_contas):
+    """Mapa {grupo: nº de contas ativas} a partir das contas já carregadas"""
+    if df_contas.empty:
+        return {}
+    return df_contas[df_contas['status_conta'] == 'Ativa'].groupby('grupo_nome').size().to_dict()
+
+def calcular_resultados_semana(rollup, inicio_semana, fim_semana, contas_ativas):
+    """
+    Calcula o resultado da semana de todos os grupos a partir do rollup diário.
     
-    # Separa trades com e sem conta_id
-    if 'conta_id' in df_semana.columns:
-        trades_novos = df_semana[df_semana['conta_id'].notna()]
-        trades_antigos = df_semana[df_semana['conta_id'].isna()]
-    else:
-        trades_novos = pd.DataFrame()
-        trades_antigos = df_semana
+    Trades com conta_id são divididos pelo número de contas ativas do grupo
+    (cada conta tem seu registro); trades antigos sem conta_id já valem 1 conta.
     
-    # Trades NOVOS: soma e divide por numero de contas (cada conta tem seu registro)
-    soma_novos = trades_novos['resultado'].sum() if not trades_novos.empty else 0
-    media_novos = soma_novos / n_contas
+    Args:
+        rollup: DailyRollup dos trades do usuário
+        inicio_semana, fim_semana: Limites da semana (inclusivos)
+        contas_ativas: dict {grupo: nº de contas ativas}
     
-    # Trades ANTIGOS: ja sao o valor de 1 conta, soma direto
-    soma_antigos = trades_antigos['resultado'].sum() if not trades_antigos.empty else 0
+    Returns:
+        dict: {grupo: resultado da semana}
+    """
+    por_conta = rollup.resumo(inicio_semana, fim_semana, por=("grupo_vinculo", "conta_id"))
+    if por_conta.empty:
+        return {}
     
-    return media_novos + soma_antigos
+    tem_conta = por_conta.index.get_level_values("conta_id") != SEM_CONTA
+    somas = por_conta['resultado'].groupby([por_conta.index.get_level_values("grupo_vinculo"), pd.Index(tem_conta, name="por_conta")]).sum().unstack(fill_value=0.0)
+    
+    n_contas = pd.Series([max(1, contas_ativas.get(g, 1)) for g in somas.index], index=somas.index)
+    resultado = somas.get(True, 0.0) / n_contas + somas.get(False, 0.0)
+    return {g: float(v) for g, v in resultado.items()}
+
+def status_metas_semanais(user, rollup=None, df_contas=None, grupos=None):
+    """
+    Status da meta semanal de todos os grupos do usuário de uma vez.
+    
+    Sem rollup, usa o do cache de trades da sessão; se a sessão ainda não
+    carregou trades, busca só os da semana (uma consulta para todos os grupos).
+    Sem df_contas, usa as contas em cache da sessão.
+    
+    Returns:
+        dict: {grupo: {batida, resultado, meta, bloquear, faltam, progresso}}
+    """
+    inicio, fim = get_semana_atual()
+    if rollup is None:
+        rollup = rollup_trades(user)
+    if rollup is None:
+        rollup = DailyRollup.build(query_trades(user, d_inicio=inicio, d_fim=fim, colunas=COLUNAS_TRADES_META))
+    if df_contas is None:
+        df_contas = load_contas(user)
+    metas = load_metas(user)
+    
+    resultados = calcular_resultados_semana(rollup, inicio, fim, contar_contas_ativas(df_contas))
+    if grupos is None:
+        grupos = set(resultados) | set(metas) | (set(df_contas['grupo_nome']) if not df_contas.empty else set())
+    
+    status = {}
+    for grupo in grupos:
+        resultado = resultados.get(grupo, 0.0)
+        meta = get_meta_grupo(user, grupo, metas)
+        status[grupo] = {
+            "batida": resultado >= meta,
+            "resultado": resultado,
+            "meta": meta,
+            "bloquear": metas.get(grupo, {}).get('bloquear_ao_bater', False),
+            "faltam": max(0, meta - resultado),
+            "progresso": min(100, (resultado / meta * 100)) if meta > 0 else 0
+        }
+    return status
 
 def salvar_meta_grupo(user, grupo_nome, meta_valor, bloquear):
     """Salva configuracao de meta para um grupo"""
@@ -160,37 +154,20 @@ def salvar_meta_grupo(user, grupo_nome, meta_valor, bloquear):
         "bloquear_ao_bater": bloquear
     }
     sb.table("metas_config").upsert(dados).execute()
+    registrar_escrita("metas_config", user=user)
 
 def verificar_meta_batida(user, grupo_nome):
     """Verifica se a meta semanal do grupo foi batida - usado pelo trade.py"""
     try:
-        df_trades = load_trades_db()
-        if not df_trades.empty:
-            df_trades = df_trades[df_trades['usuario'] == user]
-        
-        metas = load_metas_config(user)
-        meta = get_meta_grupo(user, grupo_nome, metas)
-        
-        inicio, fim = get_semana_atual()
-        resultado = calcular_resultado_semana(df_trades, grupo_nome, inicio, fim)
-        
-        bloquear = metas.get(grupo_nome, {}).get('bloquear_ao_bater', False)
-        
-        return {
-            "batida": resultado >= meta,
-            "resultado": resultado,
-            "meta": meta,
-            "bloquear": bloquear,
-            "faltam": max(0, meta - resultado)
-        }
+        return status_metas_semanais(user, grupos=[grupo_nome])[grupo_nome]
     except:
         return {"batida": False, "resultado": 0, "meta": 500, "bloquear": False, "faltam": 500}
 
-def render_metas_semanais(user, df_trades, grupos_lista):
+def render_metas_semanais(user, rollup, df_contas, grupos_lista):
     """Renderiza a secao de metas semanais"""
     
     inicio_semana, fim_semana = get_semana_atual()
-    metas_dict = load_metas_config(user)
+    metas_dict = load_metas(user)
     
     # CSS para os cards de meta
     st.markdown("""
@@ -304,23 +281,9 @@ def render_metas_semanais(user, df_trades, grupos_lista):
         st.info("Nenhum grupo configurado ainda.")
         return
     
-    # Calcula dados de cada grupo
-    dados_grupos = []
-    for grupo in grupos_validos:
-        resultado = calcular_resultado_semana(df_trades, grupo, inicio_semana, fim_semana)
-        meta = get_meta_grupo(user, grupo, metas_dict)
-        batida = resultado >= meta
-        progresso = min(100, (resultado / meta * 100)) if meta > 0 else 0
-        faltam = max(0, meta - resultado)
-        
-        dados_grupos.append({
-            "grupo": grupo,
-            "resultado": resultado,
-            "meta": meta,
-            "batida": batida,
-            "progresso": progresso,
-            "faltam": faltam
-        })
+    # Calcula dados de todos os grupos numa passada só
+    status = status_metas_semanais(user, rollup, df_contas, grupos_validos)
+    dados_grupos = [{"grupo": grupo, **status[grupo]} for grupo in grupos_validos]
     
     # Renderiza cards
     cols = st.columns(len(dados_grupos))
@@ -429,29 +392,35 @@ def card_simples(label, value, sub_text, tooltip_text, color="white", border_col
     st.markdown(html, unsafe_allow_html=True)
 
 def show(user, role):
-    df_trades_all = load_trades_db()
-    df_contas_all = load_contas_config(user)
-    
-    if not df_trades_all.empty:
-        df_trades_all = df_trades_all[df_trades_all['usuario'] == user]
+    cron = Cronometro("dashboard")
+    
+    # Leituras independentes saem juntas; metas ficam no cache para render_metas_semanais
+    dados = carregar_em_paralelo({
+        "trades": lambda: load_trades(user, COLUNAS_TRADES_DASHBOARD),
+        "contas": lambda: load_contas(user),
+        "metas": lambda: load_metas(user),
+    })
+    df_trades_all = dados["trades"]
+    df_contas_all = dados["contas"]
+    rollup = rollup_trades(user, COLUNAS_TRADES_DASHBOARD)
+    cron.marca("carga")
 
     # --- SECAO DE METAS SEMANAIS ---
     grupos_disponiveis = ["Todos"]
     if not df_contas_all.empty:
         grupos_disponiveis += sorted(list(df_contas_all['grupo_nome'].unique()))
     
-    render_metas_semanais(user, df_trades_all, grupos_disponiveis)
+    render_metas_semanais(user, rollup, df_contas_all, grupos_disponiveis)
+    cron.marca("metas")
     
     # --- VISAO DO OPERACIONAL ---
     st.markdown("### 🔭 Visão do Operacional")
     
     c_sel1, c_sel2, c_date1, c_date2 = st.columns([1.5, 1.5, 1, 1])
     with c_sel1: grupo_sel = st.selectbox("📂 Grupo", grupos_disponiveis)
+    grupo_filtro = grupo_sel if grupo_sel != "Todos" else None
     
-    contas_do_grupo = pd.DataFrame()
-    if not df_contas_all.empty:
-        contas_do_grupo = df_contas_all[df_contas_all['grupo_nome'] == grupo_sel] if grupo_sel != "Todos" else df_contas_all
-            
+    contas_do_grupo = DashboardMetrics.contas_do_grupo(df_contas_all, grupo_filtro)
     lista_contas_view = ["📊 VISÃO GERAL (Agregado)"] + sorted(list(contas_do_grupo['conta_identificador'].unique())) if not contas_do_grupo.empty else ["📊 VISÃO GERAL (Agregado)"]
     with c_sel2: view_mode = st.selectbox("🔎 Detalhe", lista_contas_view)
     with c_date1: d_inicio = st.date_input("De", datetime.now().date() - timedelta(days=30))
@@ -459,138 +428,23 @@ def show(user, role):
 
     st.markdown("---")
 
-    trades_filtered_view = pd.DataFrame()
-    trades_full_risk = pd.DataFrame()
-
-    if not df_trades_all.empty:
-        base_df = df_trades_all[df_trades_all['grupo_vinculo'] == grupo_sel] if grupo_sel != "Todos" else df_trades_all.copy()
-        trades_full_risk = base_df.copy()
-        if 'data' in base_df.columns:
-            trades_filtered_view = base_df[(base_df['data'] >= d_inicio) & (base_df['data'] <= d_fim)]
-    
-    contas_alvo = contas_do_grupo if "VISÃO GERAL" in view_mode else contas_do_grupo[contas_do_grupo['conta_identificador'] == view_mode]
-
-    # Função para calcular lucro real por conta
-    def calcular_lucro_conta(conta_id, grupo_nome, df_trades):
-        """Cada conta tem seus próprios trades (não há mais trades replicados com conta_id NULL)"""
-        lucro_total = 0.0
-        if not df_trades.empty and 'conta_id' in df_trades.columns:
-            trades_conta = df_trades[df_trades['conta_id'] == conta_id]
-            lucro_total = trades_conta['resultado'].sum()
-        return lucro_total
-
-    total_buffer = 0.0; contas_ativas = 0; hwm_updated_flag = False
-    if not contas_alvo.empty:
-        for _, conta in contas_alvo.iterrows():
-            if conta['status_conta'] == 'Ativa':
-                lucro_conta = calcular_lucro_conta(conta['id'], conta['grupo_nome'], trades_full_risk)
-                saldo_atual_est = float(conta['saldo_inicial']) + lucro_conta
-                hwm_dinamico = max(float(conta['pico_previo']), saldo_atual_est)
-                if hwm_dinamico > float(conta['pico_previo']):
-                    update_hwm(conta['id'], hwm_dinamico); hwm_updated_flag = True
-                saude = ApexEngine.calculate_health(saldo_atual_est, hwm_dinamico, conta.get('fase_entrada', 'Fase 1'))
-                total_buffer += saude['buffer']; contas_ativas += 1
-    
-    if hwm_updated_flag: st.toast("🚀 Novo Topo Histórico Salvo!", icon="💾")
-
-    results_list_filtered = trades_filtered_view['resultado'].tolist() if not trades_filtered_view.empty else []
-
-    # Inicialização segura
-    net_profit = 0.0
-    gross_profit = 0.0
-    gross_loss = 0.0
-    pf = 0.0
-    win_rate = 0.0
-    total_trades = 0
-    avg_win = 0.0
-    avg_loss = 0.0
-    payoff = 0.0
-    expectancy = 0.0
-    avg_pts_gain = 0.0
-    pts_loss_medio_real = 15.0
-    lote_medio = 0.0
-    max_dd = 0.0
-    wins = pd.DataFrame()
-    losses = pd.DataFrame()
-    operacoes = pd.DataFrame()
-    ativo_ref = "MNQ"
-    total_operacoes = 0
-
-    if not trades_filtered_view.empty:
-        # RESULTADO LIQUIDO: soma de TODAS as contas (valor real ganho/perdido)
-        net_profit = trades_filtered_view['resultado'].sum()
-        
-        # Para contar OPERACOES (nao registros), agrupa por operacao_id ou cria chave unica
-        df_temp = trades_filtered_view.copy()
-        
-        def criar_chave_operacao(row):
-            # Se tem operacao_id, usa direto
-            if 'operacao_id' in row.index and pd.notna(row.get('operacao_id')):
-                return str(row['operacao_id'])
-            
-            # Para trades antigos, agrupa por data+ativo+resultado+grupo+minuto
-            created = row.get('created_at', '')
-            if pd.notna(created):
-                minuto = str(created)[:16]  # Trunca para o minuto
-            else:
-                minuto = str(row.get('data', ''))
-            
-            return f"{row['data']}_{row['ativo']}_{row['resultado']}_{row.get('grupo_vinculo', '')}_{minuto}"
-        
-        df_temp['op_key'] = df_temp.apply(criar_chave_operacao, axis=1)
-        
-        # Agrupa por operacao (pega primeiro registro de cada grupo)
-        operacoes = df_temp.groupby('op_key').first().reset_index()
-        
-        # Metricas baseadas em OPERACOES (nao registros)
-        wins_op = operacoes[operacoes['resultado'] > 0]
-        losses_op = operacoes[operacoes['resultado'] < 0]
-        total_operacoes = len(operacoes)
-        
-        # Gross profit/loss por operacao (valor de UMA conta, nao agregado)
-        gross_profit = wins_op['resultado'].sum()
-        gross_loss = abs(losses_op['resultado'].sum())
-        pf = gross_profit / gross_loss if gross_loss > 0 else 99.99
-        
-        total_trades = total_operacoes  # Card mostra operacoes, nao registros
-        win_rate = (len(wins_op) / total_operacoes * 100) if total_operacoes > 0 else 0
-        avg_win = wins_op['resultado'].mean() if not wins_op.empty else 0.0
-        avg_loss = abs(losses_op['resultado'].mean()) if not losses_op.empty else 0.0
-        payoff = avg_win / avg_loss if avg_loss > 0 else 0.0
-        expectancy = ((win_rate/100) * avg_win) - ((1 - (win_rate/100)) * avg_loss)
-        avg_pts_gain = wins_op['pts_medio'].mean() if not wins_op.empty else 0.0 
-        avg_pts_loss = abs(losses_op['pts_medio'].mean()) if not losses_op.empty else 0.0
-        
-        # Guarda wins/losses para uso posterior
-        wins = wins_op
-        losses = losses_op
-        
-        if avg_pts_loss > 0:
-            pts_loss_medio_real = avg_pts_loss
-            
-        lote_medio = operacoes['lote'].mean()
-        if 'ativo' in operacoes.columns:
-            ativo_ref = operacoes['ativo'].iloc[-1]
-            
-        # Drawdown baseado em operacoes
-        equity = operacoes.sort_values('created_at')['resultado'].cumsum()
-        max_dd = (equity - equity.cummax()).min()
-
-    custo_stop_padrao = pts_loss_medio_real * (lote_medio if lote_medio > 0 else 1) * MULTIPLIERS.get(ativo_ref, 2)
-    vidas_u = RiskEngine.calculate_lives(total_buffer, custo_stop_padrao, contas_ativas)
-    
-    # Para prob ruina, usa lista de resultados por OPERACAO
-    results_list_ops = operacoes['resultado'].tolist() if not operacoes.empty else []
-    prob_ruina = RiskEngine.calculate_ruin(win_rate, avg_win, avg_loss, total_buffer, trades_results=results_list_ops)
-    
-    loss_rate_dec = (len(losses)/total_trades) if total_trades > 0 else 0
-    edge_calc = ((win_rate/100) * payoff) - loss_rate_dec
+    # Todo o cálculo sai de modules.metrics; daqui para baixo a tela só desenha.
+    # Índice e rollup vêm do cache (período e grupo por busca binária, sem refiltrar o histórico)
+    resultado = DashboardMetrics.compute(
+        df_trades_all, df_contas_all, d_inicio, d_fim, grupo=grupo_filtro,
+        conta=None if "VISÃO GERAL" in view_mode else view_mode,
+        indice=indice_pnl(user, df_trades_all), rollup=rollup,
+    )
     
-    # Buffer por conta (para calculo de lote em operacoes replicadas)
-    buffer_por_conta = total_buffer / contas_ativas if contas_ativas > 0 else 5000  # Default $5k trailing
-    
-    # Calcula lote baseado no buffer de UMA conta (nao agregado)
-    lote_min, lote_max, kelly_pct = PositionSizing.calculate_limits(win_rate, payoff, buffer_por_conta, custo_stop_padrao)
+    # Todos os topos novos vão num único upsert, em segundo plano
+    n_topos = salvar_hwms(user, df_contas_all, resultado['novos_picos'])
+    if n_topos: st.toast(f"🚀 Novo Topo Histórico em {n_topos} conta(s), enviando...", icon="💾")
+    for falha in get_falhas_hwm(): st.warning(f"⚠️ Topo histórico não foi salvo ({falha}). Será reenviado na próxima atualização.")
+    cron.marca("metricas")
+
+    desempenho, medias, tecnica = resultado['desempenho'], resultado['medias'], resultado['tecnica']
+    sobrevivencia, lote, series = resultado['sobrevivencia'], resultado['lote'], resultado['series']
+    contas_ativas = resultado['contas']['ativas']
 
     # ============================================================
     # RENDERIZAÇÃO COM TOOLTIPS
@@ -598,45 +452,46 @@ def show(user, role):
     
     st.markdown("### 🏁 Desempenho Geral")
     c1, c2, c3, c4 = st.columns(4)
+    net_profit, total_trades = desempenho['net_profit'], desempenho['total_operacoes']  # Card mostra operacoes, nao registros
     with c1: 
         sub_resultado = f"{total_trades} ops × {contas_ativas} contas" if contas_ativas > 1 else f"{total_trades} operações"
         card_simples("Resultado Líquido", f"${net_profit:,.2f}", sub_resultado, 
                      TOOLTIPS["resultado_liquido"], "#00FF88" if net_profit>=0 else "#FF4B4B")
     with c2: 
-        card_simples("Fator de Lucro (PF)", f"{pf:.2f}", "Ideal > 1.5", 
-                     TOOLTIPS["fator_lucro"], "#FF4B4B" if pf < 1.5 else "#00FF88")
+        card_simples("Fator de Lucro (PF)", f"{desempenho['pf']:.2f}", "Ideal > 1.5", 
+                     TOOLTIPS["fator_lucro"], "#FF4B4B" if desempenho['pf'] < 1.5 else "#00FF88")
     with c3: 
-        card_simples("Win Rate", f"{win_rate:.1f}%", f"{len(wins)}W / {len(losses)}L", 
+        card_simples("Win Rate", f"{desempenho['win_rate']:.1f}%", f"{desempenho['n_wins']}W / {desempenho['n_losses']}L", 
                      TOOLTIPS["win_rate"], "white")
     with c4: 
-        card_simples("Expectativa Mat.", f"${expectancy:.2f}", "Por Operação", 
-                     TOOLTIPS["expectativa"], "#00FF88" if expectancy>0 else "#FF4B4B")
+        card_simples("Expectativa Mat.", f"${desempenho['expectancy']:.2f}", "Por Operação", 
+                     TOOLTIPS["expectativa"], "#00FF88" if desempenho['expectancy']>0 else "#FF4B4B")
 
     st.markdown("### 💲 Médias Financeiras")
     m1, m2, m3, m4 = st.columns(4)
     with m1: 
-        card_simples("Média Gain ($)", f"${avg_win:,.2f}", "", 
+        card_simples("Média Gain ($)", f"${medias['avg_win']:,.2f}", "", 
                      TOOLTIPS["media_gain"], "#00FF88")
     with m2: 
-        card_simples("Média Loss ($)", f"-${avg_loss:,.2f}", "", 
+        card_simples("Média Loss ($)", f"-${medias['avg_loss']:,.2f}", "", 
                      TOOLTIPS["media_loss"], "#FF4B4B")
     with m3: 
-        card_simples("Risco : Retorno", f"1 : {payoff:.2f}", "Payoff Real", 
+        card_simples("Risco : Retorno", f"1 : {medias['payoff']:.2f}", "Payoff Real", 
                      TOOLTIPS["payoff"], "white")
     with m4: 
-        card_simples("Drawdown Máximo", f"${max_dd:,.2f}", "Pior Queda", 
+        card_simples("Drawdown Máximo", f"${medias['max_dd']:,.2f}", "Pior Queda", 
                      TOOLTIPS["drawdown"], "#FF4B4B")
     
     st.markdown("### 🎯 Performance Técnica")
     t1, t2, t3, t4 = st.columns(4)
     with t1: 
-        card_simples("Pts Médios (Gain)", f"{avg_pts_gain:.2f} pts", "", 
+        card_simples("Pts Médios (Gain)", f"{tecnica['avg_pts_gain']:.2f} pts", "", 
                      TOOLTIPS["pts_gain"], "#00FF88")
     with t2: 
-        card_simples("Stop Médio (Real)", f"{pts_loss_medio_real:.2f} pts", "Base do Risco", 
+        card_simples("Stop Médio (Real)", f"{tecnica['avg_pts_loss']:.2f} pts", "Base do Risco", 
                      TOOLTIPS["stop_medio"], "#FF4B4B")
     with t3: 
-        card_simples("Lote Médio", f"{lote_medio:.1f}", "Contratos", 
+        card_simples("Lote Médio", f"{tecnica['lote_medio']:.1f}", "Contratos", 
                      TOOLTIPS["lote_medio"], "white")
     with t4: 
         card_simples("Total Trades", f"{total_trades}", "Executados", 
@@ -647,8 +502,8 @@ def show(user, role):
     st.markdown(f"### 🛡️ Análise de Sobrevivência ({view_mode})")
     k1, k2, k3, k4 = st.columns(4)
     
-    num_trades_risco = len(results_list_filtered)
-    z_serial = RiskEngine.calculate_z_score_serial(results_list_filtered)
+    num_trades_risco = sobrevivencia['n_registros']
+    z_serial, edge_calc = sobrevivencia['z_serial'], sobrevivencia['edge']
     
     if num_trades_risco < 15:
         cor_zs = "#888888"; val_zs = "---"; sub_zs = "Mín. 15 trades"
@@ -672,11 +527,13 @@ def show(user, role):
         card_simples("Z-Score (Edge)", val_ze, sub_ze, 
                      TOOLTIPS["z_score_edge"], cor_ze, border_color=cor_ze)
     
+    vidas_u = sobrevivencia['vidas']
     cor_v = "#FF4B4B" if vidas_u < 10 else ("#FFFF00" if vidas_u < 20 else "#00FF88")
     with k3: 
-        card_simples("Vidas Reais (U)", f"{vidas_u:.1f}", f"Risco: ${custo_stop_padrao:,.0f}", 
+        card_simples("Vidas Reais (U)", f"{vidas_u:.1f}", f"Risco: ${sobrevivencia['custo_stop']:,.0f}", 
                      TOOLTIPS["vidas"], cor_v)
     
+    prob_ruina = sobrevivencia['prob_ruina']
     cor_r = "#00FF88" if prob_ruina < 1 else ("#FF4B4B" if prob_ruina > 5 else "#FFFF00")
     with k4: 
         card_simples("Prob. Ruína", f"{prob_ruina:.4f}%", "Risco de Quebra", 
@@ -686,62 +543,56 @@ def show(user, role):
     l1, l2, l3, l4 = st.columns(4)
     
     with l1:
+        buffer_por_conta = lote['buffer_por_conta']
         if buffer_por_conta > 2500: cor_buf_lote = "#00FF88"
         elif buffer_por_conta > 1000: cor_buf_lote = "#FFFF00"
         else: cor_buf_lote = "#FF4B4B"
-        card_simples("Buffer/Conta", f"${buffer_por_conta:,.0f}", f"Total: ${total_buffer:,.0f}", 
+        card_simples("Buffer/Conta", f"${buffer_por_conta:,.0f}", f"Total: ${lote['total_buffer']:,.0f}", 
                      TOOLTIPS["buffer"], cor_buf_lote, border_color=cor_buf_lote)
 
     with l2: 
-        card_simples("Half-Kelly", f"{kelly_pct*100:.1f}%", "Aproveitamento", 
+        card_simples("Half-Kelly", f"{lote['kelly_pct']*100:.1f}%", "Aproveitamento", 
                      TOOLTIPS["half_kelly"], "#888")
     with l3: 
-        card_simples("Risco Financeiro", f"${buffer_por_conta * kelly_pct:,.0f}", "Por Conta", 
+        card_simples("Risco Financeiro", f"${lote['risco_financeiro']:,.0f}", "Por Conta", 
                      TOOLTIPS["risco_financeiro"], "#00FF88")
     with l4: 
-        card_simples("Sugestão de Lote", f"{lote_min} a {lote_max} ctrs", "ZONA SEGURA", 
+        card_simples("Sugestão de Lote", f"{lote['lote_min']} a {lote['lote_max']} ctrs", "ZONA SEGURA", 
                      TOOLTIPS["sugestao_lote"], "#00FF88", border_color="#00FF88")
 
+    cron.marca("cards")
+
     # --- GRÁFICOS ---
     st.markdown("---")
     st.markdown("### 📈 Evolução do Lucro")
     
     g1, g2 = st.columns([2.5, 1])
+    curva, lucro_inicial, operacoes = series['curva'], series['lucro_inicial'], series['operacoes']
     
     with g1:
-        if not trades_filtered_view.empty:
-            trades_plot = trades_filtered_view.sort_values('created_at').copy()
+        if not curva.empty:
+            view_type = st.radio("Visualizar Curva por:", ["Sequência de Operações", "Data (Tempo)"], horizontal=True, label_visibility="collapsed")
             
-            # Calcula lucro inicial (saldo_inicial - 150k de cada conta)
-            BASE_CONTA = 150000
-            if not contas_alvo.empty:
-                lucro_inicial = (contas_alvo['saldo_inicial'] - BASE_CONTA).sum()
+            if view_type == "Sequência de Operações":
+                x_axis = curva['seq']; x_title = "Quantidade de Operações"
             else:
-                lucro_inicial = 0.0
-            
-            # Lucro acumulado = lucro inicial + soma dos trades
-            trades_plot['lucro_acumulado'] = trades_plot['resultado'].cumsum() + lucro_inicial
-            
-            view_type = st.radio("Visualizar Curva por:", ["Sequência de Trades", "Data (Tempo)"], horizontal=True, label_visibility="collapsed")
-            
-            if view_type == "Sequência de Trades":
-                trades_plot['seq'] = range(1, len(trades_plot) + 1)
-                x_axis = trades_plot['seq']; x_title = "Quantidade de Trades"
-            else:
-                x_axis = trades_plot['created_at']; x_title = "Data / Hora"
+                x_axis = curva['created_at']; x_title = "Data / Hora"
+
+            # Só os pontos que mudam o desenho (extremos e pior queda sempre entram)
+            pos = CurveDownsampler.curva(curva['lucro_acumulado'], x_axis, GRAFICO_PONTOS, GRAFICO_LIMIAR)
 
             fig = go.Figure()
             fig.add_trace(go.Scatter(
-                x=x_axis, y=trades_plot['lucro_acumulado'],
+                x=x_axis.iloc[pos], y=curva['lucro_acumulado'].iloc[pos],
                 mode='lines', name='Lucro Total',
                 line=dict(color='#00FF88', width=2),
                 fill='tozeroy', fillcolor='rgba(0, 255, 136, 0.1)',
-                hovertemplate='Trade %{x}<br>Lucro: $%{y:,.2f}<extra></extra>'
+                hovertemplate='Operação %{x}<br>Lucro: $%{y:,.2f}<extra></extra>'
             ))
             fig.add_hline(y=lucro_inicial, line_dash="dash", line_color="gray", annotation_text="Lucro Inicial")
             fig.add_hline(y=0, line_dash="dot", line_color="#FF4B4B", annotation_text="Break-even")
             
-            y_vals = trades_plot['lucro_acumulado']
+            y_vals = curva['lucro_acumulado']
             min_y = min(y_vals.min(), lucro_inicial, 0); max_y = max(y_vals.max(), lucro_inicial)
             diff = max_y - min_y; padding = max(500.0, diff * 0.15)
 
@@ -755,38 +606,110 @@ def show(user, role):
                 margin=dict(l=10, r=10, t=40, b=10)
             )
             st.plotly_chart(fig, use_container_width=True)
+            
+            # Métricas móveis nas últimas N operações (mesmo eixo da curva)
+            janela = st.select_slider("Janela (operações)", options=[10, 20, 50, 100, 200], value=20)
+            if len(operacoes) >= janela:
+                moveis = RollingMetrics.compute(operacoes['resultado'].to_numpy(), janela)
+                x_ops = pd.Series(range(1, len(operacoes) + 1)) if view_type == "Sequência de Operações" else operacoes['created_at'].reset_index(drop=True)
+                
+                fig_mov = make_subplots(rows=5, cols=1, shared_xaxes=True, vertical_spacing=0.03,
+                                        subplot_titles=("Fator de Lucro", "Win Rate (%)", "Expectativa ($)", "Payoff", "Z-Score"))
+                linhas_mov = [('pf', '#00FF88', 1.5), ('win_rate', 'white', 50), ('expectancy', '#00FF88', 0),
+                              ('payoff', 'white', 1), ('z_score', '#FFFF00', -1.96)]
+                for linha, (coluna, cor, ref) in enumerate(linhas_mov, start=1):
+                    # Cada série reduzida à parte (as lacunas de NaN continuam interrompidas)
+                    pos_mov = CurveDownsampler.serie(moveis[coluna], x_ops, GRAFICO_PONTOS, GRAFICO_LIMIAR)
+                    fig_mov.add_trace(go.Scatter(x=x_ops.iloc[pos_mov], y=moveis[coluna].iloc[pos_mov], mode='lines', name=coluna,
+                                                 line=dict(color=cor, width=1.5)), row=linha, col=1)
+                    fig_mov.add_hline(y=ref, line_dash="dot", line_color="gray", row=linha, col=1)
+                fig_mov.update_layout(
+                    title=f"Métricas Móveis (últimas {janela} operações)",
+                    template="plotly_dark", showlegend=False, height=650,
+                    margin=dict(l=10, r=10, t=60, b=10)
+                )
+                st.plotly_chart(fig_mov, use_container_width=True)
+            else:
+                st.caption(f"Métricas móveis: mínimo de {janela} operações no período ({len(operacoes)} até agora).")
         else:
             st.info("Sem dados para exibir gráfico.")
             
     with g2:
-        if not trades_filtered_view.empty:
+        ctx_perf = series['contexto']
+        if ctx_perf is not None:
             st.write(""); st.write("") 
-            if 'contexto' in trades_filtered_view.columns:
-                 ctx_perf = trades_filtered_view.groupby('contexto')['resultado'].sum().reset_index()
-                 colors = ['#00FF88' if x >= 0 else '#FF4B4B' for x in ctx_perf['resultado']]
-                 fig_pie = go.Figure(data=[go.Pie(
-                    labels=ctx_perf['contexto'], 
-                    values=abs(ctx_perf['resultado']),
-                    hole=.5, textinfo='label+percent',
-                    marker=dict(colors=colors, line=dict(color='#161616', width=3))
-                 )])
-                 fig_pie.update_layout(title="Resultado por Contexto", template="plotly_dark", showlegend=False)
-                 st.plotly_chart(fig_pie, use_container_width=True)
+            colors = ['#00FF88' if x >= 0 else '#FF4B4B' for x in ctx_perf['resultado']]
+            fig_pie = go.Figure(data=[go.Pie(
+               labels=ctx_perf['contexto'], 
+               values=abs(ctx_perf['resultado']),
+               hole=.5, textinfo='label+percent',
+               marker=dict(colors=colors, line=dict(color='#161616', width=3))
+            )])
+            fig_pie.update_layout(title="Resultado por Contexto", template="plotly_dark", showlegend=False)
+            st.plotly_chart(fig_pie, use_container_width=True)
+
+    # --- DRAWDOWNS (curva submersa das operações) ---
+    dd = series['drawdowns']
+    if dd is not None:
+        st.markdown("### 🌊 Drawdowns")
+        dd_stats = dd['stats']
+        d1, d2, d3, d4 = st.columns(4)
+        with d1:
+            cor_atual = "#00FF88" if dd_stats['drawdown_atual'] == 0 else "#FF4B4B"
+            card_simples("Drawdown Atual", f"${dd_stats['drawdown_atual']:,.2f}", "Aberto" if dd_stats['aberto'] else "No topo",
+                         TOOLTIPS["drawdown_atual"], cor_atual)
+        with d2:
+            card_simples("Tempo Submerso", f"{dd_stats['tempo_submerso_pct']:.1f}%", f"{dd_stats['n_episodios']} drawdowns",
+                         TOOLTIPS["tempo_submerso"], "white")
+        with d3:
+            card_simples("Duração Média", f"{dd_stats['duracao_media_trades']:.1f} ops",
+                         f"Pior: {dd_stats['duracao_max_trades']} ops · {dd_stats['duracao_max_dias']:.1f} dias",
+                         TOOLTIPS["duracao_dd"], "white")
+        with d4:
+            card_simples("Recuperação Média", f"{dd_stats['recuperacao_media_trades']:.1f} ops", "Fundo → Pico",
+                         TOOLTIPS["recuperacao_dd"], "white")
+        
+        u1, u2 = st.columns([2.5, 1])
+        with u1:
+            pos_uw = CurveDownsampler.curva(dd['underwater'], operacoes['created_at'], GRAFICO_PONTOS, GRAFICO_LIMIAR)
+            fig_uw = go.Figure(go.Scatter(
+                x=operacoes['created_at'].iloc[pos_uw], y=np.asarray(dd['underwater'])[pos_uw], mode='lines', name='Drawdown',
+                line=dict(color='#FF4B4B', width=1.5), fill='tozeroy', fillcolor='rgba(255, 75, 75, 0.15)',
+                hovertemplate='%{x}<br>Drawdown: $%{y:,.2f}<extra></extra>'
+            ))
+            fig_uw.update_layout(title="Curva Submersa (abaixo do pico)", template="plotly_dark",
+                                 yaxis=dict(tickformat="$,.0f"), height=300, margin=dict(l=10, r=10, t=40, b=10))
+            st.plotly_chart(fig_uw, use_container_width=True)
+        with u2:
+            piores = dd['episodios'].nsmallest(10, 'profundidade')
+            if not piores.empty:
+                momentos = operacoes['created_at'].reset_index(drop=True)
+                tabela = pd.DataFrame({
+                    'Início': momentos.iloc[piores['inicio']].dt.strftime('%d/%m/%y').to_numpy(),
+                    'Queda': piores['profundidade'].map(lambda v: f"${v:,.0f}").to_numpy(),
+                    'Ops': piores['duracao_trades'].to_numpy(),
+                    'Dias': piores['duracao_dias'].round(1).to_numpy(),
+                    'Status': np.where(piores['aberto'], "Aberto", "Recuperado"),
+                })
+                st.markdown("**Piores Drawdowns**")
+                st.dataframe(tabela, hide_index=True, use_container_width=True)
 
     st.markdown("### 📅 Performance Temporal")
-    if not trades_filtered_view.empty:
+    # Séries do rollup diário (grupo, conta, dia), não dos trades crus
+    daily_perf = series['diario']
+    if not daily_perf.empty:
         t1, t2 = st.columns(2)
         with t1:
-            daily_perf = trades_filtered_view.groupby('data')['resultado'].sum().reset_index()
-            fig_daily = px.bar(daily_perf, x='data', y='resultado', title="Resultado Diário (Timeline)", template="plotly_dark", color='resultado', color_continuous_scale=["#FF4B4B", "#00FF88"])
-            fig_daily.update_layout(showlegend=False, xaxis_title="Data", yaxis_title="Resultado ($)")
+            escala = st.radio("Timeline por:", ["Dia", "Semana"], horizontal=True, label_visibility="collapsed")
+            if escala == "Dia":
+                fig_daily = px.bar(daily_perf, x='data', y='resultado', title="Resultado Diário (Timeline)", template="plotly_dark", color='resultado', color_continuous_scale=["#FF4B4B", "#00FF88"])
+                fig_daily.update_layout(showlegend=False, xaxis_title="Data", yaxis_title="Resultado ($)")
+            else:
+                fig_daily = px.bar(series['semanal'], x='semana', y='resultado', title="Resultado Semanal (Dom-Sex)", template="plotly_dark", color='resultado', color_continuous_scale=["#FF4B4B", "#00FF88"])
+                fig_daily.update_layout(showlegend=False, xaxis_title="Semana", yaxis_title="Resultado ($)")
             st.plotly_chart(fig_daily, use_container_width=True)
         with t2:
-            trades_filtered_view['dia_semana'] = pd.to_datetime(trades_filtered_view['data']).dt.day_name()
-            dias_pt = {'Monday': 'Seg', 'Tuesday': 'Ter', 'Wednesday': 'Qua', 'Thursday': 'Qui', 'Friday': 'Sex', 'Saturday': 'Sab', 'Sunday': 'Dom'}
-            trades_filtered_view['dia_pt'] = trades_filtered_view['dia_semana'].map(dias_pt)
-            week_order = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sab', 'Dom']
-            week_perf = trades_filtered_view.groupby('dia_pt')['resultado'].sum().reindex(week_order).reset_index()
-            fig_week = px.bar(week_perf, x='dia_pt', y='resultado', title="Dia da Semana (Estatístico)", template="plotly_dark", color='resultado', color_continuous_scale=["#FF4B4B", "#00FF88"])
+            fig_week = px.bar(series['dia_semana'], x='dia_pt', y='resultado', title="Dia da Semana (Estatístico)", template="plotly_dark", color='resultado', color_continuous_scale=["#FF4B4B", "#00FF88"])
             fig_week.update_layout(showlegend=False, xaxis_title="Dia", yaxis_title="Resultado ($)")
             st.plotly_chart(fig_week, use_container_width=True)
+    cron.marca("graficos")
@@ -1,39 +1,16 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
 import pandas as pd
-from supabase import create_client
 import time
 import json
 
-# --- 1. CONEXAO ---
-MULTIPLIERS = {"NQ": 20, "MNQ": 2, "ES": 50, "MES": 5}
-
-def get_supabase():
-    try:
-        if "supabase" in st.session_state: return st.session_state["supabase"]
-        else:
-            url = st.secrets["SUPABASE_URL"]
-            key = st.secrets["SUPABASE_KEY"]
-            return create_client(url, key)
-    except: return None
+from modules.database import (get_supabase, query_trades, load_trades, load_contas, registrar_escrita,
+                              cache_trades_remover, cache_trades_atualizar)
+from modules.logic import OperationGrouping
+from modules.perf import Cronometro
 
-def load_trades_db():
-    try:
-        sb = get_supabase()
-        res = sb.table("trades").select("*").execute()
-        df = pd.DataFrame(res.data)
-        if not df.empty:
-            df['data'] = pd.to_datetime(df['data']).dt.date
-            df['created_at'] = pd.to_datetime(df['created_at'])
-            if 'grupo_vinculo' not in df.columns: df['grupo_vinculo'] = 'Geral'
-            
-            cols_num = ['resultado', 'lote', 'pts_medio', 'risco_fin', 'stop_pts']
-            for c in cols_num:
-                if c in df.columns:
-                    df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0.0)
-                    
-        return df
-    except: return pd.DataFrame()
+# --- 1. CONSTANTES ---
+MULTIPLIERS = {"NQ": 20, "MNQ": 2, "ES": 50, "MES": 5}
 
 # --- 2. POP-UP DE DETALHES ---
 @st.dialog("Detalhes da Operacao", width="large")
@@ -220,6 +197,8 @@ def show_trade_details(row, user, role):
             if st.button("Salvar Observacoes", use_container_width=True):
                 sb = get_supabase()
                 sb.table("trades").update({"observacoes": nova_obs}).eq("id", row['id']).execute()
+                cache_trades_atualizar(user, {"observacoes": nova_obs}, valor=row['id'])
+                registrar_escrita("trades", user=user)
                 st.toast("Observacoes salvas!")
                 st.rerun()
     
@@ -244,6 +223,8 @@ def show_trade_details(row, user, role):
         
         # Deleta o trade
         sb.table("trades").delete().eq("id", row['id']).execute()
+        cache_trades_remover(usuario_do_trade, [row['id']])
+        registrar_escrita("trades", user=usuario_do_trade)
         
         # Recalcula HWM do grupo afetado
         if grupo_do_trade:
@@ -263,10 +244,10 @@ def recalcular_hwm_grupo(sb, usuario, grupo_nome):
             return
         
         # Busca todos os trades do grupo
-        trades = sb.table("trades").select("resultado, grupo_vinculo").eq("usuario", usuario).eq("grupo_vinculo", grupo_nome).execute()
+        trades = query_trades(usuario, grupo=grupo_nome, colunas="resultado, grupo_vinculo")
         
         # Calcula lucro total do grupo
-        lucro_total = sum([t['resultado'] for t in trades.data]) if trades.data else 0
+        lucro_total = float(trades['resultado'].sum()) if not trades.empty else 0
         
         # Atualiza HWM de cada conta
         for conta in contas.data:
@@ -280,6 +261,8 @@ def recalcular_hwm_grupo(sb, usuario, grupo_nome):
                 "hwm": novo_hwm,
                 "pico_previo": novo_hwm
             }).eq("id", conta['id']).execute()
+        
+        registrar_escrita("contas_config", user=usuario)
             
     except Exception as e:
         print(f"Erro ao recalcular HWM: {e}")
@@ -361,14 +344,13 @@ def show(user, role):
     """, unsafe_allow_html=True)
 
     st.title("Galeria de Trades")
+    cron = Cronometro("historico")
     
-    dfh = load_trades_db()
-    if not dfh.empty: dfh = dfh[dfh['usuario'] == user]
+    dfh = load_trades(user)
     
     # Carrega contas para filtro
-    sb = get_supabase()
-    contas_res = sb.table("contas_config").select("id, conta_identificador, grupo_nome").eq("usuario", user).execute()
-    df_contas = pd.DataFrame(contas_res.data) if contas_res.data else pd.DataFrame()
+    df_contas = load_contas(user)
+    cron.marca("carga")
     
     # --- VERIFICA FILTRO VINDO DO PLANO ---
     filtro_contexto_externo = st.session_state.pop("filtro_contexto_historico", None)
@@ -432,37 +414,17 @@ def show(user, role):
         
         # MODO: Por Operacao (agrupa trades da mesma operacao)
         if modo_view == "Por Operacao":
-            # Agrupa por operacao_id (ou por data+ativo+resultado+minuto para trades antigos)
-            def criar_chave_operacao(row):
-                # Se tem operacao_id, usa direto
-                if 'operacao_id' in row and pd.notna(row.get('operacao_id')):
-                    return str(row['operacao_id'])
-                
-                # Para trades antigos, agrupa por data+ativo+resultado+grupo+minuto
-                # Isso assume que trades replicados foram criados no mesmo minuto
-                created = row.get('created_at', '')
-                if pd.notna(created):
-                    # Trunca para o minuto (remove segundos e milissegundos)
-                    minuto = str(created)[:16]  # "2026-01-09 14:30"
-                else:
-                    minuto = str(row.get('data', ''))
-                
-                return f"{row['data']}_{row['ativo']}_{row['resultado']}_{row['grupo_vinculo']}_{minuto}"
-            
-            dfh['grupo_key'] = dfh.apply(criar_chave_operacao, axis=1)
-            
-            # Agrupa e pega info
-            operacoes = []
-            for key, grupo in dfh.groupby('grupo_key'):
-                primeiro = grupo.iloc[0]
-                operacoes.append({
-                    **primeiro.to_dict(),
-                    'n_contas': len(grupo),
-                    'contas_list': grupo['conta_id'].tolist()
-                })
+            # Agrupa por operacao_id (ou por data+ativo+resultado+minuto para trades antigos que
+            # ainda não passaram pelo tools/backfill_operacao_id.py)
+            dfh['grupo_key'] = OperationGrouping.build_keys(dfh)
             
-            df_operacoes = pd.DataFrame(operacoes)
-            df_operacoes = df_operacoes.sort_values('created_at', ascending=False)
+            # Agrupa e pega info (nth(0) em vez de first() para não pular nulos do primeiro registro)
+            g = dfh.groupby('grupo_key', sort=False)
+            df_operacoes = g.nth(0).set_index('grupo_key')
+            df_operacoes['n_contas'] = g.size()
+            df_operacoes['contas_list'] = g['conta_id'].agg(list)
+            df_operacoes = df_operacoes.reset_index().sort_values('created_at', ascending=False)
+            cron.marca("metricas")
             
             st.markdown(f"**Exibindo {len(df_operacoes)} operacoes**")
             st.markdown("---")
@@ -566,5 +528,6 @@ def show(user, role):
                     
                     if st.button("Detalhes", key=f"btn_{row['id']}", use_container_width=True):
                         show_trade_details(row, user, role)
+        cron.marca("cards")
     else:
         st.info("Nenhuma operacao registrada ainda.")
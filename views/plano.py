@@ -1,15 +1,8 @@
 import streamlit as st
 import json
 import uuid
-from supabase import create_client
 
-# --- CONEXÃO ---
-def get_supabase():
-    if "supabase" in st.session_state:
-        return st.session_state["supabase"]
-    url = st.secrets["SUPABASE_URL"]
-    key = st.secrets["SUPABASE_KEY"]
-    return create_client(url, key)
+from modules.database import get_supabase
 
 # --- CRUD DO PLANO ---
 def load_plano(user):
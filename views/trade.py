@@ -1,37 +1,13 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-from supabase import create_client
 import uuid
 import time
 import json
 
-# --- 1. CONFIGURAÇÕES E CONEXÃO ---
-MULTIPLIERS = {"NQ": 20, "MNQ": 2, "ES": 50, "MES": 5}
-
-def get_supabase():
-    try:
-        if "supabase" in st.session_state: return st.session_state["supabase"]
-        else:
-            url = st.secrets["SUPABASE_URL"]
-            key = st.secrets["SUPABASE_KEY"]
-            return create_client(url, key)
-    except: return None
-
-def load_atms():
-    sb = get_supabase()
-    res = sb.table("atm_configs").select("*").execute()
-    return {item['nome']: item for item in res.data}
+from modules.database import get_supabase, load_atms, load_grupos, load_contas, inserir_trades, iniciar_uploads, concluir_uploads, descartar_uploads, registrar_escrita
 
-def load_grupos(user):
-    sb = get_supabase()
-    res = sb.table("grupos_config").select("*").eq("usuario", user).execute()
-    return pd.DataFrame(res.data)
-
-def load_contas(user):
-    sb = get_supabase()
-    res = sb.table("contas_config").select("*").eq("usuario", user).execute()
-    return pd.DataFrame(res.data)
+# --- 1. CONFIGURAÇÕES ---
+MULTIPLIERS = {"NQ": 20, "MNQ": 2, "ES": 50, "MES": 5}
 
 # --- 2. TELA DE REGISTRO ---
 def show(user, role):
@@ -304,14 +280,9 @@ def show(user, role):
         
         with st.spinner("Gravando..."):
             try:
-                # Salva todos os prints como JSON array
-                lista_prints = []
-                if up:
-                    for arquivo in up:
-                        file_name = f"{uuid.uuid4()}.png"
-                        sb.storage.from_("prints").upload(file_name, arquivo.getvalue())
-                        url = sb.storage.from_("prints").get_public_url(file_name)
-                        lista_prints.append(url)
+                # Prints sobem em paralelo enquanto o trade é gravado (URLs já são conhecidas)
+                conteudos = [arquivo.getvalue() for arquivo in up] if up else []
+                lista_prints, uploads = iniciar_uploads(conteudos)
                 
                 # Se tiver prints, salva como JSON, senao string vazia
                 prints_json = json.dumps(lista_prints) if lista_prints else ""
@@ -331,10 +302,10 @@ def show(user, role):
                 # ID unico para esta operacao (agrupa trades replicados)
                 operacao_id = str(uuid.uuid4())
                 
-                # Cria um trade para CADA conta
-                trades_criados = 0
+                # Monta um trade para CADA conta e grava tudo em um único INSERT
+                linhas_trades = []
                 for conta in lista_contas:
-                    trade_data = {
+                    linhas_trades.append({
                         "id": str(uuid.uuid4()),
                         "usuario": user,
                         "data": str(dt),
@@ -352,10 +323,22 @@ def show(user, role):
                         "parciais": saidas,
                         "conta_id": conta['id'],
                         "operacao_id": operacao_id
-                    }
-                    
-                    sb.table("trades").insert(trade_data).execute()
-                    trades_criados += 1
+                    })
+                
+                try:
+                    tempo_envio = inserir_trades(linhas_trades)
+                except Exception:
+                    # Trade não gravou: os prints que já subiram ficariam órfãos no bucket
+                    descartar_uploads(uploads)
+                    raise
+                trades_criados = len(linhas_trades)
+                
+                # Espera os uploads; print que não subiu sai do registro
+                prints_ok = concluir_uploads(lista_prints, uploads)
+                if len(prints_ok) < len(lista_prints):
+                    sb.table("trades").update({"prints": json.dumps(prints_ok) if prints_ok else ""}).eq("operacao_id", operacao_id).execute()
+                    registrar_escrita("trades", user=user)
+                    st.warning(f"⚠️ {len(lista_prints) - len(prints_ok)} print(s) não subiram e foram retirados do registro.")
                 
                 # Integração Anti-Tilt
                 if antitilt_ativo:
@@ -372,9 +355,9 @@ def show(user, role):
                 tipo_msg = "Stop" if btn_stop else "Gain"
                 
                 if trades_criados > 1:
-                    st.toast(f"{tipo_msg} registrado em {trades_criados} contas! ${total_trade:,.2f} cada", icon="✅")
+                    st.toast(f"{tipo_msg} registrado em {trades_criados} contas! ${total_trade:,.2f} cada ({tempo_envio:,.0f} ms)", icon="✅")
                 else:
-                    st.toast(f"{tipo_msg} registrado! ${total_trade:,.2f}", icon="✅")
+                    st.toast(f"{tipo_msg} registrado! ${total_trade:,.2f} ({tempo_envio:,.0f} ms)", icon="✅")
                 
                 time.sleep(1.5)
                 st.rerun()